@@ -0,0 +1,532 @@
+/*
+ * _rijndael: CPython extension module wrapping the keyed context, bulk mode
+ * and GHASH entry points of rijndael.c.
+ *
+ * Context(key, engine=None) mirrors aes.NativeContext without ctypes: data
+ * is taken from any buffer-protocol object (bytes, bytearray, memoryview,
+ * mmap, ...), results are written into a caller-supplied writable buffer or
+ * a new bytearray, and the GIL is released for the duration of every bulk
+ * call so one process can run a thread per core.
+ *
+ * Build with `make extension`.
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+
+#include <string.h>
+
+#include "rijndael.h"
+
+static const char *engine_names[] = {"bytewise", "ttable", "bitsliced", "aesni"};
+#define N_ENGINES 4
+
+/*
+ * Context objects. `busy` counts bulk calls running without the GIL; a
+ * close() during one of them only marks the context as closed, and the
+ * last call to finish frees it.
+ */
+typedef struct {
+  PyObject_HEAD
+  aes_context *ctx;
+  int busy;
+  int closed;
+} ContextObject;
+
+static int engine_from_name(PyObject *name) {
+  const char *text = PyUnicode_AsUTF8(name);
+  if (!text) return -1;
+  for (int i = 0; i < N_ENGINES; i++) {
+    if (strcmp(text, engine_names[i]) == 0) return i;
+  }
+  PyErr_Format(PyExc_ValueError, "Unknown native engine %R", name);
+  return -1;
+}
+
+static int set_engine(aes_context *ctx, PyObject *name) {
+  int code = engine_from_name(name);
+  if (code < 0) return -1;
+  if (aes_context_set_engine(ctx, code) < 0) {
+    PyErr_Format(PyExc_ValueError, "Native engine %R is not supported on this CPU", name);
+    return -1;
+  }
+  return 0;
+}
+
+static int context_check(ContextObject *self) {
+  if (!self->ctx || self->closed) {
+    PyErr_SetString(PyExc_ValueError, "Context is closed.");
+    return -1;
+  }
+  return 0;
+}
+
+static void context_release(ContextObject *self) {
+  if (--self->busy == 0 && self->closed && self->ctx) {
+    aes_context_free(self->ctx);
+    self->ctx = NULL;
+  }
+}
+
+static int Context_init(ContextObject *self, PyObject *args, PyObject *kwargs) {
+  static char *keywords[] = {"key", "engine", NULL};
+  Py_buffer key;
+  PyObject *engine = Py_None;
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "y*|O", keywords, &key, &engine)) return -1;
+  if (self->busy) {
+    /* Another thread is running a bulk call on the current context. */
+    PyBuffer_Release(&key);
+    PyErr_SetString(PyExc_RuntimeError, "Context is in use and cannot be re-initialized.");
+    return -1;
+  }
+  if (self->ctx) {
+    aes_context_free(self->ctx);
+    self->ctx = NULL;
+  }
+  self->ctx = aes_context_new((const unsigned char *)key.buf, (size_t)key.len);
+  Py_ssize_t key_size = key.len;
+  PyBuffer_Release(&key);
+  if (!self->ctx) {
+    PyErr_Format(PyExc_ValueError, "Unsupported key size: %zd", key_size);
+    return -1;
+  }
+  self->closed = 0;
+
+  if (engine != Py_None) {
+    if (set_engine(self->ctx, engine) < 0) return -1;
+  }
+  return 0;
+}
+
+static void Context_dealloc(ContextObject *self) {
+  if (self->ctx) aes_context_free(self->ctx);
+  Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+static PyObject *Context_get_engine(ContextObject *self, void *closure) {
+  if (context_check(self) < 0) return NULL;
+  int code = aes_context_get_engine(self->ctx);
+  if (code < 0 || code >= N_ENGINES) return PyLong_FromLong(code);
+  return PyUnicode_FromString(engine_names[code]);
+}
+
+static int Context_set_engine(ContextObject *self, PyObject *value, void *closure) {
+  if (!value) {
+    PyErr_SetString(PyExc_AttributeError, "Cannot delete the engine.");
+    return -1;
+  }
+  if (context_check(self) < 0) return -1;
+  return set_engine(self->ctx, value);
+}
+
+typedef void (*block_function)(const aes_context *, const unsigned char *, unsigned char *);
+
+static PyObject *crypt_block(ContextObject *self, PyObject *arg, block_function function) {
+  Py_buffer block;
+  if (context_check(self) < 0) return NULL;
+  if (PyObject_GetBuffer(arg, &block, PyBUF_SIMPLE) < 0) return NULL;
+  if (block.len != BLOCK_SIZE) {
+    PyBuffer_Release(&block);
+    PyErr_SetString(PyExc_ValueError, "Blocks must be 16 bytes long.");
+    return NULL;
+  }
+  PyObject *result = PyBytes_FromStringAndSize(NULL, BLOCK_SIZE);
+  if (result) function(self->ctx, (const unsigned char *)block.buf, (unsigned char *)PyBytes_AS_STRING(result));
+  PyBuffer_Release(&block);
+  return result;
+}
+
+static PyObject *Context_encrypt_block(ContextObject *self, PyObject *arg) {
+  return crypt_block(self, arg, aes_context_encrypt_block);
+}
+
+static PyObject *Context_decrypt_block(ContextObject *self, PyObject *arg) {
+  return crypt_block(self, arg, aes_context_decrypt_block);
+}
+
+/*
+ * Gets the input and output buffers of a bulk call. `out` may be None, in
+ * which case a new bytearray of the input's length is created. On success
+ * `*result` holds a new reference to the output object.
+ */
+static int bulk_buffers(PyObject *data, PyObject *out, Py_buffer *in_view, Py_buffer *out_view, PyObject **result) {
+  if (PyObject_GetBuffer(data, in_view, PyBUF_SIMPLE) < 0) return -1;
+  if (out == Py_None) {
+    *result = PyByteArray_FromStringAndSize(NULL, in_view->len);
+  } else {
+    Py_INCREF(out);
+    *result = out;
+  }
+  if (!*result || PyObject_GetBuffer(*result, out_view, PyBUF_WRITABLE) < 0) {
+    Py_XDECREF(*result);
+    PyBuffer_Release(in_view);
+    return -1;
+  }
+  if (out_view->len < in_view->len) {
+    PyErr_SetString(PyExc_ValueError, "Output buffer is too small.");
+    PyBuffer_Release(out_view);
+    PyBuffer_Release(in_view);
+    Py_DECREF(*result);
+    return -1;
+  }
+  return 0;
+}
+
+static void bulk_release(Py_buffer *in_view, Py_buffer *out_view) {
+  PyBuffer_Release(out_view);
+  PyBuffer_Release(in_view);
+}
+
+typedef void (*ecb_function)(const aes_context *, const unsigned char *, unsigned char *, size_t);
+
+static PyObject *crypt_ecb(ContextObject *self, PyObject *args, PyObject *kwargs, ecb_function function) {
+  static char *keywords[] = {"data", "out", NULL};
+  PyObject *data, *out = Py_None, *result;
+  Py_buffer in_view, out_view;
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|O", keywords, &data, &out)) return NULL;
+  if (context_check(self) < 0) return NULL;
+  if (bulk_buffers(data, out, &in_view, &out_view, &result) < 0) return NULL;
+  if (in_view.len % BLOCK_SIZE) {
+    bulk_release(&in_view, &out_view);
+    Py_DECREF(result);
+    PyErr_SetString(PyExc_ValueError, "Bulk input must be made of full 16-byte blocks.");
+    return NULL;
+  }
+
+  self->busy++;
+  Py_BEGIN_ALLOW_THREADS
+  function(self->ctx, (const unsigned char *)in_view.buf, (unsigned char *)out_view.buf, (size_t)in_view.len / BLOCK_SIZE);
+  Py_END_ALLOW_THREADS
+  context_release(self);
+  bulk_release(&in_view, &out_view);
+  return result;
+}
+
+static PyObject *Context_encrypt_ecb(ContextObject *self, PyObject *args, PyObject *kwargs) {
+  return crypt_ecb(self, args, kwargs, aes_ecb_encrypt);
+}
+
+static PyObject *Context_decrypt_ecb(ContextObject *self, PyObject *args, PyObject *kwargs) {
+  return crypt_ecb(self, args, kwargs, aes_ecb_decrypt);
+}
+
+typedef void (*chained_function)(const aes_context *, unsigned char *, const unsigned char *, unsigned char *, size_t);
+
+/*
+ * CBC and CTR: `chaining` is the IV or counter block, copied so the
+ * caller's value is left untouched. CTR also accepts a trailing partial
+ * block, encrypted with one extra keystream block.
+ */
+static PyObject *crypt_chained(ContextObject *self, PyObject *args, PyObject *kwargs, chained_function function, int partial) {
+  static char *keywords[] = {"data", "iv", "out", NULL};
+  PyObject *data, *out = Py_None, *result;
+  Py_buffer chaining, in_view, out_view;
+  unsigned char block[BLOCK_SIZE];
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "Oy*|O", keywords, &data, &chaining, &out)) return NULL;
+  if (chaining.len != BLOCK_SIZE) {
+    PyBuffer_Release(&chaining);
+    PyErr_SetString(PyExc_ValueError, "IV/counter must be 16 bytes long.");
+    return NULL;
+  }
+  memcpy(block, chaining.buf, BLOCK_SIZE);
+  PyBuffer_Release(&chaining);
+  if (context_check(self) < 0) return NULL;
+  if (bulk_buffers(data, out, &in_view, &out_view, &result) < 0) return NULL;
+  if (!partial && in_view.len % BLOCK_SIZE) {
+    bulk_release(&in_view, &out_view);
+    Py_DECREF(result);
+    PyErr_SetString(PyExc_ValueError, "Bulk input must be made of full 16-byte blocks.");
+    return NULL;
+  }
+
+  const unsigned char *in = (const unsigned char *)in_view.buf;
+  unsigned char *dest = (unsigned char *)out_view.buf;
+  size_t full = (size_t)in_view.len / BLOCK_SIZE;
+  size_t rest = (size_t)in_view.len % BLOCK_SIZE;
+
+  self->busy++;
+  Py_BEGIN_ALLOW_THREADS
+  function(self->ctx, block, in, dest, full);
+  if (rest) {
+    unsigned char keystream[BLOCK_SIZE];
+    aes_context_encrypt_block(self->ctx, block, keystream);
+    for (size_t i = 0; i < rest; i++) {
+      dest[full * BLOCK_SIZE + i] = in[full * BLOCK_SIZE + i] ^ keystream[i];
+    }
+  }
+  Py_END_ALLOW_THREADS
+  context_release(self);
+  bulk_release(&in_view, &out_view);
+  return result;
+}
+
+static PyObject *Context_encrypt_cbc(ContextObject *self, PyObject *args, PyObject *kwargs) {
+  return crypt_chained(self, args, kwargs, aes_cbc_encrypt, 0);
+}
+
+static PyObject *Context_decrypt_cbc(ContextObject *self, PyObject *args, PyObject *kwargs) {
+  return crypt_chained(self, args, kwargs, aes_cbc_decrypt, 0);
+}
+
+static PyObject *Context_crypt_ctr(ContextObject *self, PyObject *args, PyObject *kwargs) {
+  return crypt_chained(self, args, kwargs, aes_ctr_crypt, 1);
+}
+
+static PyObject *Context_close(ContextObject *self, PyObject *unused) {
+  self->closed = 1;
+  if (self->busy == 0 && self->ctx) {
+    aes_context_free(self->ctx);
+    self->ctx = NULL;
+  }
+  Py_RETURN_NONE;
+}
+
+static PyObject *Context_enter(ContextObject *self, PyObject *unused) {
+  Py_INCREF(self);
+  return (PyObject *)self;
+}
+
+static PyObject *Context_exit(ContextObject *self, PyObject *args) {
+  return Context_close(self, NULL);
+}
+
+static PyMethodDef Context_methods[] = {
+  {"encrypt_block", (PyCFunction)Context_encrypt_block, METH_O, "Encrypts one 16-byte block."},
+  {"decrypt_block", (PyCFunction)Context_decrypt_block, METH_O, "Decrypts one 16-byte block."},
+  {"encrypt_ecb", (PyCFunction)(void (*)(void))Context_encrypt_ecb, METH_VARARGS | METH_KEYWORDS,
+   "encrypt_ecb(data, out=None): ECB encryption of whole blocks into out, which is returned."},
+  {"decrypt_ecb", (PyCFunction)(void (*)(void))Context_decrypt_ecb, METH_VARARGS | METH_KEYWORDS,
+   "decrypt_ecb(data, out=None): ECB decryption of whole blocks into out, which is returned."},
+  {"encrypt_cbc", (PyCFunction)(void (*)(void))Context_encrypt_cbc, METH_VARARGS | METH_KEYWORDS,
+   "encrypt_cbc(data, iv, out=None): raw CBC encryption (no padding) of whole blocks."},
+  {"decrypt_cbc", (PyCFunction)(void (*)(void))Context_decrypt_cbc, METH_VARARGS | METH_KEYWORDS,
+   "decrypt_cbc(data, iv, out=None): raw CBC decryption (no unpadding) of whole blocks."},
+  {"crypt_ctr", (PyCFunction)(void (*)(void))Context_crypt_ctr, METH_VARARGS | METH_KEYWORDS,
+   "crypt_ctr(data, counter, out=None): CTR with a 128-bit big-endian counter."},
+  {"close", (PyCFunction)Context_close, METH_NOARGS, "Wipes and frees the key schedule."},
+  {"__enter__", (PyCFunction)Context_enter, METH_NOARGS, NULL},
+  {"__exit__", (PyCFunction)Context_exit, METH_VARARGS, NULL},
+  {NULL, NULL, 0, NULL}
+};
+
+static PyGetSetDef Context_getset[] = {
+  {"engine", (getter)Context_get_engine, (setter)Context_set_engine, "Name of the C round engine.", NULL},
+  {NULL, NULL, NULL, NULL, NULL}
+};
+
+static PyTypeObject ContextType = {
+  PyVarObject_HEAD_INIT(NULL, 0)
+  .tp_name = "_rijndael.Context",
+  .tp_doc = "Context(key, engine=None): keyed AES context from rijndael.c.",
+  .tp_basicsize = sizeof(ContextObject),
+  .tp_flags = Py_TPFLAGS_DEFAULT,
+  .tp_new = PyType_GenericNew,
+  .tp_init = (initproc)Context_init,
+  .tp_dealloc = (destructor)Context_dealloc,
+  .tp_methods = Context_methods,
+  .tp_getset = Context_getset,
+};
+
+/* GHash objects: the running hash value `y` under a precomputed key. */
+typedef struct {
+  PyObject_HEAD
+  ghash_context *ctx;
+  unsigned char y[BLOCK_SIZE];
+  int busy;
+} GHashObject;
+
+/* `y` is updated without the GIL, so one update() may run at a time. */
+static int ghash_check(GHashObject *self) {
+  if (!self->ctx) {
+    PyErr_SetString(PyExc_ValueError, "GHash is not initialized.");
+    return -1;
+  }
+  if (self->busy) {
+    PyErr_SetString(PyExc_RuntimeError, "GHash is in use by another thread.");
+    return -1;
+  }
+  return 0;
+}
+
+static int GHash_init(GHashObject *self, PyObject *args, PyObject *kwargs) {
+  static char *keywords[] = {"h", NULL};
+  Py_buffer h;
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "y*", keywords, &h)) return -1;
+  if (h.len != BLOCK_SIZE) {
+    PyBuffer_Release(&h);
+    PyErr_SetString(PyExc_ValueError, "The hash key must be 16 bytes long.");
+    return -1;
+  }
+  if (self->busy) {
+    PyBuffer_Release(&h);
+    PyErr_SetString(PyExc_RuntimeError, "GHash is in use by another thread.");
+    return -1;
+  }
+  if (self->ctx) ghash_context_free(self->ctx);
+  self->ctx = ghash_context_new((const unsigned char *)h.buf);
+  PyBuffer_Release(&h);
+  if (!self->ctx) {
+    PyErr_NoMemory();
+    return -1;
+  }
+  memset(self->y, 0, BLOCK_SIZE);
+  return 0;
+}
+
+static void GHash_dealloc(GHashObject *self) {
+  if (self->ctx) ghash_context_free(self->ctx);
+  Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+static PyObject *GHash_update(GHashObject *self, PyObject *arg) {
+  Py_buffer data;
+  if (ghash_check(self) < 0) return NULL;
+  if (PyObject_GetBuffer(arg, &data, PyBUF_SIMPLE) < 0) return NULL;
+
+  size_t full = (size_t)data.len / BLOCK_SIZE;
+  size_t rest = (size_t)data.len % BLOCK_SIZE;
+  self->busy = 1;
+  Py_BEGIN_ALLOW_THREADS
+  ghash_update(self->ctx, self->y, (const unsigned char *)data.buf, full);
+  if (rest) {
+    unsigned char last[BLOCK_SIZE] = {0};
+    memcpy(last, (const unsigned char *)data.buf + full * BLOCK_SIZE, rest);
+    ghash_update(self->ctx, self->y, last, 1);
+  }
+  Py_END_ALLOW_THREADS
+  self->busy = 0;
+  PyBuffer_Release(&data);
+  Py_RETURN_NONE;
+}
+
+static PyObject *GHash_digest(GHashObject *self, PyObject *unused) {
+  if (ghash_check(self) < 0) return NULL;
+  return PyBytes_FromStringAndSize((const char *)self->y, BLOCK_SIZE);
+}
+
+static PyMethodDef GHash_methods[] = {
+  {"update", (PyCFunction)GHash_update, METH_O, "Absorbs data, zero-padded to a whole number of blocks."},
+  {"digest", (PyCFunction)GHash_digest, METH_NOARGS, "Returns the current 16-byte hash value."},
+  {NULL, NULL, 0, NULL}
+};
+
+static PyTypeObject GHashType = {
+  PyVarObject_HEAD_INIT(NULL, 0)
+  .tp_name = "_rijndael.GHash",
+  .tp_doc = "GHash(h): GCM's GHASH keyed by the 16-byte hash key h.",
+  .tp_basicsize = sizeof(GHashObject),
+  .tp_flags = Py_TPFLAGS_DEFAULT,
+  .tp_new = PyType_GenericNew,
+  .tp_init = (initproc)GHash_init,
+  .tp_dealloc = (destructor)GHash_dealloc,
+  .tp_methods = GHash_methods,
+};
+
+/*
+ * encrypt_cbc_multi(contexts, ivs, buffer, bounds, pcbc=False): encrypts
+ * buffer[bounds[i]:bounds[i + 1]] in place under contexts[i], chained from
+ * ivs[16 * i:16 * (i + 1)] (replaced by the final chaining value), for
+ * every i, in one multi-buffer call with the GIL released.
+ */
+static PyObject *encrypt_cbc_multi(PyObject *module, PyObject *args, PyObject *kwargs) {
+  static char *keywords[] = {"contexts", "ivs", "buffer", "bounds", "pcbc", NULL};
+  PyObject *contexts, *bounds, *result = NULL;
+  PyObject *context_seq = NULL, *bound_seq = NULL;
+  Py_buffer ivs, buffer;
+  int pcbc = 0;
+  aes_cbc_job *jobs = NULL;
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "Ow*w*O|p", keywords, &contexts, &ivs, &buffer, &bounds, &pcbc)) return NULL;
+  context_seq = PySequence_Fast(contexts, "contexts must be a sequence");
+  bound_seq = context_seq ? PySequence_Fast(bounds, "bounds must be a sequence") : NULL;
+  if (!bound_seq) goto done;
+
+  Py_ssize_t n_jobs = PySequence_Fast_GET_SIZE(context_seq);
+  if (PySequence_Fast_GET_SIZE(bound_seq) != n_jobs + 1 || ivs.len < n_jobs * BLOCK_SIZE) {
+    PyErr_SetString(PyExc_ValueError, "Expected one IV per context and one more bound than contexts.");
+    goto done;
+  }
+  jobs = PyMem_New(aes_cbc_job, n_jobs > 0 ? n_jobs : 1);
+  if (!jobs) {
+    PyErr_NoMemory();
+    goto done;
+  }
+
+  Py_ssize_t start = PyLong_AsSsize_t(PySequence_Fast_GET_ITEM(bound_seq, 0));
+  for (Py_ssize_t i = 0; i < n_jobs; i++) {
+    PyObject *item = PySequence_Fast_GET_ITEM(context_seq, i);
+    Py_ssize_t end = PyLong_AsSsize_t(PySequence_Fast_GET_ITEM(bound_seq, i + 1));
+    if (PyErr_Occurred()) goto done;
+    if (!PyObject_TypeCheck(item, &ContextType)) {
+      PyErr_SetString(PyExc_TypeError, "contexts must be _rijndael.Context objects");
+      goto done;
+    }
+    if (context_check((ContextObject *)item) < 0) goto done;
+    if (start < 0 || end < start || end > buffer.len || (end - start) % BLOCK_SIZE) {
+      PyErr_SetString(PyExc_ValueError, "Invalid bounds: spans must be whole blocks inside the buffer.");
+      goto done;
+    }
+    jobs[i].ctx = ((ContextObject *)item)->ctx;
+    jobs[i].iv = (unsigned char *)ivs.buf + i * BLOCK_SIZE;
+    jobs[i].in = (const unsigned char *)buffer.buf + start;
+    jobs[i].out = (unsigned char *)buffer.buf + start;
+    jobs[i].n_blocks = (size_t)(end - start) / BLOCK_SIZE;
+    start = end;
+  }
+
+  for (Py_ssize_t i = 0; i < n_jobs; i++) ((ContextObject *)PySequence_Fast_GET_ITEM(context_seq, i))->busy++;
+  Py_BEGIN_ALLOW_THREADS
+  aes_cbc_encrypt_multi(jobs, (size_t)n_jobs, pcbc);
+  Py_END_ALLOW_THREADS
+  for (Py_ssize_t i = 0; i < n_jobs; i++) context_release((ContextObject *)PySequence_Fast_GET_ITEM(context_seq, i));
+  result = Py_None;
+  Py_INCREF(result);
+
+done:
+  PyMem_Free(jobs);
+  Py_XDECREF(bound_seq);
+  Py_XDECREF(context_seq);
+  PyBuffer_Release(&buffer);
+  PyBuffer_Release(&ivs);
+  return result;
+}
+
+static PyObject *cpu_has_aesni(PyObject *module, PyObject *unused) {
+  return PyBool_FromLong(aes_cpu_has_aesni());
+}
+
+static PyMethodDef module_methods[] = {
+  {"cpu_has_aesni", cpu_has_aesni, METH_NOARGS, "Whether new contexts run on the AES-NI engine."},
+  {"encrypt_cbc_multi", (PyCFunction)(void (*)(void))encrypt_cbc_multi, METH_VARARGS | METH_KEYWORDS,
+   "encrypt_cbc_multi(contexts, ivs, buffer, bounds, pcbc=False): multi-buffer CBC/PCBC encryption in place."},
+  {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef rijndael_module = {
+  PyModuleDef_HEAD_INIT,
+  .m_name = "_rijndael",
+  .m_doc = "AES contexts and GHASH from rijndael.c, releasing the GIL during bulk calls.",
+  .m_size = -1,
+  .m_methods = module_methods,
+};
+
+PyMODINIT_FUNC PyInit__rijndael(void) {
+  if (PyType_Ready(&ContextType) < 0 || PyType_Ready(&GHashType) < 0) return NULL;
+
+  PyObject *module = PyModule_Create(&rijndael_module);
+  if (!module) return NULL;
+  Py_INCREF(&ContextType);
+  Py_INCREF(&GHashType);
+  if (PyModule_AddObject(module, "Context", (PyObject *)&ContextType) < 0 ||
+      PyModule_AddObject(module, "GHash", (PyObject *)&GHashType) < 0) {
+    Py_DECREF(&ContextType);
+    Py_DECREF(&GHashType);
+    Py_DECREF(module);
+    return NULL;
+  }
+  return module;
+}
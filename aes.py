@@ -131,8 +131,14 @@ def matrix2bytes(matrix):
     return bytes(sum(matrix, []))
 
 def xor_bytes(a, b):
-    """ Returns a new byte array with the elements xor'ed. """
-    return bytes(i^j for i, j in zip(a, b))
+    """
+    Returns a new byte array with the elements xor'ed, truncated to the
+    shorter input. Whole buffers are XORed at once as big integers.
+    """
+    n = min(len(a), len(b))
+    a = int.from_bytes(a[:n] if len(a) > n else a, 'big')
+    b = int.from_bytes(b[:n] if len(b) > n else b, 'big')
+    return (a ^ b).to_bytes(n, 'big')
 
 def inc_bytes(a):
     """ Returns a new byte array with the value increment by 1 """
@@ -160,17 +166,1036 @@ def unpad(plaintext):
     Removes a PKCS#7 padding, returning the unpadded text and ensuring the
     padding was correct.
     """
-    padding_len = plaintext[-1]
-    assert padding_len > 0
-    message, padding = plaintext[:-padding_len], plaintext[-padding_len:]
-    assert all(p == padding_len for p in padding)
-    return message
+    return plaintext[:unpadded_length(plaintext)]
+
+def padded_size(length):
+    """ Size of a message of `length` bytes after PKCS#7 padding. """
+    return length // 16 * 16 + 16
+
+def pad_final_block(plaintext):
+    """
+    Returns just the last, padded block of `pad(plaintext)`, so the rest of
+    the message can be processed in place without copying it.
+    """
+    tail = bytes(plaintext[len(plaintext) // 16 * 16:])
+    padding_len = 16 - len(tail)
+    return tail + bytes([padding_len] * padding_len)
+
+def unpadded_length(plaintext, length=None):
+    """
+    Checks the PKCS#7 padding at the end of the first `length` bytes of
+    `plaintext` (all of it by default) and returns the unpadded length.
+    """
+    length = len(plaintext) if length is None else length
+    padding_len = plaintext[length - 1]
+    assert 0 < padding_len <= min(16, length)
+    assert all(p == padding_len for p in plaintext[length - padding_len:length])
+    return length - padding_len
 
 def split_blocks(message, block_size=16, require_padding=True):
         assert len(message) % block_size == 0 or not require_padding
         return [message[i:i+16] for i in range(0, len(message), block_size)]
 
 
+from struct import Struct
+
+# Packs/unpacks a 16-byte block as four big-endian 32-bit column words.
+block_words = Struct('>4I')
+
+def gf_mul(a, b):
+    """ Multiplies two bytes as elements of GF(2^8). """
+    result = 0
+    while b:
+        if b & 1:
+            result ^= a
+        a = xtime(a)
+        b >>= 1
+    return result
+
+def ror8(word):
+    """ Rotates a 32-bit word right by 8 bits. """
+    return ((word >> 8) | (word << 24)) & 0xFFFFFFFF
+
+def _make_t_tables():
+    """
+    Builds the encryption (Te0..Te3) and decryption (Td0..Td3) T-tables, which
+    fold SubBytes, ShiftRows and (Inv)MixColumns into one 32-bit lookup per
+    state byte. Te0[x] is the column (2, 1, 1, 3) * S[x], Td0[x] the column
+    (14, 9, 13, 11) * InvS[x], and the other tables are byte rotations of them.
+    """
+    te0 = tuple((gf_mul(s, 2) << 24) | (s << 16) | (s << 8) | gf_mul(s, 3)
+                for s in s_box)
+    td0 = tuple((gf_mul(s, 14) << 24) | (gf_mul(s, 9) << 16) | (gf_mul(s, 13) << 8) | gf_mul(s, 11)
+                for s in inv_s_box)
+    te = [te0]
+    td = [td0]
+    for _ in range(3):
+        te.append(tuple(ror8(w) for w in te[-1]))
+        td.append(tuple(ror8(w) for w in td[-1]))
+    return te, td
+
+(Te0, Te1, Te2, Te3), (Td0, Td1, Td2, Td3) = _make_t_tables()
+
+def inv_mix_column_word(word):
+    """ Applies InvMixColumns to a single 32-bit column word. """
+    return (Td0[s_box[word >> 24]] ^ Td1[s_box[(word >> 16) & 0xFF]] ^
+            Td2[s_box[(word >> 8) & 0xFF]] ^ Td3[s_box[word & 0xFF]])
+
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+class Metrics:
+    """
+    Counters and timers filled in while instrumentation is enabled (see
+    `collect_metrics`). Work is recorded per phase ('kdf', 'key_schedule',
+    one per block mode, 'ghash', 'hmac_verify', 'padding') and backend as
+    the number of calls, seconds spent and bytes and 16-byte blocks
+    processed. Phases can nest: 'gcm' includes its 'ctr' and 'ghash' time.
+    Events (cache hits and misses, HMAC failures) are plain counters.
+    """
+    def __init__(self):
+        self.phases = {}
+        self.events = {}
+        self._lock = threading.Lock()
+
+    def record(self, phase, seconds, n_bytes=0, backend=''):
+        """ Adds one call of `phase` that took `seconds` over `n_bytes`. """
+        with self._lock:
+            entry = self.phases.get((phase, backend))
+            if entry is None:
+                entry = self.phases[(phase, backend)] = [0, 0.0, 0, 0]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] += n_bytes
+            entry[3] += (n_bytes + 15) // 16
+
+    def count(self, event, n=1):
+        with self._lock:
+            self.events[event] = self.events.get(event, 0) + n
+
+    def snapshot(self):
+        """ Returns the current values as a dict of plain lists and numbers. """
+        with self._lock:
+            phases = [{'phase': phase, 'backend': backend, 'calls': calls,
+                       'seconds': seconds, 'bytes': n_bytes, 'blocks': blocks}
+                      for (phase, backend), (calls, seconds, n_bytes, blocks) in sorted(self.phases.items())]
+            return {'phases': phases, 'events': dict(sorted(self.events.items()))}
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.snapshot(), **kwargs)
+
+    def to_prometheus(self, prefix='aes'):
+        """ Returns the values in the Prometheus text exposition format. """
+        snapshot = self.snapshot()
+        lines = []
+        for field, help_text in (('calls', 'Calls per phase.'), ('seconds', 'Seconds spent per phase.'),
+                                 ('bytes', 'Bytes processed per phase.'), ('blocks', 'Blocks processed per phase.')):
+            name = '{}_phase_{}_total'.format(prefix, field)
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} counter'.format(name))
+            for entry in snapshot['phases']:
+                lines.append('{}{{phase="{}",backend="{}"}} {}'.format(name, entry['phase'], entry['backend'], entry[field]))
+        name = '{}_events_total'.format(prefix)
+        lines.append('# HELP {} Event counts.'.format(name))
+        lines.append('# TYPE {} counter'.format(name))
+        for event, n in snapshot['events'].items():
+            lines.append('{}{{event="{}"}} {}'.format(name, event, n))
+        return '\n'.join(lines) + '\n'
+
+# Metrics being collected, or None (the default) to skip instrumentation.
+_metrics = None
+
+def enable_metrics(metrics=None):
+    """
+    Starts recording into `metrics` (a new `Metrics` by default), which is
+    returned. Recording is process-wide: every thread reports to it.
+    """
+    global _metrics
+    _metrics = Metrics() if metrics is None else metrics
+    return _metrics
+
+def disable_metrics():
+    """ Stops recording and returns the `Metrics` that was in use, if any. """
+    global _metrics
+    metrics, _metrics = _metrics, None
+    return metrics
+
+@contextmanager
+def collect_metrics():
+    """
+    Records into a fresh `Metrics` for the duration of the block:
+
+        with collect_metrics() as metrics:
+            encrypt(key, message)
+        print(metrics.to_json())
+    """
+    global _metrics
+    previous = _metrics
+    metrics = enable_metrics()
+    try:
+        yield metrics
+    finally:
+        _metrics = previous
+
+def _count(event):
+    metrics = _metrics
+    if metrics is not None:
+        metrics.count(event)
+
+def _timed(phase, size=lambda data, *args: len(data)):
+    """
+    Decorator for `AES` methods: while metrics are enabled, each call is
+    recorded under `phase` and the instance's backend, over `size(*args)`
+    bytes. Otherwise the only cost is one global lookup.
+    """
+    def decorate(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            metrics = _metrics
+            if metrics is None:
+                return method(self, *args, **kwargs)
+            start = time.perf_counter()
+            result = method(self, *args, **kwargs)
+            metrics.record(phase, time.perf_counter() - start, size(*args), self.backend)
+            return result
+        return wrapper
+    return decorate
+
+
+import ctypes
+import os
+import platform
+
+NATIVE_LIBRARY_NAMES = {'Windows': 'rijndael.dll', 'Darwin': 'rijndael.dylib'}
+
+_native_library = None
+_native_loaded = False
+native_load_error = None
+
+def native_library_path():
+    """
+    Returns where the compiled rijndael library is expected: the
+    RIJNDAEL_LIBRARY environment variable if set, otherwise the platform's
+    library name next to this file.
+    """
+    if os.environ.get('RIJNDAEL_LIBRARY'):
+        return os.environ['RIJNDAEL_LIBRARY']
+    name = NATIVE_LIBRARY_NAMES.get(platform.system(), 'rijndael.so')
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+
+def _configure_native(lib):
+    """ Declares the C signatures used by `NativeContext`. """
+    lib.aes_context_new.argtypes = [ctypes.c_char_p, ctypes.c_size_t]
+    lib.aes_context_new.restype = ctypes.c_void_p
+    for name in ('aes_context_encrypt_block', 'aes_context_decrypt_block'):
+        getattr(lib, name).argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_char_p]
+        getattr(lib, name).restype = None
+    lib.aes_context_free.argtypes = [ctypes.c_void_p]
+    lib.aes_context_free.restype = None
+    lib.aes_context_set_engine.argtypes = [ctypes.c_void_p, ctypes.c_int]
+    lib.aes_context_set_engine.restype = ctypes.c_int
+    lib.aes_context_get_engine.argtypes = [ctypes.c_void_p]
+    lib.aes_context_get_engine.restype = ctypes.c_int
+    lib.aes_cpu_has_aesni.argtypes = []
+    lib.aes_cpu_has_aesni.restype = ctypes.c_int
+
+    # Bulk entry points: (context, [counter/iv,] in_ptr, out_ptr, n_blocks)
+    for name in ('aes_ecb_encrypt', 'aes_ecb_decrypt'):
+        getattr(lib, name).argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_size_t]
+        getattr(lib, name).restype = None
+    for name in ('aes_ctr_crypt', 'aes_cbc_encrypt', 'aes_cbc_decrypt'):
+        getattr(lib, name).argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_size_t]
+        getattr(lib, name).restype = None
+
+    lib.aes_cbc_encrypt_multi.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int]
+    lib.aes_cbc_encrypt_multi.restype = None
+
+    lib.ghash_context_new.argtypes = [ctypes.c_char_p]
+    lib.ghash_context_new.restype = ctypes.c_void_p
+    lib.ghash_update.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_void_p, ctypes.c_size_t]
+    lib.ghash_update.restype = None
+    lib.ghash_context_free.argtypes = [ctypes.c_void_p]
+    lib.ghash_context_free.restype = None
+
+def load_native():
+    """
+    Returns the native rijndael library, or None if it is unavailable. The
+    library is looked up on first use only; the result (and the reason for a
+    failure, in `native_load_error`) is kept for the rest of the process.
+    """
+    global _native_library, _native_loaded, native_load_error
+    if not _native_loaded:
+        _native_loaded = True
+        path = native_library_path()
+        try:
+            lib = ctypes.CDLL(path)
+            _configure_native(lib)
+            _native_library = lib
+        except OSError as e:
+            native_load_error = 'Could not load {}: {}'.format(path, e)
+        except AttributeError as e:
+            native_load_error = '{} is outdated, rebuild it with `make`: {}'.format(path, e)
+    return _native_library
+
+_extension = None
+_extension_loaded = False
+extension_load_error = None
+
+def load_extension():
+    """
+    Returns the `_rijndael` extension module (built with `make extension`),
+    or None if it is not built or RIJNDAEL_NO_EXTENSION is set. When present
+    it replaces ctypes for the native backend: calls skip ctypes marshalling
+    and take buffers directly, releasing the GIL during bulk work.
+    """
+    global _extension, _extension_loaded, extension_load_error
+    if not _extension_loaded:
+        _extension_loaded = True
+        if os.environ.get('RIJNDAEL_NO_EXTENSION'):
+            extension_load_error = 'Disabled by RIJNDAEL_NO_EXTENSION.'
+        else:
+            try:
+                import _rijndael
+                _extension = _rijndael
+            except ImportError as e:
+                extension_load_error = str(e)
+    return _extension
+
+def native_available():
+    """ Whether the native backend can run, through the extension or ctypes. """
+    return load_extension() is not None or load_native() is not None
+
+def native_has_aesni():
+    """
+    Whether the native code runs on the AES-NI engine: the CPU supports it
+    and the RIJNDAEL_DISABLE_AESNI environment variable does not force the
+    portable engines.
+    """
+    extension = load_extension()
+    if extension is not None:
+        return extension.cpu_has_aesni()
+    lib = load_native()
+    return lib is not None and bool(lib.aes_cpu_has_aesni())
+
+
+# Zero-copy access to any buffer-protocol object (bytes, bytearray,
+# memoryview, mmap, ...) through the C-API buffer interface.
+class _Py_buffer(ctypes.Structure):
+    _fields_ = [
+        ('buf', ctypes.c_void_p),
+        ('obj', ctypes.c_void_p),
+        ('len', ctypes.c_ssize_t),
+        ('itemsize', ctypes.c_ssize_t),
+        ('readonly', ctypes.c_int),
+        ('ndim', ctypes.c_int),
+        ('format', ctypes.c_char_p),
+        ('shape', ctypes.c_void_p),
+        ('strides', ctypes.c_void_p),
+        ('suboffsets', ctypes.c_void_p),
+        ('internal', ctypes.c_void_p),
+    ]
+
+PyBUF_SIMPLE = 0
+PyBUF_WRITABLE = 1
+_PyObject_GetBuffer = ctypes.pythonapi.PyObject_GetBuffer
+_PyObject_GetBuffer.argtypes = [ctypes.py_object, ctypes.POINTER(_Py_buffer), ctypes.c_int]
+_PyObject_GetBuffer.restype = ctypes.c_int
+_PyBuffer_Release = ctypes.pythonapi.PyBuffer_Release
+_PyBuffer_Release.argtypes = [ctypes.POINTER(_Py_buffer)]
+_PyBuffer_Release.restype = None
+
+@contextmanager
+def buffer_pointer(obj, writable=False):
+    """
+    Yields (address, length) of a contiguous buffer without copying it. The
+    buffer stays pinned until the block exits.
+    """
+    view = _Py_buffer()
+    _PyObject_GetBuffer(obj, ctypes.byref(view), PyBUF_WRITABLE if writable else PyBUF_SIMPLE)
+    try:
+        yield view.buf, view.len
+    finally:
+        _PyBuffer_Release(ctypes.byref(view))
+
+
+class NativeContext:
+    """
+    Handle on a keyed aes_context from the native rijndael library. The key
+    is expanded once on construction; block and bulk calls then run in C,
+    with buffers passed by address and the GIL released during each call.
+
+    `engine` picks the C round engine (see `engines`); None keeps the
+    library's default, which is 'aesni' when `native_has_aesni()`.
+    """
+    engines = {'bytewise': 0, 'ttable': 1, 'bitsliced': 2, 'aesni': 3}
+
+    def __init__(self, key, engine=None):
+        lib = load_native()
+        if lib is None:
+            raise RuntimeError('Native backend unavailable: {}'.format(native_load_error))
+        self._lib = lib
+        self._ctx = lib.aes_context_new(bytes(key), len(key))
+        if not self._ctx:
+            raise ValueError('Unsupported key size: {}'.format(len(key)))
+        if engine is not None:
+            self.engine = engine
+
+    @property
+    def _handle(self):
+        """ The aes_context pointer, checked so a closed context never reaches C. """
+        if not getattr(self, '_ctx', None):
+            raise ValueError('Context is closed.')
+        return self._ctx
+
+    @property
+    def engine(self):
+        """ Name of the C round engine this context runs on. """
+        code = self._lib.aes_context_get_engine(self._handle)
+        return next(name for name, value in self.engines.items() if value == code)
+
+    @engine.setter
+    def engine(self, name):
+        assert name in self.engines, 'Unknown native engine {!r}'.format(name)
+        if self._lib.aes_context_set_engine(self._handle, self.engines[name]) < 0:
+            raise ValueError('Native engine {!r} is not supported on this CPU'.format(name))
+
+    def encrypt_block(self, block):
+        out = ctypes.create_string_buffer(16)
+        self._lib.aes_context_encrypt_block(self._handle, bytes(block), out)
+        return out.raw
+
+    def decrypt_block(self, block):
+        out = ctypes.create_string_buffer(16)
+        self._lib.aes_context_decrypt_block(self._handle, bytes(block), out)
+        return out.raw
+
+    def _bulk(self, c_func, data, out, chaining=None):
+        """
+        Runs a bulk C function over `data` in a single foreign call. Both
+        `data` and `out` are passed by address through the buffer protocol;
+        `out` defaults to a new bytearray and is returned.
+        """
+        if out is None:
+            out = bytearray(len(data))
+        with buffer_pointer(data) as (in_ptr, in_len), buffer_pointer(out, writable=True) as (out_ptr, out_len):
+            assert in_len % 16 == 0, 'Bulk input must be made of full 16-byte blocks.'
+            assert out_len >= in_len, 'Output buffer is too small.'
+            if chaining is None:
+                c_func(self._handle, in_ptr, out_ptr, in_len // 16)
+            else:
+                c_func(self._handle, chaining, in_ptr, out_ptr, in_len // 16)
+        return out
+
+    def encrypt_ecb(self, data, out=None):
+        return self._bulk(self._lib.aes_ecb_encrypt, data, out)
+
+    def decrypt_ecb(self, data, out=None):
+        return self._bulk(self._lib.aes_ecb_decrypt, data, out)
+
+    def encrypt_cbc(self, data, iv, out=None):
+        """ Raw CBC encryption (no padding) of whole blocks. """
+        assert len(iv) == 16
+        return self._bulk(self._lib.aes_cbc_encrypt, data, out, ctypes.create_string_buffer(bytes(iv), 16))
+
+    def decrypt_cbc(self, data, iv, out=None):
+        """ Raw CBC decryption (no unpadding) of whole blocks. """
+        assert len(iv) == 16
+        return self._bulk(self._lib.aes_cbc_decrypt, data, out, ctypes.create_string_buffer(bytes(iv), 16))
+
+    def crypt_ctr(self, data, counter, out=None):
+        """
+        CTR encryption/decryption with a 128-bit big-endian counter. A trailing
+        partial block is handled with one extra keystream block.
+        """
+        assert len(counter) == 16
+        if out is None:
+            out = bytearray(len(data))
+        counter = ctypes.create_string_buffer(bytes(counter), 16)
+        data = memoryview(data).cast('B')
+        full = len(data) - len(data) % 16
+        self._bulk(self._lib.aes_ctr_crypt, data[:full], memoryview(out).cast('B')[:full], counter)
+        if full < len(data):
+            keystream = self.encrypt_block(counter.raw)
+            out[full:len(data)] = xor_bytes(data[full:], keystream)
+        return out
+
+    def close(self):
+        if getattr(self, '_ctx', None):
+            self._lib.aes_context_free(self._ctx)
+            self._ctx = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+
+def _ghash_reduction(rem):
+    """ Reduction of the 4 low bits `rem` shifted out of a 128-bit value. """
+    for _ in range(4):
+        rem = (rem >> 1) ^ (0xE1 << 120) if rem & 1 else rem >> 1
+    return rem
+
+ghash_last4 = [_ghash_reduction(rem) for rem in range(16)]
+
+class GHash:
+    """
+    GHASH, the GF(2^128) universal hash of GCM, keyed by H (the encryption
+    of the zero block). Blocks are 128-bit big-endian integers; in GCM's bit
+    order multiplying by x is a right shift reduced with 0xE1 << 120.
+
+    Multiplication by H uses Shoup's 4-bit tables, table[i] = i * H for
+    every nibble i, so each block costs 32 lookups and shifts rather than
+    128 conditional XORs.
+    """
+    def __init__(self, h):
+        h = int.from_bytes(h, 'big')
+        table = [0] * 16
+        # Nibble bit 8 is x^0, so table[8] = H and halving multiplies by x.
+        table[8] = h
+        for i in (4, 2, 1):
+            h = (h >> 1) ^ (0xE1 << 120) if h & 1 else h >> 1
+            table[i] = h
+        for i in (2, 4, 8):
+            for j in range(1, i):
+                table[i + j] = table[i] ^ table[j]
+        self._table = table
+        self._y = 0
+
+    def _multiply(self, y):
+        table = self._table
+        z = 0
+        for shift in range(0, 128, 4):
+            z = (z >> 4) ^ ghash_last4[z & 0xF] ^ table[(y >> shift) & 0xF]
+        return z
+
+    def update(self, data):
+        """ Absorbs `data`, zero-padded to a whole number of blocks. """
+        y = self._y
+        for block in split_blocks(bytes(data), require_padding=False):
+            y = self._multiply(y ^ int.from_bytes(block.ljust(16, b'\x00'), 'big'))
+        self._y = y
+
+    def digest(self):
+        return self._y.to_bytes(16, 'big')
+
+class NativeGHash:
+    """ `GHash` backed by the table-driven implementation in rijndael.c. """
+    def __init__(self, h):
+        self._lib = load_native()
+        if self._lib is None:
+            raise RuntimeError('Native rijndael library unavailable: {}'.format(native_load_error))
+        self._ctx = self._lib.ghash_context_new(bytes(h))
+        if not self._ctx:
+            raise MemoryError('ghash_context_new failed')
+        self._y = ctypes.create_string_buffer(16)
+
+    def update(self, data):
+        """ Absorbs `data`, zero-padded to a whole number of blocks. """
+        if len(data) % 16:
+            data = bytes(data) + bytes(16 - len(data) % 16)
+        with buffer_pointer(data) as (data_ptr, data_len):
+            self._lib.ghash_update(self._ctx, self._y, data_ptr, data_len // 16)
+
+    def digest(self):
+        return self._y.raw
+
+    def __del__(self):
+        if getattr(self, '_ctx', None):
+            self._lib.ghash_context_free(self._ctx)
+            self._ctx = None
+
+def native_context(key, engine=None):
+    """
+    Returns a keyed native context: a `_rijndael.Context` when the extension
+    is built, a ctypes `NativeContext` otherwise. Both have the same methods.
+    """
+    extension = load_extension()
+    if extension is not None:
+        return extension.Context(key, engine)
+    return NativeContext(key, engine)
+
+def native_ghash(h):
+    """ Native `GHash`: the extension's when built, else `NativeGHash`. """
+    extension = load_extension()
+    return extension.GHash(h) if extension is not None else NativeGHash(h)
+
+class _CBCJob(ctypes.Structure):
+    """ An aes_cbc_job for aes_cbc_encrypt_multi. """
+    _fields_ = [
+        ('ctx', ctypes.c_void_p),
+        ('iv', ctypes.c_void_p),
+        ('data_in', ctypes.c_void_p),
+        ('data_out', ctypes.c_void_p),
+        ('n_blocks', ctypes.c_size_t),
+    ]
+
+def native_cbc_encrypt_multi(contexts, ivs, buffer, bounds, pcbc=False):
+    """
+    Multi-buffer CBC (or PCBC) encryption in C: for every i, encrypts
+    buffer[bounds[i]:bounds[i + 1]] in place under the native context
+    contexts[i] (from `native_context`), chained from ivs[16*i:16*(i+1)],
+    which receives the final chaining value.
+    """
+    extension = load_extension()
+    if extension is not None:
+        extension.encrypt_cbc_multi(contexts, ivs, buffer, bounds, pcbc)
+        return
+    assert len(bounds) == len(contexts) + 1 and len(ivs) >= 16 * len(contexts)
+    jobs = (_CBCJob * len(contexts))()
+    with buffer_pointer(ivs, writable=True) as (ivs_ptr, _), buffer_pointer(buffer, writable=True) as (ptr, length):
+        for i, ctx in enumerate(contexts):
+            start, end = bounds[i], bounds[i + 1]
+            assert 0 <= start <= end <= length and (end - start) % 16 == 0, 'Invalid bounds.'
+            jobs[i] = _CBCJob(ctx._handle, ivs_ptr + 16 * i, ptr + start, ptr + start, (end - start) // 16)
+        if contexts:
+            contexts[0]._lib.aes_cbc_encrypt_multi(jobs, len(contexts), int(pcbc))
+
+
+_numpy = None
+_numpy_loaded = False
+
+def load_numpy():
+    """
+    Imports NumPy for the vectorized backend, returning None if it is not
+    installed. NumPy is optional: nothing else in this module needs it.
+    """
+    global _numpy, _numpy_loaded
+    if not _numpy_loaded:
+        _numpy_loaded = True
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = None
+    return _numpy
+
+class NumpyContext:
+    """
+    Vectorized AES over many independent blocks, held as an (N, 16) uint8
+    array in the same column-major byte order as the Python matrices. Each
+    round is a handful of whole-array operations: SubBytes indexes into the
+    S-box, ShiftRows is a fixed column permutation, MixColumns uses an xtime
+    lookup table and AddRoundKey is a broadcast XOR. Python-level work per
+    round is therefore constant instead of per block.
+
+    Only modes whose blocks are independent benefit (ECB, CTR, and CBC/CFB
+    decryption); chained encryption stays on the per-block engines.
+    """
+    # Blocks per vectorized pass, to bound the size of temporary arrays.
+    batch_blocks = 1 << 16
+
+    def __init__(self, key_matrices):
+        np = load_numpy()
+        if np is None:
+            raise RuntimeError('NumPy is not installed.')
+        self._np = np
+        self._round_keys = np.array([[b for column in matrix for b in column]
+                                     for matrix in key_matrices], dtype=np.uint8)
+        self._s_box = np.array(s_box, dtype=np.uint8)
+        self._inv_s_box = np.array(inv_s_box, dtype=np.uint8)
+        self._xtime = np.array([xtime(i) for i in range(256)], dtype=np.uint8)
+        self._xtime2 = self._xtime[self._xtime]
+        # Byte 4*c + r of the output comes from column c + r (c - r) of row r.
+        self._shift = np.array([4 * ((c + r) % 4) + r for c in range(4) for r in range(4)])
+        self._inv_shift = np.array([4 * ((c - r) % 4) + r for c in range(4) for r in range(4)])
+
+    def _mix_columns(self, state):
+        np = self._np
+        columns = state.reshape(-1, 4, 4)
+        total = np.bitwise_xor.reduce(columns, axis=2, keepdims=True)
+        columns = columns ^ total ^ self._xtime[columns ^ np.roll(columns, -1, axis=2)]
+        return columns.reshape(-1, 16)
+
+    def _inv_mix_columns(self, state):
+        # Same decomposition as `inv_mix_columns`: premultiply, then MixColumns.
+        columns = state.reshape(-1, 4, 4)
+        columns = columns ^ self._xtime2[columns ^ self._np.roll(columns, -2, axis=2)]
+        return self._mix_columns(columns.reshape(-1, 16))
+
+    def _encrypt(self, state):
+        keys = self._round_keys
+        state = state ^ keys[0]
+        for i in range(1, len(keys) - 1):
+            state = self._mix_columns(self._s_box[state][:, self._shift]) ^ keys[i]
+        return self._s_box[state][:, self._shift] ^ keys[-1]
+
+    def _decrypt(self, state):
+        keys = self._round_keys
+        state = state ^ keys[-1]
+        for i in range(len(keys) - 2, 0, -1):
+            state = self._inv_mix_columns(self._inv_s_box[state[:, self._inv_shift]] ^ keys[i])
+        return self._inv_s_box[state[:, self._inv_shift]] ^ keys[0]
+
+    def _blocks(self, function, blocks):
+        """ Applies `function` to an (N, 16) array in batches of `batch_blocks`. """
+        if len(blocks) <= self.batch_blocks:
+            return function(blocks)
+        return self._np.concatenate([function(blocks[i:i + self.batch_blocks])
+                                     for i in range(0, len(blocks), self.batch_blocks)])
+
+    def _as_blocks(self, data):
+        data = self._np.frombuffer(data, dtype=self._np.uint8)
+        assert len(data) % 16 == 0, 'Bulk input must be made of full 16-byte blocks.'
+        return data.reshape(-1, 16)
+
+    def encrypt_ecb(self, data):
+        return self._blocks(self._encrypt, self._as_blocks(data)).tobytes()
+
+    def decrypt_ecb(self, data):
+        return self._blocks(self._decrypt, self._as_blocks(data)).tobytes()
+
+    def decrypt_cbc(self, data, iv):
+        """ Raw CBC decryption (no unpadding) of whole blocks. """
+        np = self._np
+        blocks = self._as_blocks(data)
+        previous = np.concatenate([np.frombuffer(iv, dtype=np.uint8).reshape(1, 16), blocks[:-1]])
+        return (self._blocks(self._decrypt, blocks) ^ previous).tobytes()
+
+    def decrypt_cfb(self, data, iv):
+        """ CFB decryption; a trailing partial block is allowed. """
+        np = self._np
+        n_blocks = (len(data) + 15) // 16
+        inputs = self._as_blocks((bytes(iv) + bytes(data))[:16 * n_blocks])
+        keystream = self._blocks(self._encrypt, inputs).reshape(-1)[:len(data)]
+        return (keystream ^ np.frombuffer(data, dtype=np.uint8)).tobytes()
+
+    def crypt_ctr(self, data, counter):
+        """
+        CTR encryption/decryption with a 128-bit big-endian counter; a
+        trailing partial block is allowed.
+        """
+        np = self._np
+        n_blocks = (len(data) + 15) // 16
+        counter = int.from_bytes(counter, 'big')
+        high, low = counter >> 64, counter & ((1 << 64) - 1)
+        counters = np.empty((n_blocks, 2), dtype='>u8')
+        counters[:, 1] = np.arange(n_blocks, dtype=np.uint64) + np.uint64(low)
+        # Carry into the high half wherever the low half wrapped around.
+        counters[:, 0] = np.uint64(high) + (counters[:, 1] < low).astype(np.uint64)
+        inputs = counters.view(np.uint8).reshape(-1, 16)
+        keystream = self._blocks(self._encrypt, inputs).reshape(-1)[:len(data)]
+        return (keystream ^ np.frombuffer(data, dtype=np.uint8)).tobytes()
+
+
+from array import array
+from collections import OrderedDict
+
+def expand_key_words(master_key):
+    """
+    FIPS-197 key expansion on 32-bit words. Returns the (rounds + 1) * 4
+    round key words as a flat array('I').
+    """
+    n_key_words = len(master_key) // 4
+    n_words = 4 * (AES.rounds_by_key_size[len(master_key)] + 1)
+    words = list(Struct('>{}I'.format(n_key_words)).unpack(master_key))
+    for i in range(n_key_words, n_words):
+        word = words[-1]
+        if i % n_key_words == 0:
+            # RotWord, SubWord and the round constant.
+            word = ((s_box[(word >> 16) & 0xFF] << 24) ^ (s_box[(word >> 8) & 0xFF] << 16) ^
+                    (s_box[word & 0xFF] << 8) ^ s_box[word >> 24] ^ (r_con[i // n_key_words] << 24))
+        elif n_key_words > 6 and i % n_key_words == 4:
+            word = ((s_box[word >> 24] << 24) ^ (s_box[(word >> 16) & 0xFF] << 16) ^
+                    (s_box[(word >> 8) & 0xFF] << 8) ^ s_box[word & 0xFF])
+        words.append(words[i - n_key_words] ^ word)
+    return array('I', words)
+
+class Counter:
+    """
+    CTR counter block held as a 128-bit integer. As in NIST SP 800-38A
+    (Appendix B.1), only the low `width` bits are incremented; the bits
+    above them (typically a nonce) stay fixed. When the low bits run out
+    they wrap around to zero, or, with `wrap=False`, an error is raised
+    instead so a counter block is never reused.
+    """
+    def __init__(self, initial, width=128, wrap=True):
+        assert len(initial) == 16
+        assert 0 < width <= 128, 'Counter width must be between 1 and 128 bits.'
+        self.width = width
+        self.wrap = wrap
+        self._value = int.from_bytes(initial, 'big')
+        self._mask = (1 << width) - 1
+        # Set once the last counter value has been used without `wrap`; the
+        # low bits are then back at zero but may not be handed out again.
+        self.exhausted = False
+
+    def block(self):
+        """ The current counter block. """
+        return self._value.to_bytes(16, 'big')
+
+    def until_wrap(self):
+        """ Number of blocks left before the low `width` bits wrap. """
+        return (1 << self.width) - (self._value & self._mask)
+
+    def _check(self, n_blocks):
+        assert self.wrap or n_blocks == 0 or (not self.exhausted and n_blocks <= self.until_wrap()), \
+            'Counter space exhausted.'
+
+    def advance(self, n_blocks):
+        """ Moves the counter forward by `n_blocks`. """
+        self._check(n_blocks)
+        if not self.wrap and n_blocks and n_blocks == self.until_wrap():
+            self.exhausted = True
+        low = ((self._value & self._mask) + n_blocks) & self._mask
+        self._value = (self._value & ~self._mask) | low
+
+    def take(self, n_blocks):
+        """
+        Returns the next `n_blocks` counter blocks concatenated, advancing
+        the counter past them.
+        """
+        self._check(n_blocks)
+        blocks = []
+        while n_blocks:
+            n = min(n_blocks, self.until_wrap())
+            start = self._value
+            blocks.extend((start + i).to_bytes(16, 'big') for i in range(n))
+            self.advance(n)
+            n_blocks -= n
+        return b''.join(blocks)
+
+
+class Keystream:
+    """
+    Keystream for one message, generated in batches of whole blocks ahead
+    of the data it will encrypt. `precompute` fills the buffer in advance
+    (e.g. while waiting for input); `xor` consumes it.
+    """
+    def __init__(self, aes):
+        self._aes = aes
+        self._buffer = bytearray()
+
+    def precompute(self, n_bytes):
+        """ Makes sure at least `n_bytes` of keystream are buffered. """
+        missing = n_bytes - len(self._buffer)
+        if missing > 0:
+            self._buffer += self._generate((missing + 15) // 16)
+
+    def read(self, n_bytes):
+        """ Returns and consumes the next `n_bytes` of keystream. """
+        self.precompute(n_bytes)
+        keystream = bytes(self._buffer[:n_bytes])
+        del self._buffer[:n_bytes]
+        return keystream
+
+    def xor(self, data):
+        """ XORs `data` with the next `len(data)` bytes of keystream. """
+        return xor_bytes(data, self.read(len(data)))
+
+class CTRKeystream(Keystream):
+    def __init__(self, aes, counter):
+        super().__init__(aes)
+        self.counter = counter
+
+    def _generate(self, n_blocks):
+        return self._aes.ctr_keystream(self.counter, 16 * n_blocks)
+
+class OFBKeystream(Keystream):
+    def __init__(self, aes, iv):
+        super().__init__(aes)
+        self._iv = bytes(iv)
+
+    def _generate(self, n_blocks):
+        keystream = self._aes.ofb_keystream(self._iv, 16 * n_blocks)
+        self._iv = keystream[-16:]
+        return keystream
+
+
+class KeySchedule:
+    """
+    Expanded key stored as flat arrays of 32-bit words: the encryption round
+    keys and the decryption round keys of the equivalent inverse cipher
+    (round keys in reverse order, with InvMixColumns applied to all but the
+    first and last).
+    """
+    __slots__ = ('n_rounds', 'enc_words', 'dec_words', '_specialized')
+
+    def __init__(self, master_key):
+        self._specialized = None
+        self.n_rounds = AES.rounds_by_key_size[len(master_key)]
+        self.enc_words = enc = expand_key_words(master_key)
+        self.dec_words = array('I')
+        for i in range(self.n_rounds, -1, -1):
+            words = enc[4*i : 4*(i+1)]
+            if 0 < i < self.n_rounds:
+                words = array('I', [inv_mix_column_word(w) for w in words])
+            self.dec_words.extend(words)
+
+    def copy(self):
+        """ A private copy of the round keys, wiped independently of this one. """
+        schedule = KeySchedule.__new__(KeySchedule)
+        schedule.n_rounds = self.n_rounds
+        schedule.enc_words = array('I', self.enc_words)
+        schedule.dec_words = array('I', self.dec_words)
+        schedule._specialized = None
+        return schedule
+
+    def specialized(self):
+        """
+        Returns the (encrypt_block, decrypt_block) functions generated for
+        this key by `specialize_block_cipher`, compiled on first use only.
+        """
+        if self._specialized is None:
+            self._specialized = specialize_block_cipher(self.n_rounds, self.enc_words, self.dec_words)
+        return self._specialized
+
+    def wipe(self):
+        """
+        Overwrites the round keys with zeros and drops the specialized
+        functions (their constants cannot be overwritten, only released).
+        """
+        for words in (self.enc_words, self.dec_words):
+            words[:] = array('I', bytes(words.itemsize * len(words)))
+        self._specialized = None
+
+def _unrolled_block_source(name, n_rounds, words, shifts):
+    """
+    Source of a T-table block function with every round written out and the
+    round keys `words` as literals. The state alternates between s0-s3 and
+    t0-t3; (Inv)ShiftRows is only which of them each lookup reads, given by
+    `shifts` (the column offsets of the four table lookups).
+    """
+    def column(state, j):
+        return [state + str((j + shift) % 4) for shift in shifts]
+
+    lines = ['def {}(block, T0=T0, T1=T1, T2=T2, T3=T3, B=B, unpack=unpack, pack=pack):'.format(name),
+             '    s0, s1, s2, s3 = unpack(block)']
+    lines += ['    s{} ^= 0x{:08x}'.format(j, words[j]) for j in range(4)]
+    state, other = 's', 't'
+    for k in range(4, 4 * n_rounds, 4):
+        for j in range(4):
+            a, b, c, d = column(state, j)
+            lines.append('    {}{} = T0[{} >> 24] ^ T1[({} >> 16) & 0xFF] ^ T2[({} >> 8) & 0xFF] ^ T3[{} & 0xFF] ^ 0x{:08x}'.format(
+                other, j, a, b, c, d, words[k + j]))
+        state, other = other, state
+
+    # Final round: (Inv)SubBytes and (Inv)ShiftRows only.
+    k = 4 * n_rounds
+    lines.append('    return pack(')
+    for j in range(4):
+        a, b, c, d = column(state, j)
+        lines.append('        ((B[{} >> 24] << 24) | (B[({} >> 16) & 0xFF] << 16) | (B[({} >> 8) & 0xFF] << 8) | B[{} & 0xFF]) ^ 0x{:08x},'.format(
+            a, b, c, d, words[k + j]))
+    lines.append('    )')
+    return '\n'.join(lines) + '\n'
+
+def specialize_block_cipher(n_rounds, enc_words, dec_words):
+    """
+    Generates and compiles fully unrolled T-table encrypt and decrypt block
+    functions for one key schedule: no round loop, no round key indexing,
+    and the tables bound as default arguments (fast locals). Returns
+    (encrypt_block, decrypt_block), both taking and returning 16 bytes.
+    """
+    functions = []
+    for name, words, tables, box, shifts in (
+            ('encrypt_block', enc_words, (Te0, Te1, Te2, Te3), s_box, (0, 1, 2, 3)),
+            ('decrypt_block', dec_words, (Td0, Td1, Td2, Td3), inv_s_box, (0, 3, 2, 1))):
+        namespace = dict(zip(('T0', 'T1', 'T2', 'T3'), tables), B=box,
+                         unpack=block_words.unpack, pack=block_words.pack)
+        source = _unrolled_block_source(name, n_rounds, words, shifts)
+        exec(compile(source, '<aes specialized {}>'.format(name), 'exec'), namespace)
+        functions.append(namespace[name])
+    return tuple(functions)
+
+class ScheduleCache:
+    """
+    Process-wide, thread-safe LRU cache of `KeySchedule`s, so code cycling
+    through a working set of keys does not re-expand them for every `AES`
+    instance. Evicted schedules are wiped. Entries are looked up by an HMAC
+    of the key under a random per-cache key rather than by the key itself.
+    A `max_size` of 0 disables caching.
+    """
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._secret = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, master_key, copy=False):
+        """
+        Returns the schedule for `master_key`, expanding it on a miss. With
+        `copy`, returns a private copy taken under the lock instead, which a
+        concurrent eviction cannot wipe before the caller has it.
+        """
+        if self.max_size <= 0:
+            return KeySchedule(master_key)
+
+        cache_key = self._cache_key(master_key)
+        with self._lock:
+            schedule = self._entries.get(cache_key)
+            if schedule is not None:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                _count('schedule_cache_hits')
+                return schedule.copy() if copy else schedule
+            self.misses += 1
+            _count('schedule_cache_misses')
+
+        schedule = KeySchedule(master_key)
+        with self._lock:
+            # Another thread may have expanded the same key meanwhile.
+            existing = self._entries.get(cache_key)
+            if existing is not None:
+                schedule.wipe()
+                schedule = existing
+            self._entries[cache_key] = schedule
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)[1].wipe()
+            return schedule.copy() if copy else schedule
+
+    def specialized(self, master_key, schedule):
+        """
+        Returns the generated block functions for `master_key` (see
+        `KeySchedule.specialized`), shared through the cache entry. On a
+        miss they are compiled from `schedule`, the caller's private copy,
+        which a concurrent eviction cannot wipe halfway through.
+        """
+        cache_key = self._cache_key(master_key)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            functions = entry._specialized if entry is not None else None
+        if functions is None:
+            functions = schedule.specialized()
+            with self._lock:
+                entry = self._entries.get(cache_key)
+                if entry is not None:
+                    if entry._specialized is None:
+                        entry._specialized = functions
+                    functions = entry._specialized
+        return functions
+
+    def _cache_key(self, master_key):
+        return new_hmac(self._secret, master_key, 'sha256').digest()
+
+    def clear(self):
+        """ Wipes and drops every cached schedule. """
+        with self._lock:
+            for schedule in self._entries.values():
+                schedule.wipe()
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+schedule_cache = ScheduleCache()
+
+
+def _closed_block(block):
+    raise ValueError('AES instance is closed.')
+
+
 class AES:
     """
     Class for AES-128 encryption with CBC mode and PKCS#7.
@@ -179,13 +1204,113 @@ class AES:
     management. Unless you need that, please use `encrypt` and `decrypt`.
     """
     rounds_by_key_size = {16: 10, 24: 12, 32: 14}
-    def __init__(self, master_key):
+    engines = ('ttable', 'reference', 'specialized')
+    backends = ('auto', 'python', 'native', 'numpy')
+    # Smallest chunk handed to a parallel worker; smaller inputs stay serial.
+    parallel_chunk_size = 256 * 1024
+
+    def __init__(self, master_key, engine=None, backend='auto', workers=1):
         """
         Initializes the object with a given key.
+
+        `backend` chooses where the cipher runs: 'native' uses the compiled
+        rijndael code (see `native_context`), 'numpy' runs multi-block modes
+        vectorized over whole arrays (see `NumpyContext`), 'python' stays in
+        pure Python, and 'auto' (default) uses the native library when it can
+        be loaded, then NumPy when it is installed, and falls back to Python
+        otherwise.
+
+        `engine` selects the Python block round implementation: 'ttable'
+        (default) works on four 32-bit column words with precomputed
+        T-tables, while 'reference' runs the textbook byte-matrix
+        transformations and is kept as a readable baseline for testing.
+        'specialized' (opt-in) compiles T-table functions unrolled for this
+        key (see `specialize_block_cipher`); the one-off compile pays off
+        for long-lived keys and is cached with the key schedule. Engines
+        apply to the 'python' and 'numpy' backends only (NumPy still runs
+        single blocks and chained encryption in Python): naming one makes
+        'auto' skip the native library, and combining one with 'native' is
+        an error.
+
+        `workers` > 1 splits large CTR encryptions/decryptions and CBC
+        decryptions into block-aligned chunks processed concurrently: on a
+        thread pool for the native backend (which releases the GIL) and on
+        a process pool for the Python and NumPy backends. The output is
+        identical to the serial path.
         """
         assert len(master_key) in AES.rounds_by_key_size
+        assert engine is None or engine in AES.engines, 'Unknown engine {!r}'.format(engine)
+        assert backend in AES.backends, 'Unknown backend {!r}'.format(backend)
+        assert engine is None or backend != 'native', \
+            'Engine {!r} is a Python engine; it does not apply to the native backend.'.format(engine)
         self.n_rounds = AES.rounds_by_key_size[len(master_key)]
-        self._key_matrices = self._expand_key(master_key)
+        self.workers = workers
+        # Mutable, so that `close` can zero it.
+        self._master_key = bytearray(master_key)
+        if backend == 'auto':
+            if native_available() and engine is None:
+                backend = 'native'
+            elif load_numpy() is not None:
+                backend = 'numpy'
+            else:
+                backend = 'python'
+        self.backend = backend
+        self.engine = engine = None if backend == 'native' else engine or 'ttable'
+
+        metrics = _metrics
+        start = time.perf_counter() if metrics is not None else 0
+        # A private copy: the cached arrays are wiped when evicted, and this
+        # one when the instance is closed or collected.
+        self._schedule = schedule_cache.get(self._master_key, copy=True)
+        self._matrices = None
+        self._native = native_context(master_key) if backend == 'native' else None
+        # Single blocks and chained encryption still use the Python engine.
+        self._numpy = NumpyContext(self._key_matrices) if backend == 'numpy' else None
+        specialized = None
+        if engine == 'specialized' and self._native is None:
+            specialized = schedule_cache.specialized(self._master_key, self._schedule)
+        if metrics is not None:
+            metrics.record('key_schedule', time.perf_counter() - start, backend=backend)
+
+        if self._native is not None:
+            self._encrypt_block = self._native.encrypt_block
+            self._decrypt_block = self._native.decrypt_block
+        elif specialized is not None:
+            self._encrypt_block, self._decrypt_block = specialized
+        elif engine == 'ttable':
+            self._encrypt_block = self._encrypt_block_ttable
+            self._decrypt_block = self._decrypt_block_ttable
+        else:
+            self._encrypt_block = self._encrypt_block_reference
+            self._decrypt_block = self._decrypt_block_reference
+
+    def close(self):
+        """
+        Wipes the copy of the key and the round keys this instance holds
+        (and frees its native context); any later use raises ValueError.
+        Also done when the instance is garbage collected. The key object
+        passed to the constructor belongs to the caller and is not erased.
+        """
+        master_key = getattr(self, '_master_key', None)
+        if master_key is not None:
+            master_key[:] = bytes(len(master_key))
+        schedule = getattr(self, '_schedule', None)
+        if schedule is not None:
+            schedule.wipe()
+        self._matrices = None
+        self._numpy = None
+        self._encrypt_block = self._decrypt_block = _closed_block
+        if getattr(self, '_native', None) is not None:
+            self._native.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        self.close()
 
     def _expand_key(self, master_key):
         """
@@ -221,12 +1346,102 @@ class AES:
         # Group key words in 4x4 byte matrices.
         return [key_columns[4*i : 4*(i+1)] for i in range(len(key_columns) // 4)]
 
+    @property
+    def _key_matrices(self):
+        """
+        Round keys as 4x4 byte matrices, for the reference engine and the
+        NumPy backend. Expanded with the textbook `_expand_key` on first use.
+        """
+        if self._matrices is None:
+            self._matrices = self._expand_key(self._master_key)
+        return self._matrices
+
     def encrypt_block(self, plaintext):
         """
         Encrypts a single block of 16 byte long plaintext.
         """
         assert len(plaintext) == 16
+        return self._encrypt_block(plaintext)
+
+    def decrypt_block(self, ciphertext):
+        """
+        Decrypts a single block of 16 byte long ciphertext.
+        """
+        assert len(ciphertext) == 16
+        return self._decrypt_block(ciphertext)
 
+    def _encrypt_block_ttable(self, plaintext):
+        """
+        Encrypts a single block with 32-bit T-table lookups: each full round
+        is 16 table lookups and a handful of XORs.
+        """
+        # Round keys four words at a time, straight from the compact array.
+        round_keys = zip(*[iter(self._schedule.enc_words)] * 4)
+        k0, k1, k2, k3 = next(round_keys)
+        te0, te1, te2, te3 = Te0, Te1, Te2, Te3
+
+        s0, s1, s2, s3 = block_words.unpack(plaintext)
+        s0 ^= k0
+        s1 ^= k1
+        s2 ^= k2
+        s3 ^= k3
+
+        for _, (k0, k1, k2, k3) in zip(range(self.n_rounds - 1), round_keys):
+            s0, s1, s2, s3 = (
+                te0[s0 >> 24] ^ te1[(s1 >> 16) & 0xFF] ^ te2[(s2 >> 8) & 0xFF] ^ te3[s3 & 0xFF] ^ k0,
+                te0[s1 >> 24] ^ te1[(s2 >> 16) & 0xFF] ^ te2[(s3 >> 8) & 0xFF] ^ te3[s0 & 0xFF] ^ k1,
+                te0[s2 >> 24] ^ te1[(s3 >> 16) & 0xFF] ^ te2[(s0 >> 8) & 0xFF] ^ te3[s1 & 0xFF] ^ k2,
+                te0[s3 >> 24] ^ te1[(s0 >> 16) & 0xFF] ^ te2[(s1 >> 8) & 0xFF] ^ te3[s2 & 0xFF] ^ k3,
+            )
+
+        # Final round: SubBytes and ShiftRows only, no MixColumns.
+        k0, k1, k2, k3 = next(round_keys)
+        sb = s_box
+        return block_words.pack(
+            ((sb[s0 >> 24] << 24) | (sb[(s1 >> 16) & 0xFF] << 16) | (sb[(s2 >> 8) & 0xFF] << 8) | sb[s3 & 0xFF]) ^ k0,
+            ((sb[s1 >> 24] << 24) | (sb[(s2 >> 16) & 0xFF] << 16) | (sb[(s3 >> 8) & 0xFF] << 8) | sb[s0 & 0xFF]) ^ k1,
+            ((sb[s2 >> 24] << 24) | (sb[(s3 >> 16) & 0xFF] << 16) | (sb[(s0 >> 8) & 0xFF] << 8) | sb[s1 & 0xFF]) ^ k2,
+            ((sb[s3 >> 24] << 24) | (sb[(s0 >> 16) & 0xFF] << 16) | (sb[(s1 >> 8) & 0xFF] << 8) | sb[s2 & 0xFF]) ^ k3,
+        )
+
+    def _decrypt_block_ttable(self, ciphertext):
+        """
+        Decrypts a single block with 32-bit T-table lookups, using the
+        equivalent inverse cipher key schedule.
+        """
+        # Round keys four words at a time, straight from the compact array.
+        round_keys = zip(*[iter(self._schedule.dec_words)] * 4)
+        k0, k1, k2, k3 = next(round_keys)
+        td0, td1, td2, td3 = Td0, Td1, Td2, Td3
+
+        s0, s1, s2, s3 = block_words.unpack(ciphertext)
+        s0 ^= k0
+        s1 ^= k1
+        s2 ^= k2
+        s3 ^= k3
+
+        for _, (k0, k1, k2, k3) in zip(range(self.n_rounds - 1), round_keys):
+            s0, s1, s2, s3 = (
+                td0[s0 >> 24] ^ td1[(s3 >> 16) & 0xFF] ^ td2[(s2 >> 8) & 0xFF] ^ td3[s1 & 0xFF] ^ k0,
+                td0[s1 >> 24] ^ td1[(s0 >> 16) & 0xFF] ^ td2[(s3 >> 8) & 0xFF] ^ td3[s2 & 0xFF] ^ k1,
+                td0[s2 >> 24] ^ td1[(s1 >> 16) & 0xFF] ^ td2[(s0 >> 8) & 0xFF] ^ td3[s3 & 0xFF] ^ k2,
+                td0[s3 >> 24] ^ td1[(s2 >> 16) & 0xFF] ^ td2[(s1 >> 8) & 0xFF] ^ td3[s0 & 0xFF] ^ k3,
+            )
+
+        # Final round: InvSubBytes and InvShiftRows only, no InvMixColumns.
+        k0, k1, k2, k3 = next(round_keys)
+        isb = inv_s_box
+        return block_words.pack(
+            ((isb[s0 >> 24] << 24) | (isb[(s3 >> 16) & 0xFF] << 16) | (isb[(s2 >> 8) & 0xFF] << 8) | isb[s1 & 0xFF]) ^ k0,
+            ((isb[s1 >> 24] << 24) | (isb[(s0 >> 16) & 0xFF] << 16) | (isb[(s3 >> 8) & 0xFF] << 8) | isb[s2 & 0xFF]) ^ k1,
+            ((isb[s2 >> 24] << 24) | (isb[(s1 >> 16) & 0xFF] << 16) | (isb[(s0 >> 8) & 0xFF] << 8) | isb[s3 & 0xFF]) ^ k2,
+            ((isb[s3 >> 24] << 24) | (isb[(s2 >> 16) & 0xFF] << 16) | (isb[(s1 >> 8) & 0xFF] << 8) | isb[s0 & 0xFF]) ^ k3,
+        )
+
+    def _encrypt_block_reference(self, plaintext):
+        """
+        Encrypts a single block with the byte-matrix round functions.
+        """
         plain_state = bytes2matrix(plaintext)
 
         add_round_key(plain_state, self._key_matrices[0])
@@ -243,12 +1458,10 @@ class AES:
 
         return matrix2bytes(plain_state)
 
-    def decrypt_block(self, ciphertext):
+    def _decrypt_block_reference(self, ciphertext):
         """
-        Decrypts a single block of 16 byte long ciphertext.
+        Decrypts a single block with the byte-matrix round functions.
         """
-        assert len(ciphertext) == 16
-
         cipher_state = bytes2matrix(ciphertext)
 
         add_round_key(cipher_state, self._key_matrices[-1])
@@ -270,177 +1483,794 @@ class AES:
         Encrypts `plaintext` using CBC mode and PKCS#7 padding, with the given
         initialization vector (iv).
         """
-        assert len(iv) == 16
+        out = bytearray(padded_size(len(plaintext)))
+        self.encrypt_into('cbc', plaintext, iv, out)
+        return bytes(out)
 
-        plaintext = pad(plaintext)
+    @_timed('cbc')
+    def _encrypt_cbc_blocks(self, plaintext, iv, out=None):
+        """
+        CBC-encrypts whole blocks of already padded plaintext into `out`
+        (a new bytearray by default), which is returned.
+        """
+        assert len(plaintext) % 16 == 0
+        out = bytearray(len(plaintext)) if out is None else out
+        if self._native is not None:
+            return self._native.encrypt_cbc(plaintext, iv, out)
 
-        blocks = []
+        view = memoryview(plaintext).cast('B')
         previous = iv
-        for plaintext_block in split_blocks(plaintext):
+        for i in range(0, len(view), 16):
             # CBC mode encrypt: encrypt(plaintext_block XOR previous)
-            block = self.encrypt_block(xor_bytes(plaintext_block, previous))
-            blocks.append(block)
-            previous = block
-
-        return b''.join(blocks)
+            previous = self.encrypt_block(xor_bytes(view[i:i+16], previous))
+            out[i:i+16] = previous
+        return out
 
     def decrypt_cbc(self, ciphertext, iv):
         """
         Decrypts `ciphertext` using CBC mode and PKCS#7 padding, with the given
         initialization vector (iv).
         """
-        assert len(iv) == 16
+        out = bytearray(len(ciphertext))
+        del out[self.decrypt_into('cbc', ciphertext, iv, out):]
+        return bytes(out)
 
-        blocks = []
+    @_timed('cbc')
+    def _decrypt_cbc_blocks(self, ciphertext, iv, out=None):
+        """
+        CBC-decrypts whole blocks without removing the padding, into `out`
+        (a new bytearray by default), which is returned.
+        """
+        assert len(ciphertext) % 16 == 0
+        out = bytearray(len(ciphertext)) if out is None else out
+        if self._parallel('cbc', ciphertext, iv, out) is not None:
+            return out
+        if self._native is not None:
+            return self._native.decrypt_cbc(ciphertext, iv, out)
+        if self._numpy is not None:
+            out[:len(ciphertext)] = self._numpy.decrypt_cbc(ciphertext, iv)
+            return out
+
+        view = memoryview(ciphertext).cast('B')
         previous = iv
-        for ciphertext_block in split_blocks(ciphertext):
+        for i in range(0, len(view), 16):
             # CBC mode decrypt: previous XOR decrypt(ciphertext)
-            blocks.append(xor_bytes(previous, self.decrypt_block(ciphertext_block)))
-            previous = ciphertext_block
-
-        return unpad(b''.join(blocks))
+            block = bytes(view[i:i+16])
+            out[i:i+16] = xor_bytes(previous, self.decrypt_block(block))
+            previous = block
+        return out
 
     def encrypt_pcbc(self, plaintext, iv):
         """
         Encrypts `plaintext` using PCBC mode and PKCS#7 padding, with the given
         initialization vector (iv).
         """
-        assert len(iv) == 16
-
-        plaintext = pad(plaintext)
+        out = bytearray(padded_size(len(plaintext)))
+        self.encrypt_into('pcbc', plaintext, iv, out)
+        return bytes(out)
 
-        blocks = []
-        prev_ciphertext = iv
-        prev_plaintext = bytes(16)
-        for plaintext_block in split_blocks(plaintext):
+    @_timed('pcbc')
+    def _encrypt_pcbc_blocks(self, plaintext, prev_ciphertext, prev_plaintext, out=None):
+        """
+        PCBC-encrypts whole blocks of already padded plaintext into `out`,
+        continuing from the given previous ciphertext and plaintext blocks.
+        """
+        assert len(plaintext) % 16 == 0
+        out = bytearray(len(plaintext)) if out is None else out
+        view = memoryview(plaintext).cast('B')
+        for i in range(0, len(view), 16):
             # PCBC mode encrypt: encrypt(plaintext_block XOR (prev_ciphertext XOR prev_plaintext))
-            ciphertext_block = self.encrypt_block(xor_bytes(plaintext_block, xor_bytes(prev_ciphertext, prev_plaintext)))
-            blocks.append(ciphertext_block)
-            prev_ciphertext = ciphertext_block
+            plaintext_block = bytes(view[i:i+16])
+            prev_ciphertext = self.encrypt_block(xor_bytes(plaintext_block, xor_bytes(prev_ciphertext, prev_plaintext)))
+            out[i:i+16] = prev_ciphertext
             prev_plaintext = plaintext_block
-
-        return b''.join(blocks)
+        return out
 
     def decrypt_pcbc(self, ciphertext, iv):
         """
         Decrypts `ciphertext` using PCBC mode and PKCS#7 padding, with the given
         initialization vector (iv).
         """
-        assert len(iv) == 16
+        out = bytearray(len(ciphertext))
+        del out[self.decrypt_into('pcbc', ciphertext, iv, out):]
+        return bytes(out)
 
-        blocks = []
-        prev_ciphertext = iv
-        prev_plaintext = bytes(16)
-        for ciphertext_block in split_blocks(ciphertext):
+    @_timed('pcbc')
+    def _decrypt_pcbc_blocks(self, ciphertext, prev_ciphertext, prev_plaintext, out=None):
+        """
+        PCBC-decrypts whole blocks without removing the padding into `out`,
+        continuing from the given previous ciphertext and plaintext blocks.
+        """
+        assert len(ciphertext) % 16 == 0
+        out = bytearray(len(ciphertext)) if out is None else out
+        view = memoryview(ciphertext).cast('B')
+        for i in range(0, len(view), 16):
             # PCBC mode decrypt: (prev_plaintext XOR prev_ciphertext) XOR decrypt(ciphertext_block)
-            plaintext_block = xor_bytes(xor_bytes(prev_ciphertext, prev_plaintext), self.decrypt_block(ciphertext_block))
-            blocks.append(plaintext_block)
+            ciphertext_block = bytes(view[i:i+16])
+            prev_plaintext = xor_bytes(xor_bytes(prev_ciphertext, prev_plaintext), self.decrypt_block(ciphertext_block))
+            out[i:i+16] = prev_plaintext
             prev_ciphertext = ciphertext_block
-            prev_plaintext = plaintext_block
-
-        return unpad(b''.join(blocks))
+        return out
 
     def encrypt_cfb(self, plaintext, iv):
         """
         Encrypts `plaintext` with the given initialization vector (iv).
         """
-        assert len(iv) == 16
+        out = bytearray(len(plaintext))
+        self.encrypt_into('cfb', plaintext, iv, out)
+        return bytes(out)
 
-        blocks = []
+    @_timed('cfb')
+    def _encrypt_cfb_into(self, plaintext, iv, out):
+        view = memoryview(plaintext).cast('B')
         prev_ciphertext = iv
-        for plaintext_block in split_blocks(plaintext, require_padding=False):
+        for i in range(0, len(view), 16):
             # CFB mode encrypt: plaintext_block XOR encrypt(prev_ciphertext)
-            ciphertext_block = xor_bytes(plaintext_block, self.encrypt_block(prev_ciphertext))
-            blocks.append(ciphertext_block)
-            prev_ciphertext = ciphertext_block
-
-        return b''.join(blocks)
+            prev_ciphertext = xor_bytes(view[i:i+16], self.encrypt_block(prev_ciphertext))
+            out[i:i+len(prev_ciphertext)] = prev_ciphertext
 
     def decrypt_cfb(self, ciphertext, iv):
         """
         Decrypts `ciphertext` with the given initialization vector (iv).
         """
+        out = bytearray(len(ciphertext))
+        self.decrypt_into('cfb', ciphertext, iv, out)
+        return bytes(out)
+
+    @_timed('cfb')
+    def _decrypt_cfb_into(self, ciphertext, iv, out):
+        if self._numpy is not None:
+            out[:len(ciphertext)] = self._numpy.decrypt_cfb(ciphertext, iv)
+            return
+
+        # CFB mode decrypt: ciphertext XOR encrypt(prev_ciphertext). All the
+        # cipher inputs are known up front, so they are encrypted as a batch.
+        view = memoryview(ciphertext).cast('B')
+        n_blocks = (len(view) + 15) // 16
+        inputs = (bytes(iv) + bytes(view[:16 * (n_blocks - 1)]))[:16 * n_blocks]
+        out[:len(view)] = xor_bytes(view, self._encrypt_blocks(inputs))
+
+    def encrypt_into(self, mode, plaintext, iv, out):
+        """
+        Encrypts `plaintext` with `mode` (one of `stream_modes`) directly into
+        the writable buffer `out` (a bytearray, an mmap of the output file,
+        ...) and returns the number of bytes written. Padded modes ('cbc',
+        'pcbc') need room for `padded_size(len(plaintext))` bytes, the others
+        for `len(plaintext)`. Only the final block is padded, so the input
+        is never copied as a whole.
+        """
+        assert mode in AES.stream_modes, 'Unknown mode {!r}'.format(mode)
+        assert len(iv) == 16
+        view = memoryview(plaintext).cast('B')
+        out = memoryview(out).cast('B')
+        size = padded_size(len(view)) if mode in ('cbc', 'pcbc') else len(view)
+        assert len(out) >= size, 'Output buffer is too small.'
+
+        full = len(view) // 16 * 16
+        if mode in ('cbc', 'pcbc'):
+            # Read before `out` (which may alias the input) is written.
+            final_block = self._pad_final_block(view)
+        if mode == 'cbc':
+            self._encrypt_cbc_blocks(view[:full], iv, out[:full])
+            previous = bytes(out[full-16:full]) if full else iv
+            self._encrypt_cbc_blocks(final_block, previous, out[full:size])
+        elif mode == 'pcbc':
+            prev_plaintext = bytes(view[full-16:full]) if full else bytes(16)
+            self._encrypt_pcbc_blocks(view[:full], iv, bytes(16), out[:full])
+            prev_ciphertext = bytes(out[full-16:full]) if full else iv
+            self._encrypt_pcbc_blocks(final_block, prev_ciphertext, prev_plaintext, out[full:size])
+        elif mode == 'cfb':
+            self._encrypt_cfb_into(view, iv, out)
+        elif mode == 'ofb':
+            self._crypt_ofb_into(view, iv, out)
+        else:
+            self._crypt_ctr(view, Counter(iv), out)
+        return size
+
+    def decrypt_into(self, mode, ciphertext, iv, out):
+        """
+        Decrypts `ciphertext` with `mode` directly into the writable buffer
+        `out`, which needs room for `len(ciphertext)` bytes, and returns the
+        length of the plaintext. For padded modes the padding is checked and
+        left in the buffer after the returned length.
+        """
+        assert mode in AES.stream_modes, 'Unknown mode {!r}'.format(mode)
         assert len(iv) == 16
+        view = memoryview(ciphertext).cast('B')
+        out = memoryview(out).cast('B')
+        assert len(out) >= len(view), 'Output buffer is too small.'
+
+        if mode in ('cbc', 'pcbc'):
+            assert len(view) >= 16 and len(view) % 16 == 0, 'Ciphertext must be made of full 16-byte blocks.'
+            if mode == 'cbc':
+                self._decrypt_cbc_blocks(view, iv, out[:len(view)])
+            else:
+                self._decrypt_pcbc_blocks(view, iv, bytes(16), out[:len(view)])
+            return self._unpadded_length(out, len(view))
+        if mode == 'cfb':
+            self._decrypt_cfb_into(view, iv, out)
+        elif mode == 'ofb':
+            self._crypt_ofb_into(view, iv, out)
+        else:
+            self._crypt_ctr(view, Counter(iv), out)
+        return len(view)
+
+    def _pad_final_block(self, view):
+        """ `pad_final_block`, timed as the 'padding' phase. """
+        metrics = _metrics
+        start = time.perf_counter() if metrics is not None else 0
+        final_block = pad_final_block(view)
+        if metrics is not None:
+            metrics.record('padding', time.perf_counter() - start, backend=self.backend)
+        return final_block
+
+    def _unpadded_length(self, out, length):
+        """ `unpadded_length`, timed as the 'padding' phase. """
+        metrics = _metrics
+        start = time.perf_counter() if metrics is not None else 0
+        length = unpadded_length(out, length)
+        if metrics is not None:
+            metrics.record('padding', time.perf_counter() - start, backend=self.backend)
+        return length
+
+    # Blocks of keystream generated per batch by the pure-Python CTR path.
+    keystream_batch_blocks = 4096
+
+    @_timed('ofb', lambda iv, n_bytes: n_bytes)
+    def ofb_keystream(self, iv, n_bytes):
+        """
+        Returns the first `n_bytes` of the OFB keystream for `iv`: E(iv),
+        E(E(iv)), ... OFB is serial, but natively the whole keystream is one
+        CBC encryption of zero blocks.
+        """
+        n_blocks = (n_bytes + 15) // 16
+        if self._native is not None:
+            return bytes(self._native.encrypt_cbc(bytes(16 * n_blocks), iv))[:n_bytes]
 
         blocks = []
-        prev_ciphertext = iv
-        for ciphertext_block in split_blocks(ciphertext, require_padding=False):
-            # CFB mode decrypt: ciphertext XOR decrypt(prev_ciphertext)
-            plaintext_block = xor_bytes(ciphertext_block, self.encrypt_block(prev_ciphertext))
-            blocks.append(plaintext_block)
-            prev_ciphertext = ciphertext_block
+        block = iv
+        for _ in range(n_blocks):
+            block = self.encrypt_block(block)
+            blocks.append(block)
+        return b''.join(blocks)[:n_bytes]
 
-        return b''.join(blocks)
+    def _crypt_ofb_into(self, data, iv, out):
+        # OFB mode: data XOR keystream
+        out[:len(data)] = xor_bytes(data, self.ofb_keystream(iv, len(data)))
 
     def encrypt_ofb(self, plaintext, iv):
         """
         Encrypts `plaintext` using OFB mode initialization vector (iv).
         """
-        assert len(iv) == 16
-
-        blocks = []
-        previous = iv
-        for plaintext_block in split_blocks(plaintext, require_padding=False):
-            # OFB mode encrypt: plaintext_block XOR encrypt(previous)
-            block = self.encrypt_block(previous)
-            ciphertext_block = xor_bytes(plaintext_block, block)
-            blocks.append(ciphertext_block)
-            previous = block
-
-        return b''.join(blocks)
+        out = bytearray(len(plaintext))
+        self.encrypt_into('ofb', plaintext, iv, out)
+        return bytes(out)
 
     def decrypt_ofb(self, ciphertext, iv):
         """
         Decrypts `ciphertext` using OFB mode initialization vector (iv).
         """
+        out = bytearray(len(ciphertext))
+        self.decrypt_into('ofb', ciphertext, iv, out)
+        return bytes(out)
+
+    def ctr_keystream(self, counter, n_bytes):
+        """
+        Returns `n_bytes` of CTR keystream for the `Counter` `counter`,
+        advancing it by the number of blocks used.
+        """
+        out = bytearray(n_bytes)
+        self._crypt_ctr(out, counter, out)
+        return bytes(out)
+
+    @_timed('ctr')
+    def _crypt_ctr(self, data, counter, out):
+        """
+        CTR encryption/decryption of `data` into `out`, starting at `counter`,
+        which is advanced past the blocks used. The counter space is split
+        where its low bits wrap, so every segment can run on the 128-bit bulk
+        paths.
+        """
+        data = memoryview(data).cast('B')
+        out = memoryview(out).cast('B')
+        offset = 0
+        while offset < len(data):
+            end = min(len(data), offset + 16 * counter.until_wrap())
+            segment, target, start = data[offset:end], out[offset:end], counter.block()
+            counter.advance((end - offset + 15) // 16)
+            offset = end
+
+            if self._parallel('ctr', segment, start, target) is not None:
+                continue
+            elif self._native is not None:
+                self._native.crypt_ctr(segment, start, target)
+            elif self._numpy is not None:
+                target[:] = self._numpy.crypt_ctr(segment, start)
+            else:
+                # Batches of whole keystream blocks, each XORed in one go.
+                segment_counter = Counter(start)
+                step = 16 * self.keystream_batch_blocks
+                for i in range(0, len(segment), step):
+                    chunk = segment[i:i + step]
+                    blocks = segment_counter.take((len(chunk) + 15) // 16)
+                    keystream = b''.join(self.encrypt_block(block) for block in split_blocks(blocks))
+                    target[i:i + len(chunk)] = xor_bytes(chunk, keystream)
+        return out
+
+    def encrypt_ctr(self, plaintext, iv, counter_width=128):
+        """
+        Encrypts `plaintext` using CTR mode with the given nounce/IV. Only
+        the low `counter_width` bits of the IV are incremented (see
+        `Counter`).
+        """
         assert len(iv) == 16
+        out = bytearray(len(plaintext))
+        self._crypt_ctr(plaintext, Counter(iv, counter_width), out)
+        return bytes(out)
 
-        blocks = []
-        previous = iv
-        for ciphertext_block in split_blocks(ciphertext, require_padding=False):
-            # OFB mode decrypt: ciphertext XOR encrypt(previous)
-            block = self.encrypt_block(previous)
-            plaintext_block = xor_bytes(ciphertext_block, block)
-            blocks.append(plaintext_block)
-            previous = block
+    def decrypt_ctr(self, ciphertext, iv, counter_width=128):
+        """
+        Decrypts `ciphertext` using CTR mode with the given nounce/IV.
+        """
+        return self.encrypt_ctr(ciphertext, iv, counter_width)
 
-        return b''.join(blocks)
+    @_timed('ecb', lambda blocks: 16 * len(blocks) if isinstance(blocks, list) else len(blocks))
+    def encrypt_blocks(self, blocks):
+        """
+        Encrypts independent 16-byte blocks (ECB) in one call. `blocks` is a
+        list of blocks, returned as a list, or a buffer of whole blocks,
+        returned as bytes.
+        """
+        if isinstance(blocks, list):
+            return split_blocks(self._encrypt_blocks(b''.join(blocks)))
+        return self._encrypt_blocks(blocks)
+
+    def _encrypt_blocks(self, blocks):
+        if self._native is not None:
+            return bytes(self._native.encrypt_ecb(blocks))
+        if self._numpy is not None:
+            return self._numpy.encrypt_ecb(blocks)
+        return b''.join(self.encrypt_block(block) for block in split_blocks(bytes(blocks)))
+
+    @_timed('ecb', lambda blocks: 16 * len(blocks) if isinstance(blocks, list) else len(blocks))
+    def decrypt_blocks(self, blocks):
+        """
+        Decrypts independent 16-byte blocks (ECB), the inverse of
+        `encrypt_blocks`.
+        """
+        if isinstance(blocks, list):
+            return split_blocks(self._decrypt_blocks(b''.join(blocks)))
+        return self._decrypt_blocks(blocks)
 
-    def encrypt_ctr(self, plaintext, iv):
+    def _decrypt_blocks(self, blocks):
+        if self._native is not None:
+            return bytes(self._native.decrypt_ecb(blocks))
+        if self._numpy is not None:
+            return self._numpy.decrypt_ecb(blocks)
+        return b''.join(self.decrypt_block(block) for block in split_blocks(bytes(blocks)))
+
+    gcm_tag_lengths = (4, 8, 12, 13, 14, 15, 16)
+
+    def _gcm_start(self, iv):
         """
-        Encrypts `plaintext` using CTR mode with the given nounce/IV.
+        Returns the GHASH object and the pre-counter block J0 for `iv`.
         """
-        assert len(iv) == 16
+        assert len(iv) > 0, 'GCM requires a non-empty IV.'
+        h = self.encrypt_block(bytes(16))
+        ghash = native_ghash(h) if self._native is not None else GHash(h)
+        if len(iv) == 12:
+            return ghash, bytes(iv) + b'\x00\x00\x00\x01'
+
+        iv_hash = native_ghash(h) if self._native is not None else GHash(h)
+        iv_hash.update(iv)
+        iv_hash.update(bytes(8) + (8 * len(iv)).to_bytes(8, 'big'))
+        return ghash, iv_hash.digest()
+
+    def _gcm_ctr(self, data, j0):
+        """
+        GCM's CTR pass: starts at inc32(J0) and increments only the low 32
+        bits of the counter.
+        """
+        counter = Counter(j0, 32)
+        counter.advance(1)
+        out = bytearray(len(data))
+        self._crypt_ctr(data, counter, out)
+        return bytes(out)
+
+    @_timed('ghash', lambda ghash, j0, aad, ciphertext, tag_length: len(aad) + len(ciphertext))
+    def _gcm_tag(self, ghash, j0, aad, ciphertext, tag_length):
+        ghash.update(aad)
+        ghash.update(ciphertext)
+        ghash.update((8 * len(aad)).to_bytes(8, 'big') + (8 * len(ciphertext)).to_bytes(8, 'big'))
+        return xor_bytes(self.encrypt_block(j0), ghash.digest())[:tag_length]
+
+    @_timed('gcm')
+    def encrypt_gcm(self, plaintext, iv, aad=b'', tag_length=16):
+        """
+        Encrypts `plaintext` with GCM (NIST SP 800-38D), authenticating it
+        together with the additional data `aad`, and returns the ciphertext
+        followed by a `tag_length`-byte tag. A 12-byte IV is recommended and
+        must never be reused with the same key.
+        """
+        assert tag_length in AES.gcm_tag_lengths, 'Unsupported tag length {}'.format(tag_length)
+        ghash, j0 = self._gcm_start(iv)
+        ciphertext = self._gcm_ctr(plaintext, j0)
+        return ciphertext + self._gcm_tag(ghash, j0, aad, ciphertext, tag_length)
 
-        blocks = []
-        nonce = iv
-        for plaintext_block in split_blocks(plaintext, require_padding=False):
-            # CTR mode encrypt: plaintext_block XOR encrypt(nonce)
-            block = xor_bytes(plaintext_block, self.encrypt_block(nonce))
-            blocks.append(block)
-            nonce = inc_bytes(nonce)
+    @_timed('gcm')
+    def decrypt_gcm(self, ciphertext, iv, aad=b'', tag_length=16):
+        """
+        Verifies and decrypts the output of `encrypt_gcm`. Nothing is
+        decrypted unless the tag matches.
+        """
+        assert tag_length in AES.gcm_tag_lengths, 'Unsupported tag length {}'.format(tag_length)
+        assert len(ciphertext) >= tag_length, 'Ciphertext too short.'
+        ciphertext, tag = ciphertext[:len(ciphertext) - tag_length], ciphertext[len(ciphertext) - tag_length:]
+        ghash, j0 = self._gcm_start(iv)
+        expected_tag = self._gcm_tag(ghash, j0, aad, ciphertext, tag_length)
+        assert compare_digest(tag, expected_tag), 'Ciphertext corrupted or tampered.'
+        return self._gcm_ctr(ciphertext, j0)
 
-        return b''.join(blocks)
+    stream_modes = ('cbc', 'pcbc', 'cfb', 'ofb', 'ctr')
 
-    def decrypt_ctr(self, ciphertext, iv):
+    def encryptor(self, mode, iv):
         """
-        Decrypts `ciphertext` using CTR mode with the given nounce/IV.
+        Returns a `StreamCipher` that encrypts with `mode` (one of
+        `stream_modes`) incrementally: feed chunks of any size to `update`
+        and call `finalize` once at the end. The concatenated output equals
+        `encrypt_<mode>(whole_message, iv)`, in constant memory.
         """
+        assert mode in AES.stream_modes, 'Unknown mode {!r}'.format(mode)
         assert len(iv) == 16
+        return _stream_classes[mode](self, iv, decrypt=False)
 
-        blocks = []
-        nonce = iv
-        for ciphertext_block in split_blocks(ciphertext, require_padding=False):
-            # CTR mode decrypt: ciphertext XOR encrypt(nonce)
-            block = xor_bytes(ciphertext_block, self.encrypt_block(nonce))
-            blocks.append(block)
-            nonce = inc_bytes(nonce)
+    def decryptor(self, mode, iv):
+        """
+        Returns a `StreamCipher` that decrypts with `mode` incrementally; the
+        counterpart of `encryptor`.
+        """
+        assert mode in AES.stream_modes, 'Unknown mode {!r}'.format(mode)
+        assert len(iv) == 16
+        return _stream_classes[mode](self, iv, decrypt=True)
 
-        return b''.join(blocks)
+    def _parallel(self, mode, data, iv, out):
+        """
+        Runs CTR ('ctr') or raw CBC decryption ('cbc') of `data` into `out`
+        as one block-aligned chunk per worker and returns `out`, or None if
+        parallelism is disabled or the input is too small to split.
+
+        Each chunk only needs its own starting value: CTR chunks start at the
+        counter advanced by the chunk's block offset, and CBC chunks use the
+        ciphertext block just before them as their IV.
+        """
+        if self.workers <= 1 or len(data) < 2 * self.parallel_chunk_size:
+            return None
+        if mode == 'cbc':
+            assert len(data) % 16 == 0
+
+        n_blocks = (len(data) + 15) // 16
+        chunk_blocks = max(self.parallel_chunk_size // 16, -(-n_blocks // self.workers))
+        bounds = [(16 * start, min(len(data), 16 * (start + chunk_blocks)))
+                  for start in range(0, n_blocks, chunk_blocks)]
+
+        view = memoryview(data).cast('B')
+        out_view = memoryview(out).cast('B')
+        counter = int.from_bytes(iv, 'big')
+        ivs = []
+        for start, _ in bounds:
+            if mode == 'ctr':
+                ivs.append(((counter + start // 16) % (1 << 128)).to_bytes(16, 'big'))
+            else:
+                ivs.append(iv if start == 0 else bytes(view[start-16:start]))
+
+        if self._native is not None:
+            # Native calls release the GIL, so threads write their chunk of
+            # the output buffer in place, concurrently.
+            function = self._native.crypt_ctr if mode == 'ctr' else self._native.decrypt_cbc
+            executor = get_executor('thread', self.workers)
+            futures = [executor.submit(function, view[start:end], chunk_iv, out_view[start:end])
+                       for (start, end), chunk_iv in zip(bounds, ivs)]
+            for future in futures:
+                future.result()
+            return out
+
+        executor = get_executor('process', self.workers)
+        futures = [executor.submit(_parallel_chunk, self._master_key, self.engine, self.backend, mode, bytes(view[start:end]), chunk_iv)
+                   for (start, end), chunk_iv in zip(bounds, ivs)]
+        for (start, end), future in zip(bounds, futures):
+            out_view[start:end] = future.result()
+        return out
+
+
+class StreamCipher:
+    """
+    Incremental encryptor or decryptor for one message, created by
+    `AES.encryptor` / `AES.decryptor`. It carries the chaining state (IV,
+    counter, previous blocks, keystream offset and any pending partial block)
+    between `update` calls, so only a block or two is ever buffered.
+    """
+    def __init__(self, aes, iv, decrypt):
+        self._aes = aes
+        self._iv = bytes(iv)
+        self._decrypt = decrypt
+        self._pending = bytearray()
+        self._finalized = False
+
+    def update(self, data):
+        """
+        Processes the next chunk and returns whatever output is ready.
+        """
+        assert not self._finalized, 'Cipher already finalized.'
+        return self._update(data)
+
+    def finalize(self):
+        """
+        Processes any buffered data (applying or checking PKCS#7 padding for
+        the padded modes) and returns the last piece of output.
+        """
+        assert not self._finalized, 'Cipher already finalized.'
+        self._finalized = True
+        return self._finalize()
+
+    def _finalize(self):
+        return b''
+
+
+class _PaddedStream(StreamCipher):
+    """
+    Shared buffering for the padded block modes (CBC and PCBC): only whole
+    blocks are processed, and a decryptor always holds back the last block
+    until `finalize` so the padding can be removed.
+    """
+    def _update(self, data):
+        self._pending += data
+        ready = len(self._pending) // 16 * 16
+        if self._decrypt and ready == len(self._pending):
+            ready -= 16
+        if ready <= 0:
+            return b''
+        blocks = bytes(self._pending[:ready])
+        del self._pending[:ready]
+        return self._process(blocks)
+
+    def _finalize(self):
+        if self._decrypt:
+            assert len(self._pending) == 16, 'Ciphertext must be made of full 16-byte blocks.'
+            return unpad(self._process(bytes(self._pending)))
+        return self._process(pad(bytes(self._pending)))
+
+
+class _CBCStream(_PaddedStream):
+    def _process(self, blocks):
+        if self._decrypt:
+            out = bytes(self._aes._decrypt_cbc_blocks(blocks, self._iv))
+            self._iv = blocks[-16:]
+        else:
+            out = bytes(self._aes._encrypt_cbc_blocks(blocks, self._iv))
+            self._iv = out[-16:]
+        return out
+
+
+class _PCBCStream(_PaddedStream):
+    def __init__(self, aes, iv, decrypt):
+        super().__init__(aes, iv, decrypt)
+        self._prev_plaintext = bytes(16)
+
+    def _process(self, blocks):
+        if self._decrypt:
+            out = bytes(self._aes._decrypt_pcbc_blocks(blocks, self._iv, self._prev_plaintext))
+            self._iv, self._prev_plaintext = blocks[-16:], out[-16:]
+        else:
+            out = bytes(self._aes._encrypt_pcbc_blocks(blocks, self._iv, self._prev_plaintext))
+            self._iv, self._prev_plaintext = out[-16:], blocks[-16:]
+        return out
+
+
+class _KeystreamStream(StreamCipher):
+    """
+    Shared logic for the CFB and CTR stream modes. Whole blocks go
+    through the corresponding bulk `AES` mode method; a trailing partial
+    block is XORed with a freshly generated keystream block whose unused
+    bytes are kept for the next call, so output is never delayed.
+    """
+    def __init__(self, aes, iv, decrypt):
+        super().__init__(aes, iv, decrypt)
+        self._keystream = b''
+
+    def _update(self, data):
+        out = bytearray()
+        data = memoryview(data).cast('B')
+
+        # Finish the current block with the leftover keystream.
+        if self._keystream:
+            n = min(len(self._keystream), len(data))
+            out += self._xor_partial(data[:n])
+            data = data[n:]
+
+        full = len(data) // 16 * 16
+        if full:
+            out += self._process(bytes(data[:full]))
+            data = data[full:]
+
+        if len(data):
+            self._keystream = self._next_keystream()
+            out += self._xor_partial(data)
+        return bytes(out)
+
+    def _xor_partial(self, data):
+        """ XORs `data` with the start of the pending keystream. """
+        n = len(data)
+        out = xor_bytes(data, self._keystream[:n])
+        self._keystream = self._keystream[n:]
+        self._absorb(bytes(data), out)
+        return out
+
+    def _absorb(self, data, out):
+        """ Hook for modes whose feedback depends on partial-block output. """
+
+
+class _CTRStream(_KeystreamStream):
+    def _process(self, blocks):
+        out = self._aes.encrypt_ctr(blocks, self._iv)
+        self._advance(len(blocks) // 16)
+        return out
+
+    def _advance(self, n_blocks):
+        counter = (int.from_bytes(self._iv, 'big') + n_blocks) % (1 << 128)
+        self._iv = counter.to_bytes(16, 'big')
+
+    def _next_keystream(self):
+        block = self._aes.encrypt_block(self._iv)
+        self._advance(1)
+        return block
+
+
+class _OFBStream(StreamCipher):
+    def __init__(self, aes, iv, decrypt):
+        super().__init__(aes, iv, decrypt)
+        self._keystream = OFBKeystream(aes, iv)
+
+    def precompute(self, n_bytes):
+        """ Generates keystream for the next `n_bytes` before they arrive. """
+        self._keystream.precompute(n_bytes)
+
+    def _update(self, data):
+        return self._keystream.xor(data)
+
+
+class _CFBStream(_KeystreamStream):
+    def __init__(self, aes, iv, decrypt):
+        super().__init__(aes, iv, decrypt)
+        self._feedback = bytearray()
+
+    def _process(self, blocks):
+        if self._decrypt:
+            out = self._aes.decrypt_cfb(blocks, self._iv)
+            self._iv = blocks[-16:]
+        else:
+            out = self._aes.encrypt_cfb(blocks, self._iv)
+            self._iv = out[-16:]
+        return out
+
+    def _next_keystream(self):
+        return self._aes.encrypt_block(self._iv)
+
+    def _absorb(self, data, out):
+        # The next keystream block needs this block's complete ciphertext.
+        self._feedback += data if self._decrypt else out
+        if len(self._feedback) == 16:
+            self._iv = bytes(self._feedback)
+            self._feedback.clear()
+
+
+_stream_classes = {
+    'cbc': _CBCStream,
+    'pcbc': _PCBCStream,
+    'cfb': _CFBStream,
+    'ofb': _OFBStream,
+    'ctr': _CTRStream,
+}
+
+
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+def get_executor(kind, workers):
+    """
+    Returns a shared 'thread' or 'process' pool with `workers` workers,
+    creating it on first use so that repeated calls do not pay the pool
+    start-up cost again.
+    """
+    key = (kind, workers)
+    with _executors_lock:
+        if key not in _executors:
+            pool_class = ThreadPoolExecutor if kind == 'thread' else ProcessPoolExecutor
+            _executors[key] = pool_class(max_workers=workers)
+        return _executors[key]
+
+def _parallel_chunk(master_key, engine, backend, mode, chunk, iv):
+    """
+    Process pool worker: runs one chunk of a parallel CTR or CBC decryption
+    with the pure-Python or NumPy backend.
+    """
+    aes = AES(master_key, engine, backend)
+    if mode == 'ctr':
+        return aes.encrypt_ctr(chunk, iv)
+    return bytes(aes._decrypt_cbc_blocks(chunk, iv))
+
+
+def encrypt_multibuffer(jobs, mode='cbc', backend='auto'):
+    """
+    Encrypts many independent messages with CBC (or 'pcbc') and PKCS#7
+    padding, each exactly as `AES(key).encrypt_<mode>(plaintext, iv)`, and
+    returns the list of ciphertexts. `jobs` is an iterable of
+    (key, iv, plaintext), where key is a raw key or an `AES` instance (which
+    keeps its own backend; raw keys use `backend`).
+
+    One message is serial, so the messages advance one block at a time in
+    lock-step instead: natively as interleaved AES-NI lanes, one C call for
+    all of them; otherwise the current blocks of every message under the
+    same key go through one `encrypt_blocks` batch per step, which the NumPy
+    backend vectorizes. Messages of any (unequal) lengths can be mixed.
+    """
+    assert mode in ('cbc', 'pcbc'), 'Unknown multi-buffer mode {!r}'.format(mode)
+    ciphers, ivs, views = [], [], []
+    by_key = {}
+    for key, iv, plaintext in jobs:
+        if not isinstance(key, AES):
+            key = bytes(key)
+            if key not in by_key:
+                by_key[key] = AES(key, backend=backend)
+            key = by_key[key]
+        assert len(iv) == 16
+        ciphers.append(key)
+        ivs.append(bytes(iv))
+        views.append(memoryview(plaintext).cast('B'))
+
+    # Padded copies of the messages, native lanes first, in one buffer that
+    # is then encrypted in place.
+    order = sorted(range(len(ciphers)), key=lambda i: ciphers[i]._native is None)
+    n_native = sum(1 for cipher in ciphers if cipher._native is not None)
+    bounds = [0]
+    for i in order:
+        bounds.append(bounds[-1] + padded_size(len(views[i])))
+    buffer = bytearray(bounds[-1])
+    for lane, i in enumerate(order):
+        full = len(views[i]) // 16 * 16
+        buffer[bounds[lane]:bounds[lane] + full] = views[i][:full]
+        buffer[bounds[lane] + full:bounds[lane + 1]] = pad_final_block(views[i])
+
+    if n_native:
+        chaining = bytearray(b''.join(ivs[i] for i in order[:n_native]))
+        contexts = [ciphers[i]._native for i in order[:n_native]]
+        native_cbc_encrypt_multi(contexts, chaining, buffer, bounds[:n_native + 1], mode == 'pcbc')
+
+    groups = {}
+    for lane in range(n_native, len(order)):
+        groups.setdefault(id(ciphers[order[lane]]), []).append(lane)
+    for lanes in groups.values():
+        cipher = ciphers[order[lanes[0]]]
+        lanes.sort(key=lambda lane: bounds[lane + 1] - bounds[lane], reverse=True)
+        chains = [ivs[order[lane]] for lane in lanes]
+        active = len(lanes)
+        for step in range((bounds[lanes[0] + 1] - bounds[lanes[0]]) // 16):
+            # Longest first, so the lanes still running are a prefix.
+            while bounds[lanes[active - 1] + 1] - bounds[lanes[active - 1]] <= 16 * step:
+                active -= 1
+            offsets = [bounds[lane] + 16 * step for lane in lanes[:active]]
+            plain = [bytes(buffer[offset:offset + 16]) for offset in offsets]
+            encrypted = cipher._encrypt_blocks(b''.join(xor_bytes(p, c) for p, c in zip(plain, chains)))
+            for k, offset in enumerate(offsets):
+                block = encrypted[16 * k:16 * (k + 1)]
+                buffer[offset:offset + 16] = block
+                chains[k] = xor_bytes(block, plain[k]) if mode == 'pcbc' else block
+
+    lane_of = {i: lane for lane, i in enumerate(order)}
+    return [bytes(buffer[bounds[lane_of[i]]:bounds[lane_of[i] + 1]]) for i in range(len(ciphers))]
 
 
-from cProfile import run
-import os
 from hashlib import pbkdf2_hmac
 from hmac import new as new_hmac, compare_digest
 
@@ -451,19 +2281,150 @@ IV_SIZE = 16
 SALT_SIZE = 16
 HMAC_SIZE = 32
 
-def get_key_iv(password, salt, workload=100000):
+class KeyCache:
+    """
+    Thread-safe LRU cache of `get_key_iv` results, so repeated operations with
+    the same password and salt skip PBKDF2. Entries expire `ttl` seconds after
+    they are derived (never if `ttl` is None) and at most `max_size` are kept.
+
+    Entries are looked up by an HMAC of the password, salt and workload under
+    a random per-cache key, so the cache never holds the passwords themselves.
+    """
+    def __init__(self, max_size=128, ttl=300.0):
+        assert max_size > 0, 'Cache size must be positive.'
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._secret = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cache_key(self, password, salt, workload):
+        hmac = new_hmac(self._secret, digestmod='sha256')
+        for part in (password, salt, workload.to_bytes(8, 'big')):
+            hmac.update(len(part).to_bytes(8, 'big'))
+            hmac.update(part)
+        return hmac.digest()
+
+    def get_key_iv(self, password, salt, workload=100000):
+        """ Returns `get_key_iv(password, salt, workload)`, cached. """
+        cache_key = self._cache_key(password, salt, workload)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and (self.ttl is None or time.monotonic() < entry[0]):
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                _count('key_cache_hits')
+                return entry[1]
+            self.misses += 1
+            _count('key_cache_misses')
+
+        # Derive outside the lock so a slow miss does not block other threads.
+        derived = get_key_iv(password, salt, workload)
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[cache_key] = (expires, derived)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return derived
+
+    def invalidate(self, password, salt, workload=100000):
+        """ Drops the entry for one password/salt/workload, if cached. """
+        cache_key = self._cache_key(password, salt, workload)
+        with self._lock:
+            self._entries.pop(cache_key, None)
+
+    def clear(self):
+        """ Drops every entry; the hit and miss counters are kept. """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _verify_hmac(hmac, data, tag):
+    """
+    Feeds `data` into `hmac` and asserts that the result matches `tag`.
+    Timed as the 'hmac_verify' phase; mismatches count as 'hmac_failures'.
+    """
+    metrics = _metrics
+    start = time.perf_counter() if metrics is not None else 0
+    hmac.update(data)
+    valid = compare_digest(tag, hmac.digest())
+    if metrics is not None:
+        metrics.record('hmac_verify', time.perf_counter() - start, len(data))
+        if not valid:
+            metrics.count('hmac_failures')
+    assert valid, 'Ciphertext corrupted or tampered.'
+
+
+def get_key_iv(password, salt, workload=100000, cache=None):
     """
     Stretches the password and extracts an AES key, an HMAC key and an AES
-    initialization vector.
+    initialization vector. If a `KeyCache` is given, the result is looked up
+    there first.
     """
+    if cache is not None:
+        return cache.get_key_iv(password, salt, workload)
+    metrics = _metrics
+    start = time.perf_counter() if metrics is not None else 0
     stretched = pbkdf2_hmac('sha256', password, salt, workload, AES_KEY_SIZE + IV_SIZE + HMAC_KEY_SIZE)
+    if metrics is not None:
+        metrics.record('kdf', time.perf_counter() - start)
     aes_key, stretched = stretched[:AES_KEY_SIZE], stretched[AES_KEY_SIZE:]
     hmac_key, stretched = stretched[:HMAC_KEY_SIZE], stretched[HMAC_KEY_SIZE:]
     iv = stretched[:IV_SIZE]
     return aes_key, hmac_key, iv
 
 
-def encrypt(key, plaintext, workload=100000):
+# Bytes of ciphertext per step of the fused CBC + HMAC passes below: small
+# enough that each chunk is still in cache when it is hashed.
+MAC_CHUNK_SIZE = 16 * 1024
+
+def _encrypt_cbc_then_mac(cipher, plaintext, iv, out, hmac):
+    """
+    CBC-encrypts `plaintext` with PKCS#7 padding into `out`, which needs room
+    for `padded_size(len(plaintext))` bytes, feeding each chunk of
+    ciphertext into `hmac` right after it is written.
+    """
+    view = memoryview(plaintext).cast('B')
+    out = memoryview(out).cast('B')
+    full = len(view) // 16 * 16
+    final_block = cipher._pad_final_block(view)
+    previous = iv
+    for start in range(0, full, MAC_CHUNK_SIZE):
+        chunk = out[start:min(start + MAC_CHUNK_SIZE, full)]
+        cipher._encrypt_cbc_blocks(view[start:start + len(chunk)], previous, chunk)
+        hmac.update(chunk)
+        previous = bytes(chunk[-16:])
+    cipher._encrypt_cbc_blocks(final_block, previous, out[full:full + 16])
+    hmac.update(out[full:full + 16])
+
+def _decrypt_cbc_then_verify(cipher, ciphertext, iv, out, hmac, tag):
+    """
+    CBC-decrypts `ciphertext` into `out` while feeding each chunk of it into
+    `hmac`, then checks `tag` and only then the padding, and returns the
+    plaintext length. If this raises, the contents of `out` are unverified
+    and must be discarded.
+    """
+    view = memoryview(ciphertext).cast('B')
+    out = memoryview(out).cast('B')
+    last = (len(view) - 1) // MAC_CHUNK_SIZE * MAC_CHUNK_SIZE
+    previous = iv
+    for start in range(0, last, MAC_CHUNK_SIZE):
+        chunk = view[start:start + MAC_CHUNK_SIZE]
+        cipher._decrypt_cbc_blocks(chunk, previous, out[start:start + MAC_CHUNK_SIZE])
+        hmac.update(chunk)
+        previous = bytes(chunk[-16:])
+    cipher._decrypt_cbc_blocks(view[last:], previous, out[last:len(view)])
+    _verify_hmac(hmac, view[last:], tag)
+    return cipher._unpadded_length(out, len(view))
+
+
+def encrypt(key, plaintext, workload=100000, cache=None):
     """
     Encrypts `plaintext` with `key` using AES-128, an HMAC to verify integrity,
     and PBKDF2 to stretch the given key.
@@ -476,18 +2437,23 @@ def encrypt(key, plaintext, workload=100000):
         plaintext = plaintext.encode('utf-8')
 
     salt = os.urandom(SALT_SIZE)
-    key, hmac_key, iv = get_key_iv(key, salt, workload)
-    ciphertext = AES(key).encrypt_cbc(plaintext, iv)
-    hmac = new_hmac(hmac_key, salt + ciphertext, 'sha256').digest()
-    assert len(hmac) == HMAC_SIZE
+    key, hmac_key, iv = get_key_iv(key, salt, workload, cache)
+    # One output buffer; the ciphertext is authenticated as it is produced.
+    out = bytearray(HMAC_SIZE + SALT_SIZE + padded_size(len(plaintext)))
+    out[HMAC_SIZE:HMAC_SIZE + SALT_SIZE] = salt
+    hmac = new_hmac(hmac_key, salt, 'sha256')
+    with memoryview(out) as view:
+        _encrypt_cbc_then_mac(AES(key), plaintext, iv, view[HMAC_SIZE + SALT_SIZE:], hmac)
+    out[:HMAC_SIZE] = hmac.digest()
 
-    return hmac + salt + ciphertext
+    return bytes(out)
 
 
-def decrypt(key, ciphertext, workload=100000):
+def decrypt(key, ciphertext, workload=100000, cache=None):
     """
     Decrypts `ciphertext` with `key` using AES-128, an HMAC to verify integrity,
-    and PBKDF2 to stretch the given key.
+    and PBKDF2 to stretch the given key. Passing a `KeyCache` skips PBKDF2 when
+    the same key and salt are decrypted repeatedly.
 
     The exact algorithm is specified in the module docstring.
     """
@@ -502,24 +2468,613 @@ def decrypt(key, ciphertext, workload=100000):
     if isinstance(key, str):
         key = key.encode('utf-8')
 
-    hmac, ciphertext = ciphertext[:HMAC_SIZE], ciphertext[HMAC_SIZE:]
-    salt, ciphertext = ciphertext[:SALT_SIZE], ciphertext[SALT_SIZE:]
+    view = memoryview(ciphertext).cast('B')
+    hmac = bytes(view[:HMAC_SIZE])
+    salt = bytes(view[HMAC_SIZE:HMAC_SIZE + SALT_SIZE])
+    key, hmac_key, iv = get_key_iv(key, salt, workload, cache)
+
+    # The payload is decrypted and authenticated in the same pass, but the
+    # padding is checked and the plaintext released only once the HMAC is.
+    payload = view[HMAC_SIZE + SALT_SIZE:]
+    out = bytearray(len(payload))
+    length = _decrypt_cbc_then_verify(AES(key), payload, iv, out, new_hmac(hmac_key, salt, 'sha256'), hmac)
+    del out[length:]
+    return bytes(out)
+
+
+class Session:
+    """
+    Derives keys from a password once and then encrypts any number of
+    messages, each under a fresh random IV. Messages are laid out as
+
+        HMAC-SHA256 (32 bytes) | salt (16 bytes) | IV (16 bytes) | ciphertext
+
+    with AES-128-CBC and the HMAC covering salt, IV and ciphertext. This is
+    not the `encrypt` format: the IV is stored instead of derived. A session
+    can decrypt only messages made under its own salt; pass `salt` to open
+    a session for existing messages.
+    """
+    header_size = HMAC_SIZE + SALT_SIZE + IV_SIZE
+
+    def __init__(self, key, salt=None, workload=100000, cache=None):
+        if isinstance(key, str):
+            key = key.encode('utf-8')
+        self.salt = os.urandom(SALT_SIZE) if salt is None else salt
+        assert len(self.salt) == SALT_SIZE
+        aes_key, hmac_key, _ = get_key_iv(key, self.salt, workload, cache)
+        self._aes = AES(aes_key)
+        self._hmac = new_hmac(hmac_key, digestmod='sha256')
+
+    @staticmethod
+    def encrypted_size(length):
+        """ Size of an encrypted message for a plaintext of `length` bytes. """
+        return Session.header_size + (length // 16 + 1) * 16
+
+    def encrypt_into(self, plaintext, out, offset=0, iv=None):
+        """
+        Encrypts `plaintext` into the writable buffer `out` at `offset` and
+        returns the offset just past the message.
+        """
+        if isinstance(plaintext, str):
+            plaintext = plaintext.encode('utf-8')
+        iv = os.urandom(IV_SIZE) if iv is None else iv
+        start = offset + HMAC_SIZE
+        end = start + SALT_SIZE + IV_SIZE + padded_size(len(plaintext))
+        out[start:start + SALT_SIZE] = self.salt
+        out[start + SALT_SIZE:start + SALT_SIZE + IV_SIZE] = iv
+        with memoryview(out) as view:
+            self._aes.encrypt_into('cbc', plaintext, iv, view[start + SALT_SIZE + IV_SIZE:end])
+            hmac = self._hmac.copy()
+            hmac.update(view[start:end])
+        out[offset:start] = hmac.digest()
+        return end
+
+    def encrypt(self, plaintext):
+        if isinstance(plaintext, str):
+            plaintext = plaintext.encode('utf-8')
+        out = bytearray(self.encrypted_size(len(plaintext)))
+        self.encrypt_into(plaintext, out)
+        return bytes(out)
+
+    def decrypt(self, ciphertext):
+        assert len(ciphertext) >= self.header_size + 16, 'Ciphertext too short.'
+        assert (len(ciphertext) - HMAC_SIZE) % 16 == 0, 'Ciphertext must be made of full 16-byte blocks.'
+        hmac, ciphertext = ciphertext[:HMAC_SIZE], ciphertext[HMAC_SIZE:]
+        assert compare_digest(ciphertext[:SALT_SIZE], self.salt), 'Message is from another session.'
+
+        _verify_hmac(self._hmac.copy(), ciphertext, hmac)
+
+        iv = ciphertext[SALT_SIZE:SALT_SIZE + IV_SIZE]
+        return self._aes.decrypt_cbc(ciphertext[SALT_SIZE + IV_SIZE:], iv)
+
+
+class BatchResult:
+    """
+    Results of `encrypt_many`/`decrypt_many`: record i is
+    `data[offsets[i]:offsets[i + 1]]`, or None if `errors` has an entry for i
+    (its span is then empty).
+    """
+    def __init__(self, data, offsets, errors):
+        self.data = data
+        self.offsets = offsets
+        self.errors = errors
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i in self.errors:
+            return None
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]])
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+def encrypt_many(key, messages, workload=100000, cache=None):
+    """
+    Encrypts a batch of messages in the `Session` format with one key
+    derivation, one key schedule and one HMAC prototype, writing them into a
+    single preallocated buffer. A record that cannot be encrypted (e.g. it is
+    not bytes or str) is reported in `errors` without stopping the batch.
+    """
+    session = Session(key, workload=workload, cache=cache)
+    messages = [m.encode('utf-8') if isinstance(m, str) else m for m in messages]
+    sizes = []
+    for message in messages:
+        try:
+            sizes.append(Session.encrypted_size(len(message)))
+        except TypeError:
+            sizes.append(0)
+
+    data = bytearray(sum(sizes))
+    ivs = os.urandom(IV_SIZE * len(messages))
+    offsets = array('Q', [0])
+    errors = {}
+    offset = 0
+    for i, message in enumerate(messages):
+        try:
+            iv = ivs[i * IV_SIZE:(i + 1) * IV_SIZE]
+            offset = session.encrypt_into(message, data, offset, iv)
+        except (AssertionError, TypeError, ValueError) as e:
+            errors[i] = str(e) or type(e).__name__
+        offsets.append(offset)
+    del data[offset:]
+    return BatchResult(data, offsets, errors)
+
+def decrypt_many(key, messages, workload=100000, cache=None):
+    """
+    Decrypts a batch of `Session`-format messages into a single buffer,
+    deriving keys once per distinct salt. Records that fail to authenticate
+    or decrypt are reported in `errors` without stopping the batch.
+    """
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    messages = list(messages)
+    sizes = []
+    for message in messages:
+        try:
+            sizes.append(max(len(message) - Session.header_size, 0))
+        except TypeError:
+            sizes.append(0)
+
+    sessions = {}
+    data = bytearray(sum(sizes))
+    offsets = array('Q', [0])
+    errors = {}
+    offset = 0
+    for i, message in enumerate(messages):
+        try:
+            salt = bytes(message[HMAC_SIZE:HMAC_SIZE + SALT_SIZE])
+            if salt not in sessions:
+                assert len(salt) == SALT_SIZE, 'Ciphertext too short.'
+                sessions[salt] = Session(key, salt, workload, cache)
+            plaintext = sessions[salt].decrypt(message)
+            data[offset:offset + len(plaintext)] = plaintext
+            offset += len(plaintext)
+        except (AssertionError, TypeError, ValueError) as e:
+            errors[i] = str(e) or type(e).__name__
+        offsets.append(offset)
+    del data[offset:]
+    return BatchResult(data, offsets, errors)
+
+
+"""
+Chunked stream format, for inputs too large to hold in memory:
+
+    header: magic "AESS" | version (1 byte) | PBKDF2 workload (uint32) |
+            chunk size (uint32) | salt (16 bytes)
+    frames: ciphertext length (uint32) | final flag (1 byte) | ciphertext |
+            HMAC-SHA256 (32 bytes)
+
+All integers are big-endian. The keys and IV come from `get_key_iv`, the
+payload is encrypted with AES-128 in CTR mode as one continuous stream
+(chunk n starts at counter iv + n * chunk_size / 16), and each frame's HMAC
+covers the header, the frame index, the final flag, the length and the
+ciphertext. Every frame is verified before it is decrypted, so output can be
+written as soon as a frame arrives, and reordering, truncation or trailing
+data are all detected.
+"""
+STREAM_MAGIC = b'AESS'
+STREAM_VERSION = 1
+STREAM_CHUNK_SIZE = 64 * 1024
+
+stream_header = Struct('>4sBII16s')
+stream_frame = Struct('>IB')
+frame_index = Struct('>Q')
+
+def _read_exactly(infile, size):
+    """ Reads `size` bytes, or fewer only at end of input. """
+    data = infile.read(size)
+    while data and len(data) < size:
+        more = infile.read(size - len(data))
+        if not more:
+            break
+        data += more
+    return data
+
+def _frame_hmac(hmac_prototype, index, header):
+    """ Returns a copy of the header-keyed HMAC with the frame header fed in. """
+    hmac = hmac_prototype.copy()
+    hmac.update(frame_index.pack(index))
+    hmac.update(header)
+    return hmac
+
+def _seal_frame(stream, hmac_prototype, index, chunk, final):
+    """ Encrypts one chunk and returns its frame header, ciphertext and tag. """
+    ciphertext = stream.update(chunk)
+    frame = stream_frame.pack(len(ciphertext), final)
+    hmac = _frame_hmac(hmac_prototype, index, frame)
+    hmac.update(ciphertext)
+    return frame, ciphertext, hmac.digest()
+
+def _unpack_stream_header(header):
+    """ Checks a stream header and returns its workload, chunk size and salt. """
+    assert len(header) == stream_header.size, 'Stream too short.'
+    magic, version, workload, chunk_size, salt = stream_header.unpack(header)
+    assert magic == STREAM_MAGIC, 'Not an AES stream.'
+    assert version == STREAM_VERSION, 'Unsupported stream version {}.'.format(version)
+    assert chunk_size > 0 and chunk_size % 16 == 0, 'Invalid chunk size.'
+    return workload, chunk_size, salt
+
+def _unpack_frame(frame, chunk_size):
+    """ Checks a frame header and returns its ciphertext length and final flag. """
+    assert len(frame) == stream_frame.size, 'Stream truncated.'
+    length, final = stream_frame.unpack(frame)
+    assert length <= chunk_size and (final or length == chunk_size), 'Invalid frame length.'
+    return length, final
+
+def _open_frame(stream, hmac_prototype, index, frame, length, ciphertext, tag):
+    """ Authenticates one frame and returns its plaintext. """
+    assert len(ciphertext) == length and len(tag) == HMAC_SIZE, 'Stream truncated.'
+    _verify_hmac(_frame_hmac(hmac_prototype, index, frame), ciphertext, tag)
+    return stream.update(ciphertext)
+
+def encrypt_stream(key, infile, outfile, workload=100000, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Encrypts everything read from the binary file object `infile` into
+    `outfile` using the chunked stream format, holding at most two chunks in
+    memory at a time.
+    """
+    assert chunk_size > 0 and chunk_size % 16 == 0, 'Chunk size must be a multiple of 16 bytes.'
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+
+    salt = os.urandom(SALT_SIZE)
     key, hmac_key, iv = get_key_iv(key, salt, workload)
+    header = stream_header.pack(STREAM_MAGIC, STREAM_VERSION, workload, chunk_size, salt)
+    hmac_prototype = new_hmac(hmac_key, header, 'sha256')
+    stream = AES(key).encryptor('ctr', iv)
+    outfile.write(header)
+
+    index = 0
+    chunk = _read_exactly(infile, chunk_size)
+    while True:
+        # Read one chunk ahead so the last frame can be flagged as final.
+        next_chunk = _read_exactly(infile, chunk_size) if len(chunk) == chunk_size else b''
+        final = not next_chunk
+        for part in _seal_frame(stream, hmac_prototype, index, chunk, final):
+            outfile.write(part)
+        if final:
+            return
+        chunk = next_chunk
+        index += 1
+
+def decrypt_stream(key, infile, outfile):
+    """
+    Decrypts a chunked stream from `infile` into `outfile`. Each frame is
+    authenticated before its plaintext is written; an error is raised on
+    tampering, reordering, truncation or trailing data (in which case the
+    plaintext written so far must be discarded by the caller).
+    """
+    if isinstance(key, str):
+        key = key.encode('utf-8')
 
-    expected_hmac = new_hmac(hmac_key, salt + ciphertext, 'sha256').digest()
-    assert compare_digest(hmac, expected_hmac), 'Ciphertext corrupted or tampered.'
+    header = _read_exactly(infile, stream_header.size)
+    workload, chunk_size, salt = _unpack_stream_header(header)
+    key, hmac_key, iv = get_key_iv(key, salt, workload)
+    hmac_prototype = new_hmac(hmac_key, header, 'sha256')
+    stream = AES(key).decryptor('ctr', iv)
+
+    index = 0
+    while True:
+        frame = _read_exactly(infile, stream_frame.size)
+        length, final = _unpack_frame(frame, chunk_size)
+        ciphertext = _read_exactly(infile, length)
+        tag = _read_exactly(infile, HMAC_SIZE)
+        outfile.write(_open_frame(stream, hmac_prototype, index, frame, length, ciphertext, tag))
+        if final:
+            break
+        index += 1
+
+    assert not infile.read(1), 'Unexpected data after the final frame.'
+
+
+"""
+Seekable file format, for large files read a piece at a time:
+
+    header:  same layout as the stream header, with magic "AESX"
+    chunks:  AES-128-CTR ciphertext, chunk_size bytes each (the last may be
+             shorter), with chunk n starting at counter iv + n * chunk_size / 16
+    index:   one entry per chunk: file offset (uint64) | length (uint32) |
+             HMAC-SHA256 of header, chunk number and ciphertext (32 bytes)
+    footer:  chunk count (uint64) | plaintext size (uint64) |
+             HMAC-SHA256 of header, index, count and size (32 bytes) | "AESX"
+
+The index lives in the trailer so the writer can stream its input. A reader
+only has to authenticate the index up front and can then decrypt and verify
+just the chunks a read touches.
+"""
+SEEKABLE_MAGIC = b'AESX'
 
-    return AES(key).decrypt_cbc(ciphertext, iv)
+seekable_entry = Struct('>QI32s')
+seekable_footer = Struct('>QQ32s4s')
 
+def _index_hmac(hmac_prototype, entries, count, size):
+    hmac = hmac_prototype.copy()
+    hmac.update(b'index')
+    hmac.update(entries)
+    hmac.update(frame_index.pack(count) + frame_index.pack(size))
+    return hmac.digest()
+
+def encrypt_seekable(key, infile, outfile, workload=100000, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Encrypts everything read from `infile` into `outfile` using the seekable
+    format, which can be read back with `SeekableReader`.
+    """
+    assert chunk_size > 0 and chunk_size % 16 == 0, 'Chunk size must be a multiple of 16 bytes.'
+    if isinstance(key, str):
+        key = key.encode('utf-8')
 
-def benchmark():
-    key = b'P' * 16
-    message = b'M' * 16
+    salt = os.urandom(SALT_SIZE)
+    key, hmac_key, iv = get_key_iv(key, salt, workload)
+    header = stream_header.pack(SEEKABLE_MAGIC, STREAM_VERSION, workload, chunk_size, salt)
+    hmac_prototype = new_hmac(hmac_key, header, 'sha256')
     aes = AES(key)
-    for i in range(30000):
-        aes.encrypt_block(message)
+    counter = int.from_bytes(iv, 'big')
+    outfile.write(header)
+
+    entries = []
+    offset = len(header)
+    size = 0
+    while True:
+        chunk = _read_exactly(infile, chunk_size)
+        if not chunk:
+            break
+        nonce = ((counter + size // 16) % (1 << 128)).to_bytes(16, 'big')
+        ciphertext = aes.encrypt_ctr(chunk, nonce)
+        hmac = _frame_hmac(hmac_prototype, len(entries), b'')
+        hmac.update(ciphertext)
+        entries.append(seekable_entry.pack(offset, len(ciphertext), hmac.digest()))
+        outfile.write(ciphertext)
+        offset += len(ciphertext)
+        size += len(chunk)
+        if len(chunk) < chunk_size:
+            break
+
+    entries = b''.join(entries)
+    count = len(entries) // seekable_entry.size
+    outfile.write(entries)
+    outfile.write(seekable_footer.pack(count, size, _index_hmac(hmac_prototype, entries, count, size), SEEKABLE_MAGIC))
+
+class SeekableReader:
+    """
+    Read-only file-like view of a file written by `encrypt_seekable`.
+
+    `file` is a path or a binary file object with a file descriptor. The file
+    is memory-mapped, and `read` decrypts and authenticates only the chunks
+    covering the requested range, keeping the last chunk for sequential reads.
+    """
+    def __init__(self, key, file):
+        import mmap
+        if isinstance(key, str):
+            key = key.encode('utf-8')
+
+        self._owned = isinstance(file, (str, bytes, os.PathLike))
+        self._file = open(file, 'rb') if self._owned else file
+        self._map = None
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._load_index(key)
+        except BaseException:
+            self.close()
+            raise
+
+        self.position = 0
+        self._cached_index = None
+        self._cached_chunk = b''
+
+    def _load_index(self, key):
+        data = self._map
+        assert len(data) >= stream_header.size + seekable_footer.size, 'File too short.'
+        header = data[:stream_header.size]
+        magic, version, workload, chunk_size, salt = stream_header.unpack(header)
+        assert magic == SEEKABLE_MAGIC, 'Not a seekable AES file.'
+        assert version == STREAM_VERSION, 'Unsupported file version {}.'.format(version)
+        assert chunk_size > 0 and chunk_size % 16 == 0, 'Invalid chunk size.'
+
+        count, size, tag, magic = seekable_footer.unpack(data[-seekable_footer.size:])
+        assert magic == SEEKABLE_MAGIC, 'File truncated.'
+        index_start = len(data) - seekable_footer.size - count * seekable_entry.size
+        assert index_start >= stream_header.size, 'File truncated.'
+        entries = data[index_start:len(data) - seekable_footer.size]
+
+        key, hmac_key, iv = get_key_iv(key, salt, workload)
+        self._hmac = new_hmac(hmac_key, header, 'sha256')
+        assert compare_digest(tag, _index_hmac(self._hmac, entries, count, size)), 'Ciphertext corrupted or tampered.'
+
+        self._index = [seekable_entry.unpack_from(entries, i * seekable_entry.size) for i in range(count)]
+        assert sum(length for _, length, _ in self._index) == size, 'Invalid index.'
+        for i, (offset, length, _) in enumerate(self._index):
+            assert length == chunk_size or (i == count - 1 and 0 < length <= chunk_size), 'Invalid index.'
+            assert stream_header.size <= offset and offset + length <= index_start, 'Invalid index.'
+
+        self._aes = AES(key)
+        self._counter = int.from_bytes(iv, 'big')
+        self.chunk_size = chunk_size
+        self.size = size
+
+    def _chunk(self, index):
+        """ Returns the authenticated plaintext of chunk number `index`. """
+        if index != self._cached_index:
+            offset, length, tag = self._index[index]
+            with memoryview(self._map) as view, view[offset:offset + length] as ciphertext:
+                _verify_hmac(_frame_hmac(self._hmac, index, b''), ciphertext, tag)
+                nonce = ((self._counter + index * self.chunk_size // 16) % (1 << 128)).to_bytes(16, 'big')
+                self._cached_chunk = self._aes.decrypt_ctr(ciphertext, nonce)
+            self._cached_index = index
+        return self._cached_chunk
+
+    def read(self, size=-1):
+        """ Reads up to `size` bytes (everything left if negative). """
+        end = self.size if size < 0 else min(self.size, self.position + size)
+        parts = []
+        while self.position < end:
+            index, start = divmod(self.position, self.chunk_size)
+            part = self._chunk(index)[start:start + end - self.position]
+            parts.append(part)
+            self.position += len(part)
+        return b''.join(parts)
+
+    def seek(self, offset, whence=0):
+        """ Moves the read position, with `whence` as in `io.IOBase.seek`. """
+        base = (0, self.position, self.size)[whence]
+        assert base + offset >= 0, 'Negative seek position.'
+        self.position = base + offset
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def close(self):
+        if getattr(self, '_map', None) is not None:
+            self._map.close()
+            self._map = None
+        if self._owned and self._file is not None:
+            self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+"""
+Asyncio API. The coroutines below produce and accept exactly the same
+formats as their blocking counterparts, but run PBKDF2 and the block cipher
+on an executor (the loop's default thread pool unless one is given), one
+chunk at a time, so other tasks keep running in between. Stream coroutines
+await `drain()` after every frame, so a slow reader holds back the writer.
+"""
+import asyncio
 
-__all__ = ["encrypt", "decrypt", "AES"]
+ASYNC_CHUNK_SIZE = 64 * 1024
+
+async def _aread_exactly(reader, size):
+    """ Reads `size` bytes from an `asyncio.StreamReader`, or fewer only at EOF. """
+    try:
+        return await reader.readexactly(size)
+    except asyncio.IncompleteReadError as e:
+        return e.partial
+
+async def aencrypt(key, plaintext, workload=100000, cache=None, executor=None, chunk_size=ASYNC_CHUNK_SIZE):
+    """
+    Coroutine version of `encrypt`. The output can be read by `decrypt`.
+    """
+    assert chunk_size > 0 and chunk_size % 16 == 0, 'Chunk size must be a multiple of 16 bytes.'
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    if isinstance(plaintext, str):
+        plaintext = plaintext.encode('utf-8')
+
+    loop = asyncio.get_running_loop()
+    salt = os.urandom(SALT_SIZE)
+    key, hmac_key, iv = await loop.run_in_executor(executor, get_key_iv, key, salt, workload, cache)
+    stream = AES(key).encryptor('cbc', iv)
+    hmac = new_hmac(hmac_key, salt, 'sha256')
+    parts = [None, salt]
+    view = memoryview(plaintext)
+    for i in range(0, len(view), chunk_size):
+        part = await loop.run_in_executor(executor, stream.update, view[i:i + chunk_size])
+        hmac.update(part)
+        parts.append(part)
+    parts.append(stream.finalize())
+    hmac.update(parts[-1])
+    parts[0] = hmac.digest()
+    return b''.join(parts)
+
+async def adecrypt(key, ciphertext, workload=100000, cache=None, executor=None, chunk_size=ASYNC_CHUNK_SIZE):
+    """
+    Coroutine version of `decrypt`: the HMAC is verified before anything is
+    decrypted.
+    """
+    assert chunk_size > 0 and chunk_size % 16 == 0, 'Chunk size must be a multiple of 16 bytes.'
+    assert len(ciphertext) % 16 == 0, "Ciphertext must be made of full 16-byte blocks."
+    assert len(ciphertext) >= 32, "Ciphertext must be at least 32 bytes long."
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+
+    loop = asyncio.get_running_loop()
+    view = memoryview(ciphertext)
+    hmac, salt, ciphertext = view[:HMAC_SIZE], bytes(view[HMAC_SIZE:HMAC_SIZE + SALT_SIZE]), view[HMAC_SIZE + SALT_SIZE:]
+    key, hmac_key, iv = await loop.run_in_executor(executor, get_key_iv, key, salt, workload, cache)
+    await loop.run_in_executor(executor, _verify_hmac, new_hmac(hmac_key, salt, 'sha256'), ciphertext, bytes(hmac))
+
+    stream = AES(key).decryptor('cbc', iv)
+    parts = []
+    for i in range(0, len(ciphertext), chunk_size):
+        parts.append(await loop.run_in_executor(executor, stream.update, ciphertext[i:i + chunk_size]))
+    parts.append(stream.finalize())
+    return b''.join(parts)
+
+async def aencrypt_stream(key, reader, writer, workload=100000, chunk_size=STREAM_CHUNK_SIZE, executor=None):
+    """
+    Coroutine version of `encrypt_stream`, from an `asyncio.StreamReader` to
+    an `asyncio.StreamWriter` (which is drained but not closed).
+    """
+    assert chunk_size > 0 and chunk_size % 16 == 0, 'Chunk size must be a multiple of 16 bytes.'
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+
+    loop = asyncio.get_running_loop()
+    salt = os.urandom(SALT_SIZE)
+    key, hmac_key, iv = await loop.run_in_executor(executor, get_key_iv, key, salt, workload)
+    header = stream_header.pack(STREAM_MAGIC, STREAM_VERSION, workload, chunk_size, salt)
+    hmac_prototype = new_hmac(hmac_key, header, 'sha256')
+    stream = AES(key).encryptor('ctr', iv)
+    writer.write(header)
+
+    index = 0
+    chunk = await _aread_exactly(reader, chunk_size)
+    while True:
+        next_chunk = await _aread_exactly(reader, chunk_size) if len(chunk) == chunk_size else b''
+        final = not next_chunk
+        parts = await loop.run_in_executor(executor, _seal_frame, stream, hmac_prototype, index, chunk, final)
+        writer.writelines(parts)
+        await writer.drain()
+        if final:
+            return
+        chunk = next_chunk
+        index += 1
+
+async def adecrypt_stream(key, reader, writer, executor=None):
+    """
+    Coroutine version of `decrypt_stream`, from an `asyncio.StreamReader` to
+    an `asyncio.StreamWriter`. As there, plaintext written before an error
+    is raised must be discarded.
+    """
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+
+    loop = asyncio.get_running_loop()
+    header = await _aread_exactly(reader, stream_header.size)
+    workload, chunk_size, salt = _unpack_stream_header(header)
+    key, hmac_key, iv = await loop.run_in_executor(executor, get_key_iv, key, salt, workload)
+    hmac_prototype = new_hmac(hmac_key, header, 'sha256')
+    stream = AES(key).decryptor('ctr', iv)
+
+    index = 0
+    while True:
+        frame = await _aread_exactly(reader, stream_frame.size)
+        length, final = _unpack_frame(frame, chunk_size)
+        ciphertext = await _aread_exactly(reader, length)
+        tag = await _aread_exactly(reader, HMAC_SIZE)
+        plaintext = await loop.run_in_executor(executor, _open_frame, stream, hmac_prototype, index, frame, length, ciphertext, tag)
+        writer.write(plaintext)
+        await writer.drain()
+        if final:
+            break
+        index += 1
+
+    assert not await reader.read(1), 'Unexpected data after the final frame.'
+
+
+__all__ = ["encrypt", "decrypt", "encrypt_stream", "decrypt_stream",
+           "encrypt_seekable", "SeekableReader", "KeyCache", "Session",
+           "encrypt_many", "decrypt_many", "encrypt_multibuffer", "aencrypt",
+           "adecrypt", "aencrypt_stream", "adecrypt_stream", "collect_metrics",
+           "enable_metrics", "disable_metrics", "Metrics", "AES"]
 
 if __name__ == '__main__':
     import sys
@@ -528,11 +3083,21 @@ if __name__ == '__main__':
 
     if len(sys.argv) < 2:
         print('Usage: ./aes.py encrypt "key" "message"')
+        print('       ./aes.py encrypt-stream "key" < infile > outfile')
+        print('       ./aes.py benchmark [--quick] [-o report.json]')
         print('Running tests...')
-        from tests import *
-        run()
-    elif len(sys.argv) == 2 and sys.argv[1] == 'benchmark':
-        benchmark()
+        from tests import main
+        main()
+        exit()
+    elif sys.argv[1] == 'benchmark':
+        # See benchmark.py for the options.
+        from benchmark import main
+        main(sys.argv[2:])
+        exit()
+    elif len(sys.argv) == 3 and sys.argv[1] in ('encrypt-stream', 'decrypt-stream'):
+        # Constant-memory chunked format, streamed from stdin to stdout.
+        function = encrypt_stream if sys.argv[1] == 'encrypt-stream' else decrypt_stream
+        function(sys.argv[2], sys.stdin.buffer, sys.stdout.buffer)
         exit()
     elif len(sys.argv) == 3:
         text = read()
@@ -0,0 +1,63 @@
+/*
+ * Throughput comparison of the rijndael round engines (byte-wise, T-table,
+ * bitsliced and AES-NI when supported) over the bulk ECB and CTR entry points.
+ *
+ * Usage: ./bench [megabytes]
+ */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <time.h>
+
+#include "rijndael.h"
+
+static const char *engine_names[] = {"bytewise", "ttable", "bitsliced", "aesni"};
+
+// Returns the throughput in MB/s of one pass of `mode` over the buffer
+static double throughput(aes_context *ctx, const char *mode, unsigned char *buffer, size_t n_blocks) {
+  unsigned char counter[BLOCK_SIZE] = {0};
+  clock_t start = clock();
+
+  if (mode[0] == 'e') {
+    aes_ecb_encrypt(ctx, buffer, buffer, n_blocks);
+  } else if (mode[0] == 'd') {
+    aes_ecb_decrypt(ctx, buffer, buffer, n_blocks);
+  } else {
+    aes_ctr_crypt(ctx, counter, buffer, buffer, n_blocks);
+  }
+
+  double elapsed = (double)(clock() - start) / CLOCKS_PER_SEC;
+  double megabytes = (double)(n_blocks * BLOCK_SIZE) / (1024 * 1024);
+  return elapsed > 0 ? megabytes / elapsed : 0;
+}
+
+int main(int argc, char **argv) {
+  size_t megabytes = argc > 1 ? (size_t)atoi(argv[1]) : 16;
+  size_t n_blocks = megabytes * 1024 * 1024 / BLOCK_SIZE;
+  const char *modes[] = {"ecb-encrypt", "ecb-decrypt", "ctr"};
+
+  unsigned char *buffer = (unsigned char *)calloc(n_blocks, BLOCK_SIZE);
+  if (!buffer) {
+    fprintf(stderr, "Could not allocate %zu MB\n", megabytes);
+    return 1;
+  }
+
+  unsigned char key[32];
+  for (int i = 0; i < 32; i++) key[i] = (unsigned char)(i * 7 + 1);
+
+  printf("%-8s %-10s %-12s %10s\n", "key", "engine", "mode", "MB/s");
+  for (size_t key_size = 16; key_size <= 32; key_size += 8) {
+    aes_context *ctx = aes_context_new(key, key_size);
+    for (int engine = AES_ENGINE_BYTEWISE; engine <= AES_ENGINE_AESNI; engine++) {
+      if (aes_context_set_engine(ctx, engine) < 0) continue;
+      for (int m = 0; m < 3; m++) {
+        printf("AES-%-4zu %-10s %-12s %10.2f\n", key_size * 8, engine_names[engine], modes[m],
+               throughput(ctx, modes[m], buffer, n_blocks));
+      }
+    }
+    aes_context_free(ctx);
+  }
+
+  free(buffer);
+  return 0;
+}
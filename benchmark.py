@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for aes.py and the rijndael C library.
+
+Measures key setup, single-block encryption/decryption, every block mode at
+several message sizes and the high-level `encrypt`/`decrypt` functions (with
+PBKDF2, and through a `Session` that derives its keys once), for each
+available backend: 'python' (the T-table engine), 'native' (rijndael.so via
+ctypes) and 'numpy' when NumPy is installed. With the Python backend, single
+blocks are also timed on every Python engine (`<name>_<engine>`), including
+the one-off compile of the key-specialized engine.
+
+Results are written as JSON so runs can be compared between releases:
+
+    ./benchmark.py                       # everything, JSON on stdout
+    ./benchmark.py --quick -o run.json   # small sizes, one repetition
+    ./benchmark.py --backends native --sizes 1024,1048576
+
+Each result has the time per operation, MB/s and ns per 16-byte block (for
+operations on data), and the peak resident set size of the process so far.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+
+import aes
+from aes import AES
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+DEFAULT_SIZES = (16, 1024, 64 * 1024)
+QUICK_SIZES = (16, 1024)
+MODES = ('ecb', 'cbc', 'pcbc', 'cfb', 'ofb', 'ctr', 'gcm')
+
+def peak_rss_kb():
+    """ Peak resident set size of this process in KiB, or None if unknown. """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+def time_calls(function, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        function()
+    return time.perf_counter() - start
+
+def measure(function, repeat, min_time):
+    """
+    Returns the best time per call of `function` in seconds, over `repeat`
+    runs of enough calls to take at least `min_time` seconds each. Unlike
+    `timeit`, the garbage collector stays enabled so peak RSS is realistic.
+    """
+    number = 1
+    elapsed = time_calls(function, number)
+    while elapsed < min_time:
+        number = max(2 * number, int(number * min_time / max(elapsed, 1e-9)))
+        elapsed = time_calls(function, number)
+    best = elapsed
+    for _ in range(repeat - 1):
+        best = min(best, time_calls(function, number))
+    return best / number
+
+def result(name, backend, seconds, size=None):
+    entry = {
+        'name': name,
+        'backend': backend,
+        'bytes': size,
+        'seconds_per_op': seconds,
+        'mb_per_s': None,
+        'ns_per_block': None,
+        'peak_rss_kb': peak_rss_kb(),
+    }
+    if size:
+        entry['mb_per_s'] = size / seconds / 1e6
+        entry['ns_per_block'] = seconds * 1e9 / ((size + 15) // 16)
+    return entry
+
+def available_backends():
+    backends = ['python']
+    if aes.native_available():
+        backends.append('native')
+    if aes.load_numpy() is not None:
+        backends.append('numpy')
+    return backends
+
+def mode_functions(cipher, mode, message, iv):
+    """ Returns (encrypt, decrypt) callables for one mode and message. """
+    if mode == 'ecb':
+        blocks = message[:len(message) // 16 * 16]
+        return (lambda: cipher.encrypt_blocks(blocks),
+                lambda: cipher.decrypt_blocks(blocks))
+    if mode == 'gcm':
+        nonce = iv[:12]
+        ciphertext = cipher.encrypt_gcm(message, nonce)
+        return (lambda: cipher.encrypt_gcm(message, nonce),
+                lambda: cipher.decrypt_gcm(ciphertext, nonce))
+    encrypt = getattr(cipher, 'encrypt_' + mode)
+    decrypt = getattr(cipher, 'decrypt_' + mode)
+    ciphertext = encrypt(message, iv)
+    return (lambda: encrypt(message, iv), lambda: decrypt(ciphertext, iv))
+
+def bench_backend(backend, sizes, repeat, min_time):
+    key = os.urandom(16)
+    iv = os.urandom(16)
+    block = os.urandom(16)
+    results = []
+
+    # Key setup, with and without the process-wide schedule cache.
+    max_size = aes.schedule_cache.max_size
+    aes.schedule_cache.max_size = 0
+    try:
+        results.append(result('key_setup', backend, measure(lambda: AES(key, backend=backend), repeat, min_time)))
+    finally:
+        aes.schedule_cache.max_size = max_size
+    results.append(result('key_setup_cached', backend, measure(lambda: AES(key, backend=backend), repeat, min_time)))
+
+    cipher = AES(key, backend=backend)
+    results.append(result('encrypt_block', backend, measure(lambda: cipher.encrypt_block(block), repeat, min_time), 16))
+    results.append(result('decrypt_block', backend, measure(lambda: cipher.decrypt_block(block), repeat, min_time), 16))
+
+    for size in sizes:
+        message = os.urandom(size)
+        for mode in MODES:
+            encrypt, decrypt = mode_functions(cipher, mode, message, iv)
+            results.append(result(mode + '_encrypt', backend, measure(encrypt, repeat, min_time), size))
+            results.append(result(mode + '_decrypt', backend, measure(decrypt, repeat, min_time), size))
+    return results
+
+def bench_python_engines(repeat, min_time):
+    """ Single blocks on each pure-Python round engine, and their key setup. """
+    key = os.urandom(16)
+    block = os.urandom(16)
+    results = []
+    for engine in AES.engines:
+        max_size = aes.schedule_cache.max_size
+        aes.schedule_cache.max_size = 0
+        try:
+            setup = measure(lambda: AES(key, engine=engine, backend='python'), repeat, min_time)
+        finally:
+            aes.schedule_cache.max_size = max_size
+        results.append(result('key_setup_' + engine, 'python', setup))
+
+        cipher = AES(key, engine=engine, backend='python')
+        results.append(result('encrypt_block_' + engine, 'python', measure(lambda: cipher.encrypt_block(block), repeat, min_time), 16))
+        results.append(result('decrypt_block_' + engine, 'python', measure(lambda: cipher.decrypt_block(block), repeat, min_time), 16))
+    return results
+
+def bench_high_level(sizes, repeat, min_time):
+    """ `encrypt`/`decrypt` with PBKDF2, and a `Session` without it. """
+    results = []
+    key = 'benchmark password'
+    session = aes.Session(key)
+    for size in sizes:
+        message = os.urandom(size)
+        ciphertext = aes.encrypt(key, message)
+        sealed = session.encrypt(message)
+        results.append(result('encrypt_pbkdf2', 'auto', measure(lambda: aes.encrypt(key, message), repeat, min_time), size))
+        results.append(result('decrypt_pbkdf2', 'auto', measure(lambda: aes.decrypt(key, ciphertext), repeat, min_time), size))
+        results.append(result('session_encrypt', 'auto', measure(lambda: session.encrypt(message), repeat, min_time), size))
+        results.append(result('session_decrypt', 'auto', measure(lambda: session.decrypt(sealed), repeat, min_time), size))
+    return results
+
+def run_benchmarks(backends=None, sizes=DEFAULT_SIZES, repeat=3, min_time=0.1):
+    """ Runs the whole suite and returns the report as a dict. """
+    backends = backends or available_backends()
+    numpy = aes.load_numpy()
+    report = {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'native_library': aes.native_library_path() if aes.load_native() is not None else None,
+        'native_error': aes.native_load_error,
+        'native_extension': aes.load_extension().__file__ if aes.load_extension() is not None else None,
+        'numpy': numpy.__version__ if numpy is not None else None,
+        'sizes': list(sizes),
+        'repeat': repeat,
+        'min_time': min_time,
+        'results': [],
+    }
+    for backend in backends:
+        report['results'].extend(bench_backend(backend, sizes, repeat, min_time))
+    if 'python' in backends:
+        report['results'].extend(bench_python_engines(repeat, min_time))
+    report['results'].extend(bench_high_level(sizes, repeat, min_time))
+    report['peak_rss_kb'] = peak_rss_kb()
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark aes.py and the rijndael C library.')
+    parser.add_argument('--backends', help='comma-separated backends (default: all available)')
+    parser.add_argument('--sizes', help='comma-separated message sizes in bytes')
+    parser.add_argument('--repeat', type=int, default=3, help='timing repetitions, best is kept')
+    parser.add_argument('--min-time', type=float, default=0.1, help='minimum seconds per repetition')
+    parser.add_argument('--quick', action='store_true', help='small sizes, one short repetition')
+    parser.add_argument('-o', '--output', help='write the JSON report to this file instead of stdout')
+    args = parser.parse_args(argv)
+
+    backends = args.backends.split(',') if args.backends else None
+    for backend in backends or ():
+        assert backend in AES.backends, 'Unknown backend {!r}'.format(backend)
+    if args.sizes:
+        sizes = [int(size) for size in args.sizes.split(',')]
+    else:
+        sizes = QUICK_SIZES if args.quick else DEFAULT_SIZES
+    repeat = 1 if args.quick else args.repeat
+    min_time = 0.02 if args.quick else args.min_time
+
+    report = run_benchmarks(backends, sizes, repeat, min_time)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,8 @@
  * Submitted by: Anika Siddiqui Mayesha (D24125187)
  */
 
+#include <pthread.h>
+#include <stdint.h>
 #include <stdlib.h>
 #include <string.h>
 #include "rijndael.h"
@@ -260,28 +262,39 @@ void add_round_key(unsigned char *state, const unsigned char *round_key) {
  * which is a single 128-bit key, it should return a 176-byte
  * vector, containing the 11 round keys one after the other
  */
-// Key expansion: generate round keys from the cipher key
-unsigned char *expand_key(const unsigned char *key) {
-  // For AES-128, we need 11 round keys (initial + 10 rounds)
-  unsigned char *expanded_key = (unsigned char *)malloc(176); // 11 * 16 bytes
-  
-  // Copy the original key to the first round key
-  memcpy(expanded_key, key, 16);
+// Number of rounds for a 16, 24 or 32 byte key, or 0 if unsupported
+int aes_rounds_for_key_size(size_t key_size) {
+  switch (key_size) {
+    case 16: return 10;
+    case 24: return 12;
+    case 32: return 14;
+    default: return 0;
+  }
+}
+
+// Key expansion for any supported key size into a caller-supplied buffer
+// of (rounds + 1) * 16 bytes
+static void expand_key_into(const unsigned char *key, size_t key_size, unsigned char *expanded_key) {
+  int key_words = (int)key_size / 4;
+  int total_bytes = (aes_rounds_for_key_size(key_size) + 1) * BLOCK_SIZE;
+
+  // Copy the original key to the first round key(s)
+  memcpy(expanded_key, key, key_size);
   
   // Variables for the key expansion process
   unsigned char temp[4];
   int i = 1;
-  int bytes_generated = 16;
+  int bytes_generated = (int)key_size;
   
   // Generate the rest of the round keys
-  while (bytes_generated < 176) {
+  while (bytes_generated < total_bytes) {
       // Copy the last 4 bytes of the previous round key
       for (int j = 0; j < 4; j++) {
           temp[j] = expanded_key[bytes_generated - 4 + j];
       }
       
-      // Perform the key schedule core once every 16 bytes
-      if (bytes_generated % 16 == 0) {
+      // Perform the key schedule core once every key_size bytes
+      if (bytes_generated % key_size == 0) {
           // Rotate word
           unsigned char k = temp[0];
           temp[0] = temp[1];
@@ -296,40 +309,49 @@ unsigned char *expand_key(const unsigned char *key) {
           
           // XOR with round constant
           temp[0] ^= r_con[i++];
+      } else if (key_words > 6 && bytes_generated % key_size == 16) {
+          // AES-256 runs the fourth word of every group through the S-box too
+          for (int j = 0; j < 4; j++) {
+              temp[j] = s_box[temp[j]];
+          }
       }
       
-      // XOR with the 4-byte block 16 bytes before
+      // XOR with the 4-byte word one key length before
       for (int j = 0; j < 4; j++) {
-          expanded_key[bytes_generated] = expanded_key[bytes_generated - 16] ^ temp[j];
+          expanded_key[bytes_generated] = expanded_key[bytes_generated - key_size] ^ temp[j];
           bytes_generated++;
       }
   }
-  
+}
+
+// Key expansion: generate round keys from the cipher key
+unsigned char *expand_key(const unsigned char *key) {
+  // For AES-128, we need 11 round keys (initial + 10 rounds)
+  return expand_key_sized(key, 16);
+}
+
+// Key expansion for 16, 24 or 32 byte keys; returns NULL for other sizes
+unsigned char *expand_key_sized(const unsigned char *key, size_t key_size) {
+  int rounds = aes_rounds_for_key_size(key_size);
+  if (!rounds) return NULL;
+
+  unsigned char *expanded_key = (unsigned char *)malloc((rounds + 1) * BLOCK_SIZE);
+  if (!expanded_key) return NULL;
+
+  expand_key_into(key, key_size, expanded_key);
   return expanded_key;
 }
 
 /*
- * The implementations of the functions declared in the
- * header file should go here
+ * Block transforms shared by the one-shot functions and the keyed context.
+ * Both work in place on a 16-byte state with an already expanded key.
  */
-// Main encryption function
-unsigned char *aes_encrypt_block(const unsigned char *plaintext, const unsigned char *key) {
-  // Allocate memory for the output
-  unsigned char *output = (unsigned char *)malloc(16);
-  if (!output) return NULL;
-  
-  // Create a temporary state array and copy the plaintext into it
-  unsigned char state[16];
-  memcpy(state, plaintext, 16);
-  
-  // Expand the key
-  unsigned char *round_keys = expand_key(key);
-  
+static void encrypt_state(unsigned char *state, const unsigned char *round_keys, int rounds) {
   // Initial round: AddRoundKey
   add_round_key(state, round_keys);
   
-  // Main rounds (1-9)
-  for (int round = 1; round < 10; round++) {
+  // Main rounds (1 to rounds - 1)
+  for (int round = 1; round < rounds; round++) {
       sub_bytes(state);
       shift_rows(state);
       mix_columns(state);
@@ -339,36 +361,15 @@ unsigned char *aes_encrypt_block(const unsigned char *plaintext, const unsigned
   // Final round (no MixColumns)
   sub_bytes(state);
   shift_rows(state);
-  add_round_key(state, round_keys + 160); // 10 * 16 = 160
-  
-  // Copy the result to the output buffer
-  memcpy(output, state, 16);
-  
-  // Free the expanded key
-  free(round_keys);
-  
-  return output;
+  add_round_key(state, round_keys + (rounds * 16));
 }
 
-
-// Main decryption function
-unsigned char *aes_decrypt_block(const unsigned char *ciphertext, const unsigned char *key) {
-  // Allocate memory for the output
-  unsigned char *output = (unsigned char *)malloc(16);
-  if (!output) return NULL;
-  
-  // Create a temporary state array and copy the ciphertext into it
-  unsigned char state[16];
-  memcpy(state, ciphertext, 16);
-  
-  // Expand the key
-  unsigned char *round_keys = expand_key(key);
-  
+static void decrypt_state(unsigned char *state, const unsigned char *round_keys, int rounds) {
   // Initial round: AddRoundKey (with the last round key)
-  add_round_key(state, round_keys + 160);
+  add_round_key(state, round_keys + (rounds * 16));
   
-  // Main rounds (9-1)
-  for (int round = 9; round > 0; round--) {
+  // Main rounds (rounds - 1 down to 1)
+  for (int round = rounds - 1; round > 0; round--) {
       inv_shift_rows(state);
       inv_sub_bytes(state);
       add_round_key(state, round_keys + (round * 16));
@@ -379,12 +380,956 @@ unsigned char *aes_decrypt_block(const unsigned char *ciphertext, const unsigned
   inv_shift_rows(state);
   inv_sub_bytes(state);
   add_round_key(state, round_keys);
+}
+
+/*
+ * The implementations of the functions declared in the
+ * header file should go here
+ */
+// Main encryption function
+unsigned char *aes_encrypt_block(const unsigned char *plaintext, const unsigned char *key) {
+  // Allocate memory for the output
+  unsigned char *output = (unsigned char *)malloc(16);
+  if (!output) return NULL;
   
-  // Copy the result to the output buffer
-  memcpy(output, state, 16);
-  
-  // Free the expanded key
-  free(round_keys);
+  // Expand the key on the stack and encrypt straight into the output buffer
+  unsigned char round_keys[EXPANDED_KEY_SIZE];
+  expand_key_into(key, 16, round_keys);
+
+  memcpy(output, plaintext, 16);
+  encrypt_state(output, round_keys, 10);
+
+  return output;
+}
+
+
+// Main decryption function
+unsigned char *aes_decrypt_block(const unsigned char *ciphertext, const unsigned char *key) {
+  // Allocate memory for the output
+  unsigned char *output = (unsigned char *)malloc(16);
+  if (!output) return NULL;
   
+  // Expand the key on the stack and decrypt straight into the output buffer
+  unsigned char round_keys[EXPANDED_KEY_SIZE];
+  expand_key_into(key, 16, round_keys);
+
+  memcpy(output, ciphertext, 16);
+  decrypt_state(output, round_keys, 10);
+
   return output;
-}
\ No newline at end of file
+}
+
+/*
+ * T-table engine: SubBytes, ShiftRows and MixColumns fused into four 1 KB
+ * lookup tables per direction, so a full round on the four big-endian
+ * column words is 16 lookups and 16 XORs. The tables are generated from
+ * the S-boxes the first time a context is created; pthread_once makes that
+ * safe when several threads (e.g. ctypes callers without the GIL) create
+ * their first contexts at the same time.
+ */
+static uint32_t Te0[256], Te1[256], Te2[256], Te3[256];
+static uint32_t Td0[256], Td1[256], Td2[256], Td3[256];
+static pthread_once_t tables_once = PTHREAD_ONCE_INIT;
+
+static uint32_t ror8(uint32_t w) { return (w >> 8) | (w << 24); }
+
+static void generate_tables(void) {
+  for (int x = 0; x < 256; x++) {
+    unsigned char s = s_box[x];
+    unsigned char i = inv_s_box[x];
+    Te0[x] = ((uint32_t)multiply2(s) << 24) | ((uint32_t)s << 16) | ((uint32_t)s << 8) | multiply3(s);
+    Td0[x] = ((uint32_t)multiply14(i) << 24) | ((uint32_t)multiply9(i) << 16) |
+             ((uint32_t)multiply13(i) << 8) | multiply11(i);
+    Te1[x] = ror8(Te0[x]);
+    Te2[x] = ror8(Te1[x]);
+    Te3[x] = ror8(Te2[x]);
+    Td1[x] = ror8(Td0[x]);
+    Td2[x] = ror8(Td1[x]);
+    Td3[x] = ror8(Td2[x]);
+  }
+}
+
+static void init_tables(void) { pthread_once(&tables_once, generate_tables); }
+
+static uint32_t load_be32(const unsigned char *p) {
+  return ((uint32_t)p[0] << 24) | ((uint32_t)p[1] << 16) | ((uint32_t)p[2] << 8) | p[3];
+}
+
+static void store_be32(unsigned char *p, uint32_t w) {
+  p[0] = (unsigned char)(w >> 24);
+  p[1] = (unsigned char)(w >> 16);
+  p[2] = (unsigned char)(w >> 8);
+  p[3] = (unsigned char)w;
+}
+
+// InvMixColumns of one column word, used for the decryption key schedule
+static uint32_t inv_mix_column_word(uint32_t w) {
+  return Td0[s_box[w >> 24]] ^ Td1[s_box[(w >> 16) & 0xff]] ^
+         Td2[s_box[(w >> 8) & 0xff]] ^ Td3[s_box[w & 0xff]];
+}
+
+static void ttable_encrypt(const uint32_t *rk, int rounds, const unsigned char *in, unsigned char *out) {
+  uint32_t s0 = load_be32(in) ^ rk[0];
+  uint32_t s1 = load_be32(in + 4) ^ rk[1];
+  uint32_t s2 = load_be32(in + 8) ^ rk[2];
+  uint32_t s3 = load_be32(in + 12) ^ rk[3];
+  uint32_t t0, t1, t2, t3;
+
+  for (int round = 1; round < rounds; round++) {
+      rk += 4;
+      t0 = Te0[s0 >> 24] ^ Te1[(s1 >> 16) & 0xff] ^ Te2[(s2 >> 8) & 0xff] ^ Te3[s3 & 0xff] ^ rk[0];
+      t1 = Te0[s1 >> 24] ^ Te1[(s2 >> 16) & 0xff] ^ Te2[(s3 >> 8) & 0xff] ^ Te3[s0 & 0xff] ^ rk[1];
+      t2 = Te0[s2 >> 24] ^ Te1[(s3 >> 16) & 0xff] ^ Te2[(s0 >> 8) & 0xff] ^ Te3[s1 & 0xff] ^ rk[2];
+      t3 = Te0[s3 >> 24] ^ Te1[(s0 >> 16) & 0xff] ^ Te2[(s1 >> 8) & 0xff] ^ Te3[s2 & 0xff] ^ rk[3];
+      s0 = t0; s1 = t1; s2 = t2; s3 = t3;
+  }
+
+  // Final round: SubBytes and ShiftRows only
+  rk += 4;
+  store_be32(out, (((uint32_t)s_box[s0 >> 24] << 24) | ((uint32_t)s_box[(s1 >> 16) & 0xff] << 16) |
+                   ((uint32_t)s_box[(s2 >> 8) & 0xff] << 8) | s_box[s3 & 0xff]) ^ rk[0]);
+  store_be32(out + 4, (((uint32_t)s_box[s1 >> 24] << 24) | ((uint32_t)s_box[(s2 >> 16) & 0xff] << 16) |
+                       ((uint32_t)s_box[(s3 >> 8) & 0xff] << 8) | s_box[s0 & 0xff]) ^ rk[1]);
+  store_be32(out + 8, (((uint32_t)s_box[s2 >> 24] << 24) | ((uint32_t)s_box[(s3 >> 16) & 0xff] << 16) |
+                       ((uint32_t)s_box[(s0 >> 8) & 0xff] << 8) | s_box[s1 & 0xff]) ^ rk[2]);
+  store_be32(out + 12, (((uint32_t)s_box[s3 >> 24] << 24) | ((uint32_t)s_box[(s0 >> 16) & 0xff] << 16) |
+                        ((uint32_t)s_box[(s1 >> 8) & 0xff] << 8) | s_box[s2 & 0xff]) ^ rk[3]);
+}
+
+static void ttable_decrypt(const uint32_t *rk, int rounds, const unsigned char *in, unsigned char *out) {
+  uint32_t s0 = load_be32(in) ^ rk[0];
+  uint32_t s1 = load_be32(in + 4) ^ rk[1];
+  uint32_t s2 = load_be32(in + 8) ^ rk[2];
+  uint32_t s3 = load_be32(in + 12) ^ rk[3];
+  uint32_t t0, t1, t2, t3;
+
+  for (int round = 1; round < rounds; round++) {
+      rk += 4;
+      t0 = Td0[s0 >> 24] ^ Td1[(s3 >> 16) & 0xff] ^ Td2[(s2 >> 8) & 0xff] ^ Td3[s1 & 0xff] ^ rk[0];
+      t1 = Td0[s1 >> 24] ^ Td1[(s0 >> 16) & 0xff] ^ Td2[(s3 >> 8) & 0xff] ^ Td3[s2 & 0xff] ^ rk[1];
+      t2 = Td0[s2 >> 24] ^ Td1[(s1 >> 16) & 0xff] ^ Td2[(s0 >> 8) & 0xff] ^ Td3[s3 & 0xff] ^ rk[2];
+      t3 = Td0[s3 >> 24] ^ Td1[(s2 >> 16) & 0xff] ^ Td2[(s1 >> 8) & 0xff] ^ Td3[s0 & 0xff] ^ rk[3];
+      s0 = t0; s1 = t1; s2 = t2; s3 = t3;
+  }
+
+  // Final round: InvSubBytes and InvShiftRows only
+  rk += 4;
+  store_be32(out, (((uint32_t)inv_s_box[s0 >> 24] << 24) | ((uint32_t)inv_s_box[(s3 >> 16) & 0xff] << 16) |
+                   ((uint32_t)inv_s_box[(s2 >> 8) & 0xff] << 8) | inv_s_box[s1 & 0xff]) ^ rk[0]);
+  store_be32(out + 4, (((uint32_t)inv_s_box[s1 >> 24] << 24) | ((uint32_t)inv_s_box[(s0 >> 16) & 0xff] << 16) |
+                       ((uint32_t)inv_s_box[(s3 >> 8) & 0xff] << 8) | inv_s_box[s2 & 0xff]) ^ rk[1]);
+  store_be32(out + 8, (((uint32_t)inv_s_box[s2 >> 24] << 24) | ((uint32_t)inv_s_box[(s1 >> 16) & 0xff] << 16) |
+                       ((uint32_t)inv_s_box[(s0 >> 8) & 0xff] << 8) | inv_s_box[s3 & 0xff]) ^ rk[2]);
+  store_be32(out + 12, (((uint32_t)inv_s_box[s3 >> 24] << 24) | ((uint32_t)inv_s_box[(s2 >> 16) & 0xff] << 16) |
+                        ((uint32_t)inv_s_box[(s1 >> 8) & 0xff] << 8) | inv_s_box[s0 & 0xff]) ^ rk[3]);
+}
+
+/*
+ * Bitsliced engine: 8 blocks are transposed into 8 bit planes, one per bit
+ * of a byte. Each plane is 128 bits held in two 64-bit words; byte position
+ * p of the state (0-15) occupies bits 8 * (p % 8) .. 8 * (p % 8) + 7 of word
+ * p / 8, one bit per block. The S-box is computed as the GF(2^8) inverse
+ * (x^254) followed by the affine map, entirely with AND/XOR on whole words,
+ * so no memory access ever depends on secret data.
+ */
+#define BS_BLOCKS 8
+
+typedef uint64_t bs_state[8][2];
+
+// Transpose an 8x8 bit matrix held one row per byte (Hacker's Delight 7-3)
+static uint64_t transpose8(uint64_t x) {
+  uint64_t t;
+  t = (x ^ (x >> 7)) & 0x00aa00aa00aa00aaULL;
+  x = x ^ t ^ (t << 7);
+  t = (x ^ (x >> 14)) & 0x0000cccc0000ccccULL;
+  x = x ^ t ^ (t << 14);
+  t = (x ^ (x >> 28)) & 0x00000000f0f0f0f0ULL;
+  x = x ^ t ^ (t << 28);
+  return x;
+}
+
+// For each byte position, gather that byte of every block (one per row) and
+// transpose, so that row b of the result holds bit b of all 8 blocks
+static void bs_pack(bs_state q, const unsigned char *in, size_t n_blocks) {
+  memset(q, 0, sizeof(bs_state));
+  for (int p = 0; p < BLOCK_SIZE; p++) {
+      uint64_t rows = 0;
+      for (size_t k = 0; k < n_blocks; k++) {
+          rows |= (uint64_t)in[k * BLOCK_SIZE + p] << (8 * k);
+      }
+      rows = transpose8(rows);
+      for (int b = 0; b < 8; b++) {
+          q[b][p >> 3] |= ((rows >> (8 * b)) & 0xff) << ((p & 7) * 8);
+      }
+  }
+}
+
+static void bs_unpack(bs_state q, unsigned char *out, size_t n_blocks) {
+  for (int p = 0; p < BLOCK_SIZE; p++) {
+      uint64_t rows = 0;
+      for (int b = 0; b < 8; b++) {
+          rows |= ((q[b][p >> 3] >> ((p & 7) * 8)) & 0xff) << (8 * b);
+      }
+      rows = transpose8(rows);
+      for (size_t k = 0; k < n_blocks; k++) {
+          out[k * BLOCK_SIZE + p] = (unsigned char)(rows >> (8 * k));
+      }
+  }
+}
+
+// Bitsliced GF(2^8) multiplication by shift-and-add (Horner's rule over the
+// bits of b); r may alias a or b
+static inline void bs_xtime(const uint64_t *x, uint64_t *r);
+
+static inline void bs_gf_mul(const uint64_t *a, const uint64_t *b, uint64_t *r) {
+  uint64_t acc[8] = {0};
+  for (int i = 7; i >= 0; i--) {
+      bs_xtime(acc, acc);
+      for (int j = 0; j < 8; j++) {
+          acc[j] ^= a[j] & b[i];
+      }
+  }
+  memcpy(r, acc, sizeof(acc));
+}
+
+// Bitsliced squaring. Squaring is linear in GF(2^8), so each output bit is
+// a fixed XOR of input bits (x^2i reduced modulo the AES polynomial); r may
+// alias a
+static void bs_gf_square(const uint64_t *a, uint64_t *r) {
+  uint64_t a0 = a[0], a1 = a[1], a2 = a[2], a3 = a[3];
+  uint64_t a4 = a[4], a5 = a[5], a6 = a[6], a7 = a[7];
+  r[0] = a0 ^ a4 ^ a6;
+  r[1] = a4 ^ a6 ^ a7;
+  r[2] = a1 ^ a5;
+  r[3] = a4 ^ a5 ^ a6 ^ a7;
+  r[4] = a2 ^ a4 ^ a7;
+  r[5] = a5 ^ a6;
+  r[6] = a3 ^ a5;
+  r[7] = a6 ^ a7;
+}
+
+// x^254, which is the multiplicative inverse in GF(2^8) (and maps 0 to 0),
+// with an addition chain of 4 multiplications and 7 squarings
+static void bs_gf_inverse(uint64_t *x) {
+  uint64_t x2[8], x3[8], x12[8], x15[8], t[8];
+  bs_gf_square(x, x2);
+  bs_gf_mul(x2, x, x3);
+  bs_gf_square(x3, t);
+  bs_gf_square(t, x12);
+  bs_gf_mul(x12, x3, x15);
+  bs_gf_square(x15, t);
+  for (int i = 0; i < 3; i++) {
+      bs_gf_square(t, t);
+  }
+  bs_gf_mul(t, x12, t);   // x^240 * x^12 = x^252
+  bs_gf_mul(t, x2, x);    // x^252 * x^2 = x^254
+}
+
+static void bs_sub_bytes(bs_state q) {
+  for (int h = 0; h < 2; h++) {
+      uint64_t x[8], s[8];
+      for (int b = 0; b < 8; b++) x[b] = q[b][h];
+      bs_gf_inverse(x);
+      // Affine map: s_i = x_i ^ x_(i+4) ^ x_(i+5) ^ x_(i+6) ^ x_(i+7) ^ 0x63_i
+      for (int b = 0; b < 8; b++) {
+          s[b] = x[b] ^ x[(b + 4) & 7] ^ x[(b + 5) & 7] ^ x[(b + 6) & 7] ^ x[(b + 7) & 7];
+      }
+      s[0] = ~s[0]; s[1] = ~s[1]; s[5] = ~s[5]; s[6] = ~s[6];
+      for (int b = 0; b < 8; b++) q[b][h] = s[b];
+  }
+}
+
+static void bs_inv_sub_bytes(bs_state q) {
+  for (int h = 0; h < 2; h++) {
+      uint64_t s[8], x[8];
+      for (int b = 0; b < 8; b++) s[b] = q[b][h];
+      // Inverse affine map: x_i = s_(i+2) ^ s_(i+5) ^ s_(i+7) ^ 0x05_i
+      for (int b = 0; b < 8; b++) {
+          x[b] = s[(b + 2) & 7] ^ s[(b + 5) & 7] ^ s[(b + 7) & 7];
+      }
+      x[0] = ~x[0]; x[2] = ~x[2];
+      bs_gf_inverse(x);
+      for (int b = 0; b < 8; b++) q[b][h] = x[b];
+  }
+}
+
+/*
+ * ShiftRows on the bit planes. Row r of column c is byte 8 * (r + 4 * (c % 2))
+ * of word c / 2, so each row moves as a masked 32-bit shift within or
+ * across the two words: row 1 rotates by one column, row 2 swaps the words,
+ * row 3 rotates by three columns.
+ */
+#define BS_ROW0 0x000000ff000000ffULL
+#define BS_ROW2 0x00ff000000ff0000ULL
+#define BS_B1 0x000000000000ff00ULL
+#define BS_B3 0x00000000ff000000ULL
+#define BS_B5 0x0000ff0000000000ULL
+#define BS_B7 0xff00000000000000ULL
+
+static void bs_shift_rows(bs_state q) {
+  for (int b = 0; b < 8; b++) {
+      uint64_t lo = q[b][0], hi = q[b][1];
+      q[b][0] = (lo & BS_ROW0) | ((lo >> 32) & BS_B1) | ((hi << 32) & BS_B5) |
+                (hi & BS_ROW2) | ((hi >> 32) & BS_B3) | ((lo << 32) & BS_B7);
+      q[b][1] = (hi & BS_ROW0) | ((hi >> 32) & BS_B1) | ((lo << 32) & BS_B5) |
+                (lo & BS_ROW2) | ((lo >> 32) & BS_B3) | ((hi << 32) & BS_B7);
+  }
+}
+
+static void bs_inv_shift_rows(bs_state q) {
+  for (int b = 0; b < 8; b++) {
+      uint64_t lo = q[b][0], hi = q[b][1];
+      q[b][0] = (lo & BS_ROW0) | ((hi >> 32) & BS_B1) | ((lo << 32) & BS_B5) |
+                (hi & BS_ROW2) | ((lo >> 32) & BS_B3) | ((hi << 32) & BS_B7);
+      q[b][1] = (hi & BS_ROW0) | ((lo >> 32) & BS_B1) | ((hi << 32) & BS_B5) |
+                (lo & BS_ROW2) | ((hi >> 32) & BS_B3) | ((lo << 32) & BS_B7);
+  }
+}
+
+// Rotate the rows of every column up by one / two (row r takes row r + 1 / r + 2)
+static uint64_t bs_rot1(uint64_t x) {
+  return ((x >> 8) & 0x00ffffff00ffffffULL) | ((x << 24) & 0xff000000ff000000ULL);
+}
+static uint64_t bs_rot2(uint64_t x) {
+  return ((x >> 16) & 0x0000ffff0000ffffULL) | ((x << 16) & 0xffff0000ffff0000ULL);
+}
+
+// xtime on bit planes: shift up one plane and fold bit 7 back in as 0x1b
+static inline void bs_xtime(const uint64_t *x, uint64_t *r) {
+  uint64_t top = x[7];
+  r[7] = x[6];
+  r[6] = x[5];
+  r[5] = x[4];
+  r[4] = x[3] ^ top;
+  r[3] = x[2] ^ top;
+  r[2] = x[1];
+  r[1] = x[0] ^ top;
+  r[0] = top;
+}
+
+static void bs_mix_columns(bs_state q) {
+  for (int h = 0; h < 2; h++) {
+      uint64_t t[8], xt[8];
+      // out_r = xtime(a_r ^ a_r+1) ^ a_r+1 ^ a_r+2 ^ a_r+3
+      for (int b = 0; b < 8; b++) t[b] = q[b][h] ^ bs_rot1(q[b][h]);
+      bs_xtime(t, xt);
+      for (int b = 0; b < 8; b++) {
+          q[b][h] = xt[b] ^ bs_rot1(q[b][h]) ^ bs_rot2(t[b]);
+      }
+  }
+}
+
+static void bs_inv_mix_columns(bs_state q) {
+  // Fold the inverse into MixColumns (Sec 4.1.3 in The Design of Rijndael):
+  // a_r ^= xtime(xtime(a_r ^ a_r+2)), then MixColumns
+  for (int h = 0; h < 2; h++) {
+      uint64_t t[8], xt[8];
+      for (int b = 0; b < 8; b++) t[b] = q[b][h] ^ bs_rot2(q[b][h]);
+      bs_xtime(t, xt);
+      bs_xtime(xt, t);
+      for (int b = 0; b < 8; b++) q[b][h] ^= t[b];
+  }
+  bs_mix_columns(q);
+}
+
+static void bs_add_round_key(bs_state q, const uint64_t *round_key) {
+  for (int b = 0; b < 8; b++) {
+      q[b][0] ^= round_key[b * 2];
+      q[b][1] ^= round_key[b * 2 + 1];
+  }
+}
+
+// Broadcast each round key bit to all 8 block lanes of its byte position
+static void bs_expand_round_key(const unsigned char *round_key, uint64_t *out) {
+  memset(out, 0, 16 * sizeof(uint64_t));
+  for (int p = 0; p < BLOCK_SIZE; p++) {
+      for (int b = 0; b < 8; b++) {
+          uint64_t mask = (uint64_t)0 - ((round_key[p] >> b) & 1);
+          out[b * 2 + (p >> 3)] |= (mask & 0xff) << ((p & 7) * 8);
+      }
+  }
+}
+
+static void bs_encrypt(const uint64_t *rk, int rounds, const unsigned char *in, unsigned char *out, size_t n_blocks) {
+  bs_state q;
+  bs_pack(q, in, n_blocks);
+  bs_add_round_key(q, rk);
+  for (int round = 1; round < rounds; round++) {
+      bs_sub_bytes(q);
+      bs_shift_rows(q);
+      bs_mix_columns(q);
+      bs_add_round_key(q, rk + round * 16);
+  }
+  bs_sub_bytes(q);
+  bs_shift_rows(q);
+  bs_add_round_key(q, rk + rounds * 16);
+  bs_unpack(q, out, n_blocks);
+}
+
+static void bs_decrypt(const uint64_t *rk, int rounds, const unsigned char *in, unsigned char *out, size_t n_blocks) {
+  bs_state q;
+  bs_pack(q, in, n_blocks);
+  bs_add_round_key(q, rk + rounds * 16);
+  for (int round = rounds - 1; round > 0; round--) {
+      bs_inv_shift_rows(q);
+      bs_inv_sub_bytes(q);
+      bs_add_round_key(q, rk + round * 16);
+      bs_inv_mix_columns(q);
+  }
+  bs_inv_shift_rows(q);
+  bs_inv_sub_bytes(q);
+  bs_add_round_key(q, rk);
+  bs_unpack(q, out, n_blocks);
+}
+
+/*
+ * AES-NI engine, for x86 CPUs with the AES instructions. Each function is
+ * compiled for the "aes" target on its own, so the library still builds
+ * with plain flags and runs on CPUs without them; aes_cpu_has_aesni()
+ * checks for support at runtime. Encryption uses the FIPS-197 schedule as
+ * is and decryption the equivalent inverse cipher, with AESIMC applied to
+ * the inner round keys. AESENC has a latency of several cycles but can
+ * start every cycle, so bulk calls keep AESNI_BLOCKS blocks in flight.
+ */
+#if (defined(__x86_64__) || defined(__i386__)) && defined(__GNUC__) && !defined(RIJNDAEL_NO_AESNI)
+#define HAVE_AESNI 1
+#include <wmmintrin.h>
+
+#define AESNI_BLOCKS 8
+#define AESNI_TARGET __attribute__((target("aes,sse2")))
+
+static pthread_once_t aesni_once = PTHREAD_ONCE_INIT;
+static int aesni_state;
+
+static void probe_aesni(void) {
+  // RIJNDAEL_DISABLE_AESNI (set to anything but "0") forces the portable code
+  const char *disable = getenv("RIJNDAEL_DISABLE_AESNI");
+  __builtin_cpu_init();
+  aesni_state = __builtin_cpu_supports("aes") && !(disable && *disable && strcmp(disable, "0") != 0);
+}
+
+int aes_cpu_has_aesni(void) {
+  pthread_once(&aesni_once, probe_aesni);
+  return aesni_state;
+}
+
+AESNI_TARGET static void aesni_decryption_keys(const unsigned char *round_keys, int rounds, unsigned char *dec_keys) {
+  for (int round = 0; round <= rounds; round++) {
+      __m128i key = _mm_loadu_si128((const __m128i *)(round_keys + (rounds - round) * BLOCK_SIZE));
+      if (round > 0 && round < rounds) key = _mm_aesimc_si128(key);
+      _mm_storeu_si128((__m128i *)(dec_keys + round * BLOCK_SIZE), key);
+  }
+}
+
+AESNI_TARGET static void aesni_encrypt(const unsigned char *round_keys, int rounds, const unsigned char *in, unsigned char *out, size_t n_blocks) {
+  __m128i rk[15];
+  for (int round = 0; round <= rounds; round++) {
+      rk[round] = _mm_loadu_si128((const __m128i *)(round_keys + round * BLOCK_SIZE));
+  }
+
+  size_t i = 0;
+  for (; i + AESNI_BLOCKS <= n_blocks; i += AESNI_BLOCKS) {
+      __m128i b[AESNI_BLOCKS];
+      for (int k = 0; k < AESNI_BLOCKS; k++) {
+          b[k] = _mm_xor_si128(_mm_loadu_si128((const __m128i *)(in + (i + k) * BLOCK_SIZE)), rk[0]);
+      }
+      for (int round = 1; round < rounds; round++) {
+          for (int k = 0; k < AESNI_BLOCKS; k++) b[k] = _mm_aesenc_si128(b[k], rk[round]);
+      }
+      for (int k = 0; k < AESNI_BLOCKS; k++) {
+          _mm_storeu_si128((__m128i *)(out + (i + k) * BLOCK_SIZE), _mm_aesenclast_si128(b[k], rk[rounds]));
+      }
+  }
+  for (; i < n_blocks; i++) {
+      __m128i b = _mm_xor_si128(_mm_loadu_si128((const __m128i *)(in + i * BLOCK_SIZE)), rk[0]);
+      for (int round = 1; round < rounds; round++) b = _mm_aesenc_si128(b, rk[round]);
+      _mm_storeu_si128((__m128i *)(out + i * BLOCK_SIZE), _mm_aesenclast_si128(b, rk[rounds]));
+  }
+}
+
+AESNI_TARGET static void aesni_decrypt(const unsigned char *dec_keys, int rounds, const unsigned char *in, unsigned char *out, size_t n_blocks) {
+  __m128i rk[15];
+  for (int round = 0; round <= rounds; round++) {
+      rk[round] = _mm_loadu_si128((const __m128i *)(dec_keys + round * BLOCK_SIZE));
+  }
+
+  size_t i = 0;
+  for (; i + AESNI_BLOCKS <= n_blocks; i += AESNI_BLOCKS) {
+      __m128i b[AESNI_BLOCKS];
+      for (int k = 0; k < AESNI_BLOCKS; k++) {
+          b[k] = _mm_xor_si128(_mm_loadu_si128((const __m128i *)(in + (i + k) * BLOCK_SIZE)), rk[0]);
+      }
+      for (int round = 1; round < rounds; round++) {
+          for (int k = 0; k < AESNI_BLOCKS; k++) b[k] = _mm_aesdec_si128(b[k], rk[round]);
+      }
+      for (int k = 0; k < AESNI_BLOCKS; k++) {
+          _mm_storeu_si128((__m128i *)(out + (i + k) * BLOCK_SIZE), _mm_aesdeclast_si128(b[k], rk[rounds]));
+      }
+  }
+  for (; i < n_blocks; i++) {
+      __m128i b = _mm_xor_si128(_mm_loadu_si128((const __m128i *)(in + i * BLOCK_SIZE)), rk[0]);
+      for (int round = 1; round < rounds; round++) b = _mm_aesdec_si128(b, rk[round]);
+      _mm_storeu_si128((__m128i *)(out + i * BLOCK_SIZE), _mm_aesdeclast_si128(b, rk[rounds]));
+  }
+}
+
+// CTR with the 128-bit big-endian counter held as two native 64-bit halves
+AESNI_TARGET static void aesni_ctr(const unsigned char *round_keys, int rounds, unsigned char *counter, const unsigned char *in, unsigned char *out, size_t n_blocks) {
+  __m128i rk[15];
+  for (int round = 0; round <= rounds; round++) {
+      rk[round] = _mm_loadu_si128((const __m128i *)(round_keys + round * BLOCK_SIZE));
+  }
+  uint64_t high = 0, low = 0;
+  for (int j = 0; j < 8; j++) {
+      high = (high << 8) | counter[j];
+      low = (low << 8) | counter[8 + j];
+  }
+
+  size_t i = 0;
+  while (i < n_blocks) {
+      size_t n = n_blocks - i < AESNI_BLOCKS ? n_blocks - i : AESNI_BLOCKS;
+      __m128i b[AESNI_BLOCKS];
+      for (size_t k = 0; k < AESNI_BLOCKS; k++) {
+          b[k] = _mm_xor_si128(_mm_set_epi64x((long long)__builtin_bswap64(low), (long long)__builtin_bswap64(high)), rk[0]);
+          if (k < n && ++low == 0) high++;
+      }
+      for (int round = 1; round < rounds; round++) {
+          for (int k = 0; k < AESNI_BLOCKS; k++) b[k] = _mm_aesenc_si128(b[k], rk[round]);
+      }
+      for (size_t k = 0; k < n; k++) {
+          __m128i data = _mm_loadu_si128((const __m128i *)(in + (i + k) * BLOCK_SIZE));
+          _mm_storeu_si128((__m128i *)(out + (i + k) * BLOCK_SIZE), _mm_xor_si128(data, _mm_aesenclast_si128(b[k], rk[rounds])));
+      }
+      i += n;
+  }
+
+  for (int j = 7; j >= 0; j--) {
+      counter[j] = (unsigned char)high;
+      counter[8 + j] = (unsigned char)low;
+      high >>= 8;
+      low >>= 8;
+  }
+}
+#else
+int aes_cpu_has_aesni(void) {
+  return 0;
+}
+#endif
+
+/*
+ * Keyed context: the key is expanded once when the context is created, and
+ * every block operation afterwards works on caller-supplied buffers without
+ * touching the heap. The schedule is kept in the layout of every engine so
+ * that the engine can be switched at any time.
+ */
+struct aes_context {
+  size_t key_size;
+  int rounds;
+  int engine;
+  unsigned char round_keys[MAX_EXPANDED_KEY_SIZE];
+  uint32_t enc_words[MAX_EXPANDED_KEY_SIZE / 4];
+  uint32_t dec_words[MAX_EXPANDED_KEY_SIZE / 4];
+  uint64_t bs_round_keys[(MAX_EXPANDED_KEY_SIZE / BLOCK_SIZE) * 16];
+  unsigned char ni_dec_keys[MAX_EXPANDED_KEY_SIZE];
+};
+
+// Overwrite key material in a way the compiler cannot optimise away
+static void secure_zero(void *buffer, size_t size) {
+  volatile unsigned char *p = (volatile unsigned char *)buffer;
+  while (size--) {
+      *p++ = 0;
+  }
+}
+
+aes_context *aes_context_new(const unsigned char *key, size_t key_size) {
+  int rounds = aes_rounds_for_key_size(key_size);
+  if (!rounds) return NULL;
+
+  aes_context *ctx = (aes_context *)malloc(sizeof(aes_context));
+  if (!ctx) return NULL;
+
+  init_tables();
+  ctx->key_size = key_size;
+  ctx->rounds = rounds;
+  ctx->engine = aes_cpu_has_aesni() ? AES_ENGINE_AESNI : RIJNDAEL_DEFAULT_ENGINE;
+  expand_key_into(key, key_size, ctx->round_keys);
+
+  // Word schedule for the T-table engine; decryption uses the equivalent
+  // inverse cipher (reversed round keys, InvMixColumns on the inner ones)
+  int n_words = (rounds + 1) * 4;
+  for (int i = 0; i < n_words; i++) {
+      ctx->enc_words[i] = load_be32(ctx->round_keys + i * 4);
+  }
+  for (int round = 0; round <= rounds; round++) {
+      for (int j = 0; j < 4; j++) {
+          uint32_t w = ctx->enc_words[(rounds - round) * 4 + j];
+          ctx->dec_words[round * 4 + j] = (round == 0 || round == rounds) ? w : inv_mix_column_word(w);
+      }
+  }
+
+  // Broadcast schedule for the bitsliced engine
+  for (int round = 0; round <= rounds; round++) {
+      bs_expand_round_key(ctx->round_keys + round * BLOCK_SIZE, ctx->bs_round_keys + round * 16);
+  }
+
+#ifdef HAVE_AESNI
+  if (aes_cpu_has_aesni()) aesni_decryption_keys(ctx->round_keys, rounds, ctx->ni_dec_keys);
+#endif
+  return ctx;
+}
+
+int aes_context_set_engine(aes_context *ctx, int engine) {
+  if (engine != AES_ENGINE_BYTEWISE && engine != AES_ENGINE_TTABLE && engine != AES_ENGINE_BITSLICED &&
+      !(engine == AES_ENGINE_AESNI && aes_cpu_has_aesni())) {
+      return -1;
+  }
+  ctx->engine = engine;
+  return 0;
+}
+
+int aes_context_get_engine(const aes_context *ctx) {
+  return ctx->engine;
+}
+
+// Engine dispatch over n_blocks contiguous blocks; `in` and `out` may alias
+static void encrypt_blocks(const aes_context *ctx, const unsigned char *in, unsigned char *out, size_t n_blocks) {
+#ifdef HAVE_AESNI
+  if (ctx->engine == AES_ENGINE_AESNI) {
+      aesni_encrypt(ctx->round_keys, ctx->rounds, in, out, n_blocks);
+      return;
+  }
+#endif
+  if (ctx->engine == AES_ENGINE_BITSLICED) {
+      for (size_t i = 0; i < n_blocks; i += BS_BLOCKS) {
+          size_t n = n_blocks - i < BS_BLOCKS ? n_blocks - i : BS_BLOCKS;
+          bs_encrypt(ctx->bs_round_keys, ctx->rounds, in + i * BLOCK_SIZE, out + i * BLOCK_SIZE, n);
+      }
+  } else if (ctx->engine == AES_ENGINE_TTABLE) {
+      for (size_t i = 0; i < n_blocks; i++) {
+          ttable_encrypt(ctx->enc_words, ctx->rounds, in + i * BLOCK_SIZE, out + i * BLOCK_SIZE);
+      }
+  } else {
+      unsigned char state[BLOCK_SIZE];
+      for (size_t i = 0; i < n_blocks; i++) {
+          memcpy(state, in + i * BLOCK_SIZE, BLOCK_SIZE);
+          encrypt_state(state, ctx->round_keys, ctx->rounds);
+          memcpy(out + i * BLOCK_SIZE, state, BLOCK_SIZE);
+      }
+  }
+}
+
+static void decrypt_blocks(const aes_context *ctx, const unsigned char *in, unsigned char *out, size_t n_blocks) {
+#ifdef HAVE_AESNI
+  if (ctx->engine == AES_ENGINE_AESNI) {
+      aesni_decrypt(ctx->ni_dec_keys, ctx->rounds, in, out, n_blocks);
+      return;
+  }
+#endif
+  if (ctx->engine == AES_ENGINE_BITSLICED) {
+      for (size_t i = 0; i < n_blocks; i += BS_BLOCKS) {
+          size_t n = n_blocks - i < BS_BLOCKS ? n_blocks - i : BS_BLOCKS;
+          bs_decrypt(ctx->bs_round_keys, ctx->rounds, in + i * BLOCK_SIZE, out + i * BLOCK_SIZE, n);
+      }
+  } else if (ctx->engine == AES_ENGINE_TTABLE) {
+      for (size_t i = 0; i < n_blocks; i++) {
+          ttable_decrypt(ctx->dec_words, ctx->rounds, in + i * BLOCK_SIZE, out + i * BLOCK_SIZE);
+      }
+  } else {
+      unsigned char state[BLOCK_SIZE];
+      for (size_t i = 0; i < n_blocks; i++) {
+          memcpy(state, in + i * BLOCK_SIZE, BLOCK_SIZE);
+          decrypt_state(state, ctx->round_keys, ctx->rounds);
+          memcpy(out + i * BLOCK_SIZE, state, BLOCK_SIZE);
+      }
+  }
+}
+
+void aes_context_encrypt_block(const aes_context *ctx, const unsigned char *in, unsigned char *out) {
+  encrypt_blocks(ctx, in, out, 1);
+}
+
+void aes_context_decrypt_block(const aes_context *ctx, const unsigned char *in, unsigned char *out) {
+  decrypt_blocks(ctx, in, out, 1);
+}
+
+void aes_context_free(aes_context *ctx) {
+  if (!ctx) return;
+  secure_zero(ctx, sizeof(aes_context));
+  free(ctx);
+}
+
+/*
+ * Bulk multi-block entry points. Each processes `n_blocks` consecutive
+ * 16-byte blocks in one call so that foreign-function callers pay the call
+ * overhead once per buffer rather than once per block. `in` and `out` may
+ * point to the same buffer. The counter/IV is updated in place, so a long
+ * message can be processed in several calls. Work is handed to the engine
+ * in batches of BS_BLOCKS so the bitsliced engine always sees full lanes
+ * and the AES-NI engine keeps its pipeline full.
+ */
+void aes_ecb_encrypt(const aes_context *ctx, const unsigned char *in, unsigned char *out, size_t n_blocks) {
+  encrypt_blocks(ctx, in, out, n_blocks);
+}
+
+void aes_ecb_decrypt(const aes_context *ctx, const unsigned char *in, unsigned char *out, size_t n_blocks) {
+  decrypt_blocks(ctx, in, out, n_blocks);
+}
+
+// Increment a 128-bit big-endian counter, wrapping around at 2^128
+static void increment_counter(unsigned char *counter) {
+  for (int i = BLOCK_SIZE - 1; i >= 0; i--) {
+      if (++counter[i] != 0) break;
+  }
+}
+
+void aes_ctr_crypt(const aes_context *ctx, unsigned char *counter, const unsigned char *in, unsigned char *out, size_t n_blocks) {
+  unsigned char keystream[BS_BLOCKS * BLOCK_SIZE];
+
+#ifdef HAVE_AESNI
+  if (ctx->engine == AES_ENGINE_AESNI) {
+      aesni_ctr(ctx->round_keys, ctx->rounds, counter, in, out, n_blocks);
+      return;
+  }
+#endif
+  for (size_t i = 0; i < n_blocks; i += BS_BLOCKS) {
+      size_t n = n_blocks - i < BS_BLOCKS ? n_blocks - i : BS_BLOCKS;
+      for (size_t k = 0; k < n; k++) {
+          memcpy(keystream + k * BLOCK_SIZE, counter, BLOCK_SIZE);
+          increment_counter(counter);
+      }
+      encrypt_blocks(ctx, keystream, keystream, n);
+      for (size_t j = 0; j < n * BLOCK_SIZE; j++) {
+          out[i * BLOCK_SIZE + j] = in[i * BLOCK_SIZE + j] ^ keystream[j];
+      }
+  }
+
+  secure_zero(keystream, sizeof(keystream));
+}
+
+void aes_cbc_decrypt(const aes_context *ctx, unsigned char *iv, const unsigned char *in, unsigned char *out, size_t n_blocks) {
+  unsigned char ciphertext[BS_BLOCKS * BLOCK_SIZE];
+  unsigned char plaintext[BS_BLOCKS * BLOCK_SIZE];
+
+  for (size_t i = 0; i < n_blocks; i += BS_BLOCKS) {
+      size_t n = n_blocks - i < BS_BLOCKS ? n_blocks - i : BS_BLOCKS;
+      // Keep the ciphertext before `out` overwrites it (in-place use)
+      memcpy(ciphertext, in + i * BLOCK_SIZE, n * BLOCK_SIZE);
+      decrypt_blocks(ctx, ciphertext, plaintext, n);
+      for (size_t k = 0; k < n; k++) {
+          const unsigned char *previous = k == 0 ? iv : ciphertext + (k - 1) * BLOCK_SIZE;
+          for (int j = 0; j < BLOCK_SIZE; j++) {
+              out[(i + k) * BLOCK_SIZE + j] = plaintext[k * BLOCK_SIZE + j] ^ previous[j];
+          }
+      }
+      memcpy(iv, ciphertext + (n - 1) * BLOCK_SIZE, BLOCK_SIZE);
+  }
+
+  secure_zero(plaintext, sizeof(plaintext));
+}
+
+void aes_cbc_encrypt(const aes_context *ctx, unsigned char *iv, const unsigned char *in, unsigned char *out, size_t n_blocks) {
+  unsigned char block[BLOCK_SIZE];
+
+  // CBC encryption is serial, but one call still covers the whole message
+  for (size_t i = 0; i < n_blocks; i++) {
+      for (int j = 0; j < BLOCK_SIZE; j++) {
+          block[j] = in[i * BLOCK_SIZE + j] ^ iv[j];
+      }
+      encrypt_blocks(ctx, block, iv, 1);
+      memcpy(out + i * BLOCK_SIZE, iv, BLOCK_SIZE);
+  }
+
+  secure_zero(block, sizeof(block));
+}
+
+/*
+ * Multi-buffer CBC/PCBC encryption. A single CBC message is serial, but
+ * independent messages are not: AES-NI lanes are filled with up to
+ * AESNI_BLOCKS jobs which advance one block at a time in lock-step, so
+ * their rounds overlap in the pipeline, and a lane that finishes is given
+ * the next pending job. Lanes may use different keys and key sizes. Jobs
+ * on contexts with a portable engine are encrypted one after the other.
+ * PCBC is CBC with P ^ C instead of C as the next chaining value.
+ */
+static void encrypt_job_serial(aes_cbc_job *job, int pcbc) {
+  unsigned char block[BLOCK_SIZE];
+
+  for (size_t i = 0; i < job->n_blocks; i++) {
+      const unsigned char *in = job->in + i * BLOCK_SIZE;
+      unsigned char *out = job->out + i * BLOCK_SIZE;
+      for (int j = 0; j < BLOCK_SIZE; j++) {
+          block[j] = in[j] ^ job->iv[j];
+      }
+      // Keep the plaintext before `out` overwrites it (in-place use)
+      memcpy(job->iv, in, BLOCK_SIZE);
+      encrypt_blocks(job->ctx, block, out, 1);
+      for (int j = 0; j < BLOCK_SIZE; j++) {
+          job->iv[j] = pcbc ? job->iv[j] ^ out[j] : out[j];
+      }
+  }
+
+  secure_zero(block, sizeof(block));
+}
+
+#ifdef HAVE_AESNI
+static aes_cbc_job *next_aesni_job(aes_cbc_job *jobs, size_t n_jobs, size_t *next) {
+  while (*next < n_jobs) {
+      aes_cbc_job *job = &jobs[(*next)++];
+      if (job->ctx->engine == AES_ENGINE_AESNI && job->n_blocks > 0) return job;
+  }
+  return NULL;
+}
+
+AESNI_TARGET static void aesni_cbc_encrypt_multi(aes_cbc_job *jobs, size_t n_jobs, int pcbc) {
+  aes_cbc_job *lane[AESNI_BLOCKS];
+  size_t position[AESNI_BLOCKS];
+  __m128i chain[AESNI_BLOCKS];
+  size_t next = 0;
+  int active = 0;
+
+  for (int k = 0; k < AESNI_BLOCKS; k++) {
+      lane[k] = next_aesni_job(jobs, n_jobs, &next);
+      if (!lane[k]) continue;
+      chain[k] = _mm_loadu_si128((const __m128i *)lane[k]->iv);
+      position[k] = 0;
+      active++;
+  }
+
+  while (active) {
+      __m128i plain[AESNI_BLOCKS], b[AESNI_BLOCKS];
+      int max_rounds = 0;
+      for (int k = 0; k < AESNI_BLOCKS; k++) {
+          if (!lane[k]) continue;
+          const unsigned char *rk = lane[k]->ctx->round_keys;
+          plain[k] = _mm_loadu_si128((const __m128i *)(lane[k]->in + position[k] * BLOCK_SIZE));
+          b[k] = _mm_xor_si128(_mm_xor_si128(plain[k], chain[k]), _mm_loadu_si128((const __m128i *)rk));
+          if (lane[k]->ctx->rounds > max_rounds) max_rounds = lane[k]->ctx->rounds;
+      }
+      for (int round = 1; round < max_rounds; round++) {
+          for (int k = 0; k < AESNI_BLOCKS; k++) {
+              if (lane[k] && round < lane[k]->ctx->rounds) {
+                  b[k] = _mm_aesenc_si128(b[k], _mm_loadu_si128((const __m128i *)(lane[k]->ctx->round_keys + round * BLOCK_SIZE)));
+              }
+          }
+      }
+      for (int k = 0; k < AESNI_BLOCKS; k++) {
+          if (!lane[k]) continue;
+          const aes_context *ctx = lane[k]->ctx;
+          __m128i c = _mm_aesenclast_si128(b[k], _mm_loadu_si128((const __m128i *)(ctx->round_keys + ctx->rounds * BLOCK_SIZE)));
+          _mm_storeu_si128((__m128i *)(lane[k]->out + position[k] * BLOCK_SIZE), c);
+          chain[k] = pcbc ? _mm_xor_si128(c, plain[k]) : c;
+          if (++position[k] < lane[k]->n_blocks) continue;
+
+          // This job is done: hand its lane to the next one
+          _mm_storeu_si128((__m128i *)lane[k]->iv, chain[k]);
+          lane[k] = next_aesni_job(jobs, n_jobs, &next);
+          if (lane[k]) {
+              chain[k] = _mm_loadu_si128((const __m128i *)lane[k]->iv);
+              position[k] = 0;
+          } else {
+              active--;
+          }
+      }
+  }
+}
+#endif
+
+void aes_cbc_encrypt_multi(aes_cbc_job *jobs, size_t n_jobs, int pcbc) {
+  for (size_t i = 0; i < n_jobs; i++) {
+      if (jobs[i].ctx->engine == AES_ENGINE_AESNI) continue;
+      if (pcbc) {
+          encrypt_job_serial(&jobs[i], 1);
+      } else {
+          aes_cbc_encrypt(jobs[i].ctx, jobs[i].iv, jobs[i].in, jobs[i].out, jobs[i].n_blocks);
+      }
+  }
+#ifdef HAVE_AESNI
+  aesni_cbc_encrypt_multi(jobs, n_jobs, pcbc);
+#endif
+}
+
+/*
+ * GHASH, the GF(2^128) universal hash of GCM, with Shoup's 4-bit tables:
+ * table[i] = i * H for every 4-bit i, so multiplying by H takes 32 table
+ * lookups and 4-bit shifts instead of 128 conditional XORs. Blocks are held
+ * as two big-endian 64-bit halves; in GCM's bit order, multiplying by x is
+ * a right shift and the reduction polynomial is 0xE1 << 120.
+ */
+struct ghash_context {
+  uint64_t high[16];
+  uint64_t low[16];
+};
+
+// Reduction of the 4 bits shifted out of the low end, placed in the top 16
+static const uint64_t ghash_last4[16] = {
+  0x0000, 0x1c20, 0x3840, 0x2460, 0x7080, 0x6ca0, 0x48c0, 0x54e0,
+  0xe100, 0xfd20, 0xd940, 0xc560, 0x9180, 0x8da0, 0xa9c0, 0xb5e0
+};
+
+static uint64_t load_be64(const unsigned char *p) {
+  return ((uint64_t)load_be32(p) << 32) | load_be32(p + 4);
+}
+
+static void store_be64(unsigned char *p, uint64_t v) {
+  store_be32(p, (uint32_t)(v >> 32));
+  store_be32(p + 4, (uint32_t)v);
+}
+
+ghash_context *ghash_context_new(const unsigned char *h) {
+  ghash_context *ctx = (ghash_context *)malloc(sizeof(ghash_context));
+  if (!ctx) return NULL;
+
+  uint64_t vh = load_be64(h), vl = load_be64(h + 8);
+  // Nibble bit 8 is x^0, so table[8] = H and halving the index multiplies by x
+  ctx->high[0] = ctx->low[0] = 0;
+  ctx->high[8] = vh;
+  ctx->low[8] = vl;
+  for (int i = 4; i > 0; i >>= 1) {
+      uint64_t carry = (vl & 1) ? 0xe1000000u : 0;
+      vl = (vh << 63) | (vl >> 1);
+      vh = (vh >> 1) ^ (carry << 32);
+      ctx->high[i] = vh;
+      ctx->low[i] = vl;
+  }
+  for (int i = 2; i < 16; i <<= 1) {
+      for (int j = 1; j < i; j++) {
+          ctx->high[i + j] = ctx->high[i] ^ ctx->high[j];
+          ctx->low[i + j] = ctx->low[i] ^ ctx->low[j];
+      }
+  }
+  return ctx;
+}
+
+// y = y * H, processing the nibbles of y from the last one to the first
+static void ghash_multiply(const ghash_context *ctx, unsigned char *y) {
+  unsigned char lo = y[15] & 0xf;
+  uint64_t zh = ctx->high[lo], zl = ctx->low[lo];
+
+  for (int i = 15; i >= 0; i--) {
+      unsigned char nibbles[2] = { (unsigned char)(y[i] & 0xf), (unsigned char)(y[i] >> 4) };
+      for (int k = i == 15 ? 1 : 0; k < 2; k++) {
+          unsigned char rem = zl & 0xf;
+          zl = (zh << 60) | (zl >> 4);
+          zh = (zh >> 4) ^ (ghash_last4[rem] << 48);
+          zh ^= ctx->high[nibbles[k]];
+          zl ^= ctx->low[nibbles[k]];
+      }
+  }
+  store_be64(y, zh);
+  store_be64(y + 8, zl);
+}
+
+void ghash_update(const ghash_context *ctx, unsigned char *y, const unsigned char *data, size_t n_blocks) {
+  for (size_t i = 0; i < n_blocks; i++) {
+      for (int j = 0; j < BLOCK_SIZE; j++) {
+          y[j] ^= data[i * BLOCK_SIZE + j];
+      }
+      ghash_multiply(ctx, y);
+  }
+}
+
+void ghash_context_free(ghash_context *ctx) {
+  if (!ctx) return;
+  secure_zero(ctx, sizeof(ghash_context));
+  free(ctx);
+}
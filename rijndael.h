@@ -7,6 +7,10 @@
 
 #define BLOCK_ACCESS(block, row, col) (block[(row * 4) + col])
 #define BLOCK_SIZE 16
+#define EXPANDED_KEY_SIZE 176     // AES-128: 11 round keys
+#define MAX_EXPANDED_KEY_SIZE 240 // AES-256: 15 round keys
+
+#include <stddef.h>
 
 /*
  * These should be the main encrypt/decrypt functions (i.e. the main
@@ -28,8 +32,106 @@ void inv_mix_columns(unsigned char *state);
 // Key expansion
 unsigned char *expand_key(const unsigned char *key);
 
+/*
+ * Key-size-aware variants: AES-128, AES-192 and AES-256 use 16, 24 and 32
+ * byte keys with 10, 12 and 14 rounds. expand_key_sized returns the
+ * (rounds + 1) * 16 byte schedule, or NULL for an unsupported key size.
+ */
+int aes_rounds_for_key_size(size_t key_size);
+unsigned char *expand_key_sized(const unsigned char *key, size_t key_size);
+
 // Main encryption and decryption functions
 unsigned char *aes_encrypt_block(const unsigned char *plaintext, const unsigned char *key);
 unsigned char *aes_decrypt_block(const unsigned char *ciphertext, const unsigned char *key);
 
+/*
+ * Keyed context API: expand the key once with aes_context_new, then
+ * encrypt/decrypt any number of blocks into caller-supplied 16-byte
+ * buffers (which may alias the input) without further heap allocation.
+ * aes_context_new accepts 16, 24 or 32 byte keys and returns NULL for
+ * any other size or when out of memory. aes_context_free wipes the key schedule before releasing it.
+ */
+typedef struct aes_context aes_context;
+
+/*
+ * Round engines. All produce identical output:
+ *  - AES_ENGINE_BYTEWISE runs the byte-wise transformations above,
+ *  - AES_ENGINE_TTABLE fuses SubBytes/ShiftRows/MixColumns into 32-bit
+ *    table lookups,
+ *  - AES_ENGINE_BITSLICED processes 8 blocks at once in 64-bit bit planes
+ *    with no secret-dependent memory access (constant time),
+ *  - AES_ENGINE_AESNI uses the x86 AES instructions (also constant time),
+ *    with 8 blocks in flight in bulk calls. It is only available when
+ *    aes_cpu_has_aesni() returns 1.
+ * New contexts use AES-NI when the CPU supports it and RIJNDAEL_DEFAULT_ENGINE
+ * otherwise. The default can be overridden at build time (e.g.
+ * -DRIJNDAEL_DEFAULT_ENGINE=2, or -DRIJNDAEL_NO_AESNI to leave AES-NI out)
+ * and per context at runtime with aes_context_set_engine (returns -1 for an
+ * unknown or unsupported engine).
+ */
+#define AES_ENGINE_BYTEWISE 0
+#define AES_ENGINE_TTABLE 1
+#define AES_ENGINE_BITSLICED 2
+#define AES_ENGINE_AESNI 3
+
+/*
+ * Returns 1 if the CPU has the AES instructions (detected on first call)
+ * and the RIJNDAEL_DISABLE_AESNI environment variable is unset or "0",
+ * which lets the portable engines be tested on any machine.
+ */
+int aes_cpu_has_aesni(void);
+
+#ifndef RIJNDAEL_DEFAULT_ENGINE
+#define RIJNDAEL_DEFAULT_ENGINE AES_ENGINE_TTABLE
+#endif
+
+aes_context *aes_context_new(const unsigned char *key, size_t key_size);
+void aes_context_encrypt_block(const aes_context *ctx, const unsigned char *in, unsigned char *out);
+void aes_context_decrypt_block(const aes_context *ctx, const unsigned char *in, unsigned char *out);
+void aes_context_free(aes_context *ctx);
+int aes_context_set_engine(aes_context *ctx, int engine);
+int aes_context_get_engine(const aes_context *ctx);
+
+/*
+ * Bulk entry points over n_blocks contiguous 16-byte blocks. `in` and `out`
+ * may be the same buffer. The CTR counter is a 128-bit big-endian integer;
+ * both it and the CBC IV are advanced in place so that calls can be chained.
+ */
+void aes_ecb_encrypt(const aes_context *ctx, const unsigned char *in, unsigned char *out, size_t n_blocks);
+void aes_ecb_decrypt(const aes_context *ctx, const unsigned char *in, unsigned char *out, size_t n_blocks);
+void aes_ctr_crypt(const aes_context *ctx, unsigned char *counter, const unsigned char *in, unsigned char *out, size_t n_blocks);
+void aes_cbc_decrypt(const aes_context *ctx, unsigned char *iv, const unsigned char *in, unsigned char *out, size_t n_blocks);
+void aes_cbc_encrypt(const aes_context *ctx, unsigned char *iv, const unsigned char *in, unsigned char *out, size_t n_blocks);
+
+/*
+ * Multi-buffer CBC encryption of many independent messages, or PCBC with
+ * `pcbc` set. Each job encrypts n_blocks whole (already padded) blocks
+ * from `in` to `out` (which may be the same buffer) under its own context,
+ * and its 16-byte `iv` is replaced by the final chaining value. On the
+ * AES-NI engine up to 8 jobs are interleaved block by block, so throughput
+ * grows with the number of messages rather than being bound by the latency
+ * of one serial chain.
+ */
+typedef struct aes_cbc_job {
+  const aes_context *ctx;
+  unsigned char *iv;
+  const unsigned char *in;
+  unsigned char *out;
+  size_t n_blocks;
+} aes_cbc_job;
+
+void aes_cbc_encrypt_multi(aes_cbc_job *jobs, size_t n_jobs, int pcbc);
+
+/*
+ * GHASH for GCM: ghash_context_new precomputes 4-bit multiplication tables
+ * for the hash key H (16 bytes, the encryption of the zero block) and
+ * returns NULL when out of memory. ghash_update absorbs n_blocks 16-byte
+ * blocks into the running 16-byte hash value y, in place.
+ */
+typedef struct ghash_context ghash_context;
+
+ghash_context *ghash_context_new(const unsigned char *h);
+void ghash_update(const ghash_context *ctx, unsigned char *y, const unsigned char *data, size_t n_blocks);
+void ghash_context_free(ghash_context *ctx);
+
 #endif /* RIJNDAEL_H */
\ No newline at end of file
@@ -7,6 +7,18 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import random
 import platform
 import subprocess
+import mmap
+import io
+import tempfile
+import json
+import threading
+import time
+import gc
+import warnings
+import hmac
+import asyncio
+import socket
+from concurrent.futures import ThreadPoolExecutor
 
 # Import the Python AES functions for comparison
 try:
@@ -15,12 +27,22 @@ try:
     from aes import mix_columns as py_mix_columns, inv_mix_columns as py_inv_mix_columns
     from aes import add_round_key as py_add_round_key
     from aes import AES, bytes2matrix, matrix2bytes
+    from aes import NativeContext, load_numpy, load_extension, native_has_aesni
+    from aes import encrypt_stream, decrypt_stream, encrypt_seekable, SeekableReader
+    from aes import encrypt, decrypt, get_key_iv, KeyCache, Session, MAC_CHUNK_SIZE
+    from aes import encrypt_many, decrypt_many, encrypt_multibuffer
+    from aes import KeySchedule, ScheduleCache, schedule_cache
+    from aes import Counter, split_blocks, xor_bytes
+    from aes import collect_metrics
+    from aes import aencrypt, adecrypt, aencrypt_stream, adecrypt_stream
 except ImportError:
     from aes import sub_bytes as py_sub_bytes, inv_sub_bytes as py_inv_sub_bytes
     from aes import shift_rows as py_shift_rows, inv_shift_rows as py_inv_shift_rows
     from aes import mix_columns as py_mix_columns, inv_mix_columns as py_inv_mix_columns
     from aes import add_round_key as py_add_round_key
     from aes import AES, bytes2matrix, matrix2bytes
+    from aes import NativeContext
+    from aes import encrypt_stream, decrypt_stream
 
 # Load the compiled C library
 # Determine platform-specific library name
@@ -35,10 +57,10 @@ if not os.path.exists(lib_name):
     print(f"[INFO] {lib_name} not found — compiling rijndael.c")
     try:
         if platform.system() == "Windows":
-            compile_cmd = ["gcc", "-shared", "-o", "rijndael.dll", "rijndael.c"]
+            compile_cmd = ["gcc", "-shared", "-pthread", "-o", "rijndael.dll", "rijndael.c"]
         else:
             # For Linux and macOS
-            compile_cmd = ["gcc", "-shared", "-fPIC", "-o", lib_name, "rijndael.c"]
+            compile_cmd = ["gcc", "-shared", "-fPIC", "-pthread", "-o", lib_name, "rijndael.c"]
         subprocess.run(compile_cmd, check=True)
         print(f"[INFO] Compilation successful.")
     except subprocess.CalledProcessError:
@@ -53,7 +75,7 @@ except OSError as e:
 
 # Function to expand key in Python
 def py_expand_key(key_bytes):
-    aes = AES(key_bytes)
+    aes = AES(key_bytes, backend="python")
     expanded = []
     for matrix in aes._key_matrices:
         for row in matrix:
@@ -160,6 +182,33 @@ def test_key_expansion():
                 print(f"    Python: {list(py_result[start:end])}")
                 print(f"    C:      {list(c_result[start:end])}")
 
+# Test the key-size-aware expansion for AES-128/192/256 (Python vs. C)
+def test_key_expansion_sized():
+    print("Testing expand_key_sized")
+
+    rijndael.expand_key_sized.argtypes = [ctypes.c_char_p, ctypes.c_size_t]
+    rijndael.expand_key_sized.restype = ctypes.POINTER(ctypes.c_ubyte)
+
+    for i, key_size in enumerate((16, 24, 32)):
+        key = bytes(random.randint(0, 255) for _ in range(key_size))
+        py_result = py_expand_key(key)
+
+        c_result_ptr = rijndael.expand_key_sized(key, key_size)
+        c_result = bytes(c_result_ptr[:len(py_result)])
+        rounds = rijndael.aes_rounds_for_key_size(ctypes.c_size_t(key_size))
+
+        if py_result == c_result and rounds == AES.rounds_by_key_size[key_size]:
+            print(f"  Test {i+1}: PASSED")
+        else:
+            print(f"  Test {i+1}: FAILED")
+            print(f"  Key size: {key_size}, rounds: {rounds}")
+            for j in range(len(py_result) // 16):
+                start = j * 16
+                end = start + 16
+                print(f"  Round {j}:")
+                print(f"    Python: {list(py_result[start:end])}")
+                print(f"    C:      {list(c_result[start:end])}")
+
 # Test full encryption: Python vs. C
 def test_encrypt_block():
     print("Testing aes_encrypt_block")
@@ -171,7 +220,7 @@ def test_encrypt_block():
         key = bytearray(random.randint(0, 255) for _ in range(16))
 
         # Python AES
-        aes = AES(key)
+        aes = AES(key, backend="python")
         py_result = aes.encrypt_block(plaintext)
 
         # C AES
@@ -200,7 +249,7 @@ def test_decrypt_block():
         plaintext = bytearray(random.randint(0, 255) for _ in range(16))
         key = bytearray(random.randint(0, 255) for _ in range(16))
 
-        aes = AES(key)
+        aes = AES(key, backend="python")
         ciphertext = aes.encrypt_block(plaintext)
 
         # C decryption
@@ -219,6 +268,965 @@ def test_decrypt_block():
             print(f"  Ciphertext: {list(ciphertext)}")
             print(f"  Decrypted (C): {list(c_result)}")
 
+# Test the keyed context: one key schedule reused for many blocks
+def test_context_blocks():
+    print("Testing aes_context encrypt/decrypt")
+
+    # One test per key size: AES-128, AES-192, AES-256
+    for i, key_size in enumerate((16, 24, 32)):
+        key = bytes(random.randint(0, 255) for _ in range(key_size))
+        aes = AES(key, backend="python")
+
+        mismatches = 0
+        with NativeContext(key) as ctx:
+            for _ in range(100):
+                plaintext = bytes(random.randint(0, 255) for _ in range(16))
+                ciphertext = ctx.encrypt_block(plaintext)
+                if ciphertext != aes.encrypt_block(plaintext):
+                    mismatches += 1
+                if ctx.decrypt_block(ciphertext) != plaintext:
+                    mismatches += 1
+
+        if mismatches == 0:
+            print(f"  Test {i+1}: PASSED")
+        else:
+            print(f"  Test {i+1}: FAILED")
+            print(f"  Key size: {key_size}, key: {list(key)}")
+            print(f"  Mismatched blocks: {mismatches}")
+
+# Test the bulk ECB/CTR/CBC entry points against the Python modes
+def test_bulk_modes():
+    print("Testing bulk ECB/CTR/CBC-decrypt")
+
+    for i, key_size in enumerate((16, 24, 32)):
+        key = bytes(random.randint(0, 255) for _ in range(key_size))
+        iv = bytes(random.randint(0, 255) for _ in range(16))
+        # Start near a carry so the 128-bit counter increment is exercised
+        counter = iv[:12] + b"\xff\xff\xff\xfe"
+        message = bytes(random.randint(0, 255) for _ in range(16 * 64 + i * 5))
+        blocks = message[:len(message) - len(message) % 16]
+        aes = AES(key, backend="python")
+
+        with NativeContext(key) as ctx:
+            ecb = ctx.encrypt_ecb(blocks)
+            # mmap output and memoryview input go through without copies
+            with mmap.mmap(-1, len(blocks)) as mapped:
+                ctx.decrypt_ecb(memoryview(ecb), out=mapped)
+                ecb_round_trip = mapped[:]
+
+            ctr = ctx.crypt_ctr(message, counter)
+            ctr_round_trip = ctx.crypt_ctr(ctr, counter)
+
+            cbc = aes.encrypt_cbc(blocks, iv)
+            in_place = bytearray(cbc)
+            ctx.decrypt_cbc(in_place, iv, out=in_place)
+
+        results = [
+            bytes(ecb) == b"".join(aes.encrypt_block(blocks[j:j+16]) for j in range(0, len(blocks), 16)),
+            ecb_round_trip == blocks,
+            bytes(ctr) == aes.encrypt_ctr(message, counter),
+            bytes(ctr_round_trip) == message,
+            bytes(in_place[:len(blocks)]) == blocks,
+        ]
+
+        if all(results):
+            print(f"  Test {i+1}: PASSED")
+        else:
+            print(f"  Test {i+1}: FAILED")
+            print(f"  Checks: {results}")
+
+# Test every C round engine (byte-wise, T-table, bitsliced, AES-NI) against Python
+def test_native_engines():
+    print("Testing native engines (bytewise/ttable/bitsliced/aesni)")
+
+    # AES-NI only where the CPU has it; RIJNDAEL_DISABLE_AESNI=1 forces the
+    # portable engines (also the default for new contexts then).
+    engines = [engine for engine in NativeContext.engines if engine != "aesni" or native_has_aesni()]
+    for i, engine in enumerate(engines):
+        failures = []
+        for key_size in (16, 24, 32):
+            key = bytes(random.randint(0, 255) for _ in range(key_size))
+            iv = bytes(random.randint(0, 255) for _ in range(16))
+            # Odd block counts leave the last bitsliced batch partly empty
+            blocks = bytes(random.randint(0, 255) for _ in range(16 * random.randint(1, 20)))
+            aes = AES(key, backend="python")
+
+            with NativeContext(key, engine=engine) as ctx:
+                ecb = bytes(ctx.encrypt_ecb(blocks))
+                checks = {
+                    "ecb": ecb == b"".join(aes.encrypt_block(blocks[j:j+16]) for j in range(0, len(blocks), 16)),
+                    "ecb-decrypt": bytes(ctx.decrypt_ecb(ecb)) == blocks,
+                    "ctr": bytes(ctx.crypt_ctr(blocks, iv)) == aes.encrypt_ctr(blocks, iv),
+                    "cbc-decrypt": bytes(ctx.decrypt_cbc(aes.encrypt_cbc(blocks, iv), iv))[:len(blocks)] == blocks,
+                    "engine": ctx.engine == engine,
+                }
+            failures += [f"AES-{key_size * 8} {name}" for name, ok in checks.items() if not ok]
+
+        if not failures:
+            print(f"  Test {i+1}: PASSED")
+        else:
+            print(f"  Test {i+1}: FAILED")
+            print(f"  Engine: {engine}, failed: {failures}")
+
+    # The forced-fallback switch, in a fresh process since detection is cached
+    code = ("import aes; ctx = aes.native_context(bytes(16))\n"
+            "try:\n    ctx.engine = 'aesni'\nexcept ValueError:\n    pass\n"
+            "print(aes.native_has_aesni(), ctx.engine)")
+    env = dict(os.environ, RIJNDAEL_DISABLE_AESNI="1")
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.stdout.split() == ["False", "ttable"]:
+        print(f"  Test {len(engines)+1}: PASSED")
+    else:
+        print(f"  Test {len(engines)+1}: FAILED")
+        print(f"  RIJNDAEL_DISABLE_AESNI=1 gave: {result.stdout.strip()} {result.stderr.strip()}")
+
+# Test that every mode gives the same result on the native and Python backends
+def test_backends():
+    print("Testing AES backends (native vs python)")
+
+    modes = ("cbc", "pcbc", "cfb", "ofb", "ctr")
+    for i, key_size in enumerate((16, 24, 32)):
+        key = bytes(random.randint(0, 255) for _ in range(key_size))
+        iv = bytes(random.randint(0, 255) for _ in range(16))
+        message = bytes(random.randint(0, 255) for _ in range(random.randint(0, 200)))
+        native = AES(key, backend="native")
+        python = AES(key, backend="python")
+
+        failures = []
+        for mode in modes:
+            ciphertext = getattr(native, "encrypt_" + mode)(message, iv)
+            if ciphertext != getattr(python, "encrypt_" + mode)(message, iv):
+                failures.append("encrypt_" + mode)
+            if getattr(native, "decrypt_" + mode)(ciphertext, iv) != message:
+                failures.append("decrypt_" + mode)
+
+        if not failures and AES(key).backend == "native":
+            print(f"  Test {i+1}: PASSED")
+        else:
+            print(f"  Test {i+1}: FAILED")
+            print(f"  Key size: {key_size}, message length: {len(message)}")
+            print(f"  Mismatched modes: {failures}")
+
+    # Python engines do not apply to the native backend: 'auto' skips it when
+    # one is named, and asking for both explicitly is refused
+    try:
+        AES(bytes(16), engine="reference", backend="native")
+        refused = False
+    except AssertionError:
+        refused = True
+    if refused and AES(bytes(16), engine="reference").backend != "native":
+        print("  Test 4: PASSED")
+    else:
+        print("  Test 4: FAILED")
+
+# Test the _rijndael extension module against the ctypes NativeContext
+def test_extension():
+    print("Testing _rijndael extension (extension vs ctypes)")
+
+    extension = load_extension()
+    if extension is None:
+        print("  Skipped: _rijndael is not available (make extension)")
+        return
+
+    for i, key_size in enumerate((16, 24, 32)):
+        key = bytes(random.randint(0, 255) for _ in range(key_size))
+        iv = bytes(random.randint(0, 255) for _ in range(16))
+        data = bytes(random.randint(0, 255) for _ in range(16 * random.randint(1, 64)))
+        partial = data[:len(data) - random.randint(1, 15)]
+
+        failures = []
+        with extension.Context(key) as ctx, NativeContext(key) as reference:
+            if ctx.encrypt_block(data[:16]) != reference.encrypt_block(data[:16]):
+                failures.append("encrypt_block")
+            if ctx.decrypt_block(data[:16]) != reference.decrypt_block(data[:16]):
+                failures.append("decrypt_block")
+            for name in ("encrypt_ecb", "decrypt_ecb"):
+                if getattr(ctx, name)(data) != getattr(reference, name)(data):
+                    failures.append(name)
+            for name in ("encrypt_cbc", "decrypt_cbc", "crypt_ctr"):
+                if getattr(ctx, name)(data, iv) != getattr(reference, name)(data, iv):
+                    failures.append(name)
+            if ctx.crypt_ctr(partial, iv) != reference.crypt_ctr(partial, iv):
+                failures.append("crypt_ctr (partial block)")
+
+            # In place, through a memoryview of a larger buffer
+            buffer = bytearray(data) + bytearray(16)
+            view = memoryview(buffer)[:len(data)]
+            ctx.encrypt_cbc(view, iv, view)
+            if bytes(view) != reference.encrypt_cbc(data, iv) or buffer[len(data):] != bytes(16):
+                failures.append("in place")
+
+            for engine in NativeContext.engines:
+                if engine == "aesni" and not native_has_aesni():
+                    continue
+                ctx.engine = engine
+                if ctx.engine != engine or ctx.encrypt_ecb(data) != reference.encrypt_ecb(data):
+                    failures.append(f"engine {engine}")
+
+            # Bulk calls release the GIL, so threads can share one context.
+            with ThreadPoolExecutor(4) as executor:
+                results = list(executor.map(lambda _: bytes(ctx.crypt_ctr(data, iv)), range(8)))
+            if results != [bytes(reference.crypt_ctr(data, iv))] * 8:
+                failures.append("threads")
+
+            for call in (lambda: ctx.encrypt_ecb(partial), lambda: ctx.encrypt_block(data[:15]),
+                         lambda: ctx.encrypt_cbc(data, iv, bytearray(8)), lambda: extension.Context(key[:15])):
+                try:
+                    call()
+                    failures.append("invalid input accepted")
+                except ValueError:
+                    pass
+
+        if not failures:
+            print(f"  Test {i+1}: PASSED")
+        else:
+            print(f"  Test {i+1}: FAILED")
+            print(f"  Key size: {key_size}, failed: {failures}")
+
+    # Re-initializing a context or updating a GHash while another thread is
+    # inside a GIL-released call on it is refused instead of racing
+    key = bytes(16)
+    data = bytes(1 << 20)
+    failures = []
+    with extension.Context(key) as ctx, NativeContext(key) as reference:
+        ghash = extension.GHash(key)
+        with ThreadPoolExecutor(1) as executor:
+            futures = [executor.submit(lambda: bytes(ctx.encrypt_ecb(data))) for _ in range(4)]
+            futures += [executor.submit(ghash.update, data) for _ in range(4)]
+            while not all(future.done() for future in futures):
+                for call in (lambda: ctx.__init__(key), lambda: ghash.update(data[:16]), ghash.digest):
+                    try:
+                        call()
+                    except RuntimeError:
+                        pass
+            if [future.result() for future in futures[:4]] != [bytes(reference.encrypt_ecb(data))] * 4:
+                failures.append("context re-initialized while busy")
+    if not failures:
+        print("  Test 4: PASSED")
+    else:
+        print("  Test 4: FAILED")
+        print(f"  Failed: {failures}")
+
+# Test the vectorized NumPy backend against the pure-Python backend
+def test_numpy_backend():
+    print("Testing AES backends (numpy vs python)")
+
+    if load_numpy() is None:
+        print("  Skipped: NumPy is not installed")
+        return
+
+    modes = ("cbc", "pcbc", "cfb", "ofb", "ctr")
+    for i, key_size in enumerate((16, 24, 32)):
+        key = bytes(random.randint(0, 255) for _ in range(key_size))
+        iv = bytes(random.randint(0, 255) for _ in range(16))
+        message = bytes(random.randint(0, 255) for _ in range(random.randint(0, 2000)))
+        vectorized = AES(key, backend="numpy")
+        python = AES(key, backend="python")
+
+        failures = []
+        for mode in modes:
+            ciphertext = getattr(vectorized, "encrypt_" + mode)(message, iv)
+            if ciphertext != getattr(python, "encrypt_" + mode)(message, iv):
+                failures.append("encrypt_" + mode)
+            if getattr(vectorized, "decrypt_" + mode)(ciphertext, iv) != message:
+                failures.append("decrypt_" + mode)
+        blocks = message[:len(message) - len(message) % 16]
+        if vectorized.encrypt_blocks(blocks) != python.encrypt_blocks(blocks):
+            failures.append("encrypt_blocks")
+        if vectorized.decrypt_blocks(blocks) != python.decrypt_blocks(blocks):
+            failures.append("decrypt_blocks")
+        # The 128-bit counter carries across the 64-bit halves
+        wrap = bytes(8) + b"\xff" * 8
+        if vectorized.encrypt_ctr(message, wrap) != python.encrypt_ctr(message, wrap):
+            failures.append("ctr carry")
+
+        if not failures:
+            print(f"  Test {i+1}: PASSED")
+        else:
+            print(f"  Test {i+1}: FAILED")
+            print(f"  Key size: {key_size}, message length: {len(message)}")
+            print(f"  Mismatched modes: {failures}")
+
+# Test that parallel CTR / CBC-decrypt output matches the serial path
+def test_parallel_modes():
+    print("Testing parallel CTR/CBC-decrypt (workers > 1)")
+
+    for i, (backend, key_size) in enumerate((("native", 16), ("python", 24), ("native", 32))):
+        key = bytes(random.randint(0, 255) for _ in range(key_size))
+        # The 128-bit counter wraps after 1000 blocks (16000 bytes), mid-message,
+        # so both segments around the wrap are large enough to be split
+        # across workers
+        iv = b"\xff" * 14 + (0x10000 - 1000).to_bytes(2, "big")
+        message = bytes(random.randint(0, 255) for _ in range(40000 + i))
+
+        serial = AES(key, backend=backend)
+        parallel = AES(key, backend=backend, workers=3)
+        parallel.parallel_chunk_size = 4096
+
+        ctr = serial.encrypt_ctr(message, iv)
+        cbc = serial.encrypt_cbc(message, iv)
+        results = [
+            parallel.encrypt_ctr(message, iv) == ctr,
+            parallel.decrypt_ctr(ctr, iv) == message,
+            parallel.decrypt_cbc(cbc, iv) == message,
+        ]
+
+        if all(results):
+            print(f"  Test {i+1}: PASSED")
+        else:
+            print(f"  Test {i+1}: FAILED")
+            print(f"  Backend: {backend}, checks: {results}")
+
+# Feeds `data` to a streaming cipher in random-sized chunks
+def run_stream(cipher, data):
+    out = b""
+    position = 0
+    while position < len(data):
+        size = random.randint(0, 40)
+        out += cipher.update(data[position:position + size])
+        position += size
+    return out + cipher.finalize()
+
+# Test the incremental encryptors/decryptors against the one-shot modes
+def test_streaming_modes():
+    print("Testing streaming encryptor/decryptor")
+
+    for i, key_size in enumerate((16, 24, 32)):
+        key = bytes(random.randint(0, 255) for _ in range(key_size))
+        iv = bytes(random.randint(0, 255) for _ in range(16))
+        aes = AES(key)
+
+        failures = []
+        for length in (0, 15, 16, 17, 200):
+            message = bytes(random.randint(0, 255) for _ in range(length))
+            for mode in AES.stream_modes:
+                expected = getattr(aes, "encrypt_" + mode)(message, iv)
+                if run_stream(aes.encryptor(mode, iv), message) != expected:
+                    failures.append(f"encrypt {mode} ({length} bytes)")
+                if run_stream(aes.decryptor(mode, iv), expected) != message:
+                    failures.append(f"decrypt {mode} ({length} bytes)")
+
+        if not failures:
+            print(f"  Test {i+1}: PASSED")
+        else:
+            print(f"  Test {i+1}: FAILED")
+            print(f"  Key size: {key_size}, failed: {failures}")
+
+# Test the chunked stream format round-trips and rejects damaged streams
+def test_stream_container():
+    print("Testing encrypt_stream/decrypt_stream")
+
+    chunk_size = 64
+    for i, length in enumerate((0, 5, chunk_size, 3 * chunk_size + 7)):
+        message = bytes(random.randint(0, 255) for _ in range(length))
+        encrypted = io.BytesIO()
+        encrypt_stream("key", io.BytesIO(message), encrypted, workload=1000, chunk_size=chunk_size)
+        encrypted = encrypted.getvalue()
+
+        decrypted = io.BytesIO()
+        decrypt_stream("key", io.BytesIO(encrypted), decrypted)
+
+        undetected = []
+        flipped = bytearray(encrypted)
+        flipped[-40] ^= 1
+        for name, damaged in (("truncated", encrypted[:-1]),
+                              ("trailing data", encrypted + b"x"),
+                              ("bit flip", bytes(flipped))):
+            try:
+                decrypt_stream("key", io.BytesIO(damaged), io.BytesIO())
+                undetected.append(name)
+            except AssertionError:
+                pass
+
+        if decrypted.getvalue() == message and not undetected:
+            print(f"  Test {i+1}: PASSED")
+        else:
+            print(f"  Test {i+1}: FAILED")
+            print(f"  Length: {length}, undetected: {undetected}")
+
+# Test random-access reads from the seekable format
+def test_seekable_reader():
+    print("Testing encrypt_seekable/SeekableReader")
+
+    chunk_size = 64
+    for i, length in enumerate((0, 5, 3 * chunk_size, 10 * chunk_size + 7)):
+        message = bytes(random.randint(0, 255) for _ in range(length))
+        with tempfile.NamedTemporaryFile() as f:
+            encrypt_seekable("key", io.BytesIO(message), f, workload=1000, chunk_size=chunk_size)
+            f.flush()
+
+            failures = []
+            with SeekableReader("key", f.name) as reader:
+                if reader.read() != message:
+                    failures.append("full read")
+                for _ in range(20):
+                    start, size = random.randint(0, length + 5), random.randint(0, 3 * chunk_size)
+                    reader.seek(start)
+                    if reader.read(size) != message[start:start + size]:
+                        failures.append(f"read({size}) at {start}")
+
+            # Flip one ciphertext (or index) byte; reading must fail
+            f.seek(40)
+            byte = f.read(1)
+            f.seek(40)
+            f.write(bytes([byte[0] ^ 1]))
+            f.flush()
+            try:
+                with SeekableReader("key", f.name) as reader:
+                    reader.read()
+                failures.append("bit flip undetected")
+            except AssertionError:
+                pass
+
+        if not failures:
+            print(f"  Test {i+1}: PASSED")
+        else:
+            print(f"  Test {i+1}: FAILED")
+            print(f"  Length: {length}, failed: {failures}")
+
+    # An empty (unmappable) file is rejected without leaking the file the
+    # reader opened itself
+    with tempfile.NamedTemporaryFile() as f, warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always", ResourceWarning)
+        try:
+            SeekableReader("key", f.name)
+            rejected = False
+        except (ValueError, OSError):
+            rejected = True
+        gc.collect()
+    if rejected and not any(issubclass(w.category, ResourceWarning) for w in caught):
+        print("  Test 5: PASSED")
+    else:
+        print("  Test 5: FAILED")
+        print(f"  Rejected: {rejected}, warnings: {[str(w.message) for w in caught]}")
+
+# Test the derived-key cache and the derive-once session API
+def test_key_cache():
+    print("Testing KeyCache and Session")
+
+    cache = KeyCache(max_size=2)
+    salt = bytes(16)
+    expected = get_key_iv(b"password", salt, 1000)
+    results = [get_key_iv(b"password", salt, 1000, cache) for _ in range(3)]
+    if results == [expected] * 3 and (cache.hits, cache.misses) == (2, 1):
+        print("  Test 1: PASSED")
+    else:
+        print("  Test 1: FAILED")
+        print(f"  Hits: {cache.hits}, misses: {cache.misses}")
+
+    # Least recently used entries are evicted, invalidated ones are re-derived
+    for other in (b"a", b"b"):
+        get_key_iv(other, salt, 1000, cache)
+    get_key_iv(b"password", salt, 1000, cache)
+    cache.invalidate(b"password", salt, 1000)
+    get_key_iv(b"password", salt, 1000, cache)
+    if len(cache) == 2 and (cache.hits, cache.misses) == (2, 5):
+        print("  Test 2: PASSED")
+    else:
+        print("  Test 2: FAILED")
+        print(f"  Entries: {len(cache)}, hits: {cache.hits}, misses: {cache.misses}")
+
+    ciphertext = encrypt("password", "message", workload=1000)
+    if decrypt("password", ciphertext, workload=1000, cache=cache) == b"message":
+        print("  Test 3: PASSED")
+    else:
+        print("  Test 3: FAILED")
+
+    session = Session("password", workload=1000, cache=cache)
+    messages = [bytes(random.randint(0, 255) for _ in range(length)) for length in (0, 1, 16, 100)]
+    encrypted = [session.encrypt(message) for message in messages]
+    reopened = Session("password", salt=session.salt, workload=1000)
+    if ([reopened.decrypt(e) for e in encrypted] == messages
+            and len(set(e[48:64] for e in encrypted)) == len(messages)):
+        print("  Test 4: PASSED")
+    else:
+        print("  Test 4: FAILED")
+
+# Test the batch APIs against the per-message session API
+def test_batch_api():
+    print("Testing encrypt_many/decrypt_many and encrypt_blocks")
+
+    messages = [bytes(random.randint(0, 255) for _ in range(length)) for length in range(0, 40, 3)]
+    batch = encrypt_many("password", messages + [None], workload=1000)
+    encrypted = list(batch)
+    session = Session("password", salt=encrypted[0][32:48], workload=1000)
+    if ([session.decrypt(e) for e in encrypted[:-1]] == messages
+            and encrypted[-1] is None and list(batch.errors) == [len(messages)]):
+        print("  Test 1: PASSED")
+    else:
+        print("  Test 1: FAILED")
+
+    # A tampered or missing record fails on its own; the rest of the batch
+    # still decrypts
+    tampered = bytearray(encrypted[2])
+    tampered[-1] ^= 1
+    records = encrypted[:2] + [bytes(tampered)] + encrypted[3:-1] + [None]
+    batch = decrypt_many("password", records, workload=1000)
+    expected = messages[:2] + [None] + messages[3:] + [None]
+    if (list(batch) == expected and list(batch.errors) == [2, len(records) - 1]
+            and len(batch.offsets) == len(records) + 1):
+        print("  Test 2: PASSED")
+    else:
+        print("  Test 2: FAILED")
+        print(f"  Errors: {batch.errors}")
+
+    for i, backend in enumerate(("python", "auto")):
+        aes = AES(bytes(16), backend=backend)
+        blocks = [bytes(random.randint(0, 255) for _ in range(16)) for _ in range(9)]
+        expected = [aes.encrypt_block(block) for block in blocks]
+        if (aes.encrypt_blocks(blocks) == expected
+                and aes.encrypt_blocks(bytearray(b"".join(blocks))) == b"".join(expected)
+                and aes.decrypt_blocks(expected) == blocks):
+            print(f"  Test {i+3}: PASSED")
+        else:
+            print(f"  Test {i+3}: FAILED")
+            print(f"  Backend: {backend}")
+
+def test_multibuffer():
+    print("Testing encrypt_multibuffer against encrypt_cbc/encrypt_pcbc")
+
+    backends = ["python", "auto"] + (["numpy"] if load_numpy() is not None else [])
+    keys = [bytes(random.randint(0, 255) for _ in range(size)) for size in (16, 24, 32, 16)]
+    for i, (backend, mode) in enumerate((b, m) for b in backends for m in ("cbc", "pcbc")):
+        # Mixed key sizes, shared and distinct keys, AES instances and raw
+        # keys, and messages of unequal lengths (including empty ones)
+        jobs = []
+        for n in range(12):
+            key = keys[n % len(keys)]
+            iv = bytes(random.randint(0, 255) for _ in range(16))
+            message = bytes(random.randint(0, 255) for _ in range(random.randint(0, 100)))
+            jobs.append((AES(key, backend=backend) if n % 3 == 0 else key, iv, message))
+        expected = [getattr(AES(key if isinstance(key, bytes) else key._master_key), "encrypt_" + mode)(message, iv)
+                    for key, iv, message in jobs]
+        if encrypt_multibuffer(jobs, mode, backend=backend) == expected:
+            print(f"  Test {i+1}: PASSED")
+        else:
+            print(f"  Test {i+1}: FAILED")
+            print(f"  Backend: {backend}, mode: {mode}")
+
+# Test AES-GCM against the test cases of the original GCM specification
+def test_gcm():
+    print("Testing AES-GCM")
+
+    key = bytes.fromhex("feffe9928665731c6d6a8f9467308308")
+    plaintext = bytes.fromhex("d9313225f88406e5a55909c5aff5269a86a7a9531534f7da2e4c303d8a318a72"
+                              "1c3c0c95956809532fcf0e2449a6b525b16aedf5aa0de657ba637b39")
+    aad = bytes.fromhex("feedfacedeadbeeffeedfacedeadbeefabaddad2")
+    vectors = [
+        # (key, iv, plaintext, aad, ciphertext + tag)
+        (bytes(16), bytes(12), b"", b"", "58e2fccefa7e3061367f1d57a4e7455a"),
+        (bytes(16), bytes(12), bytes(16), b"",
+         "0388dace60b6a392f328c2b971b2fe78ab6e47d42cec13bdf53a67b21257bddf"),
+        (key, bytes.fromhex("cafebabefacedbaddecaf888"), plaintext, aad,
+         "42831ec2217774244b7221b784d0d49ce3aa212f2c02a4e035c17e2329aca12e"
+         "21d514b25466931c7d8f6a5aac84aa051ba30b396a0aac973d58e091"
+         "5bc94fbc3221a5db94fae95ae7121a47"),
+        # 60-byte IV, hashed into the pre-counter block
+        (key, bytes.fromhex("9313225df88406e555909c5aff5269aa6a7a9538534f7da1e4c303d2a318a728"
+                            "c3c0c95156809539fcf0e2429a6b525416aedbf5a0de6a57a637b39b"), plaintext, aad,
+         "8ce24998625615b603a033aca13fb894be9112a5c3a211a8ba262a3cca7e2ca7"
+         "01e4a9a4fba43c90ccdcb281d48c7c6fd62875d2aca417034c34aee5"
+         "619cc5aefffe0bfa462af43c1699d050"),
+    ]
+
+    for i, backend in enumerate(("python", "native")):
+        failures = []
+        for n, (vector_key, iv, message, vector_aad, expected) in enumerate(vectors):
+            aes = AES(vector_key, backend=backend)
+            sealed = aes.encrypt_gcm(message, iv, vector_aad)
+            if sealed.hex() != expected:
+                failures.append(f"encrypt vector {n}")
+            if aes.decrypt_gcm(sealed, iv, vector_aad) != message:
+                failures.append(f"decrypt vector {n}")
+            truncated = aes.encrypt_gcm(message, iv, vector_aad, tag_length=12)
+            if truncated != sealed[:-4] or aes.decrypt_gcm(truncated, iv, vector_aad, 12) != message:
+                failures.append(f"12-byte tag vector {n}")
+            for damaged_aad, damaged in ((vector_aad + b"x", sealed),
+                                         (vector_aad, sealed[:-1] + bytes([sealed[-1] ^ 1]))):
+                try:
+                    aes.decrypt_gcm(damaged, iv, damaged_aad)
+                    failures.append(f"forgery accepted vector {n}")
+                except AssertionError:
+                    pass
+
+        if not failures:
+            print(f"  Test {i+1}: PASSED")
+        else:
+            print(f"  Test {i+1}: FAILED")
+            print(f"  Backend: {backend}, failed: {failures}")
+
+# Test the word-based key schedule and the shared schedule cache
+def test_schedule_cache():
+    print("Testing key schedule cache")
+
+    failures = []
+    for key_size in (16, 24, 32):
+        key = bytes(random.randint(0, 255) for _ in range(key_size))
+        aes = AES(key, backend="python")
+        textbook = [int.from_bytes(bytes(column), "big") for matrix in aes._expand_key(key) for column in matrix]
+        if list(KeySchedule(key).enc_words) != textbook:
+            failures.append(f"expansion ({key_size}-byte key)")
+    if not failures:
+        print("  Test 1: PASSED")
+    else:
+        print("  Test 1: FAILED")
+        print(f"  Mismatched: {failures}")
+
+    cache = ScheduleCache(max_size=2)
+    keys = [bytes([i]) * 16 for i in range(3)]
+    first = cache.get(keys[0])
+    if cache.get(keys[0]) is first and (cache.hits, cache.misses) == (1, 1):
+        print("  Test 2: PASSED")
+    else:
+        print("  Test 2: FAILED")
+
+    # Filling the cache evicts the least recently used schedule and wipes it
+    cache.get(keys[1])
+    cache.get(keys[2])
+    if len(cache) == 2 and not any(first.enc_words) and not any(first.dec_words):
+        print("  Test 3: PASSED")
+    else:
+        print("  Test 3: FAILED")
+
+    # Instances keep their own compact copy, so eviction cannot affect them,
+    # and wipe it when closed or collected
+    message = bytes(16)
+    aes = AES(keys[0], backend="python")
+    expected = aes.encrypt_block(message)
+    schedule_cache.clear()
+    schedule = aes._schedule
+    results = [
+        aes.encrypt_block(message) == expected == AES(keys[0], backend="python").encrypt_block(message),
+        schedule.enc_words.typecode == schedule.dec_words.typecode == "I",
+    ]
+    aes.close()
+    results.append(not any(schedule.enc_words) and not any(schedule.dec_words) and not any(aes._master_key))
+    for backend in ("python", "auto"):
+        try:
+            aes = AES(keys[0], backend=backend)
+            aes.close()
+            aes.encrypt_cbc(message, message)
+            results.append(False)
+        except ValueError:
+            results.append(True)
+    schedule = AES(keys[1], backend="python")._schedule
+    gc.collect()
+    results.append(not any(schedule.enc_words))
+    if all(results):
+        print("  Test 4: PASSED")
+    else:
+        print("  Test 4: FAILED")
+        print(f"  Checks: {results}")
+
+    # Threads thrashing a tiny cache: an instance must never pick up a
+    # schedule wiped by another thread's eviction. Copying is slowed down
+    # to widen the window between lookup and copy.
+    expected = {key: AES(key, backend="python").encrypt_block(message) for key in keys}
+    copy = KeySchedule.copy
+    def slow_copy(schedule):
+        time.sleep(0.0005)
+        return copy(schedule)
+    def worker(offset):
+        for n in range(60):
+            key = keys[(n + offset) % len(keys)]
+            engine = "specialized" if n % 20 == 0 else "ttable"
+            if AES(key, engine=engine, backend="python").encrypt_block(message) != expected[key]:
+                wrong.append(key)
+    wrong = []
+    max_size = schedule_cache.max_size
+    schedule_cache.max_size = 1
+    schedule_cache.clear()
+    KeySchedule.copy = slow_copy
+    try:
+        threads = [threading.Thread(target=worker, args=(offset,)) for offset in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        KeySchedule.copy = copy
+        schedule_cache.max_size = max_size
+    if not wrong:
+        print("  Test 5: PASSED")
+    else:
+        print("  Test 5: FAILED")
+        print(f"  Wrong ciphertexts: {len(wrong)}")
+
+# Test counter widths, keystream generation and the SP 800-38A CTR vector
+def test_counter_keystream():
+    print("Testing counters and keystream generation")
+
+    key = bytes.fromhex("2b7e151628aed2a6abf7158809cf4f3c")
+    counter = bytes.fromhex("f0f1f2f3f4f5f6f7f8f9fafbfcfdfeff")
+    plaintext = bytes.fromhex("6bc1bee22e409f96e93d7e117393172aae2d8a571e03ac9c9eb76fac45af8e51")
+    expected = "874d6191b620e3261bef6864990db6ce9806f66b7970fdff8617187bb9fffdff"
+    results = [AES(key, backend=backend).encrypt_ctr(plaintext, counter).hex() for backend in ("python", "auto")]
+    if results == [expected] * 2:
+        print("  Test 1: PASSED")
+    else:
+        print("  Test 1: FAILED")
+        print(f"  Results: {results}")
+
+    # A 32-bit counter wraps without carrying into the nonce
+    nonce = bytes(random.randint(0, 255) for _ in range(12))
+    start = Counter(nonce + b"\xff\xff\xff\xfe", 32)
+    blocks = split_blocks(start.take(4))
+    strict = Counter(nonce + b"\xff\xff\xff\xfe", 32, wrap=False)
+    try:
+        strict.advance(3)
+        exhausted = False
+    except AssertionError:
+        exhausted = True
+    # Taking exactly up to the wrap point uses the last value; nothing after
+    strict.take(2)
+    try:
+        strict.take(1)
+        reused = True
+    except AssertionError:
+        reused = False
+    if (blocks == [nonce + bytes.fromhex(low) for low in ("fffffffe", "ffffffff", "00000000", "00000001")]
+            and exhausted and not reused):
+        print("  Test 2: PASSED")
+    else:
+        print("  Test 2: FAILED")
+
+    failures = []
+    message = bytes(random.randint(0, 255) for _ in range(100))
+    iv = nonce + b"\xff\xff\xff\xfd"
+    for backend in ("python", "auto"):
+        aes = AES(key, backend=backend)
+        counter_blocks = split_blocks(Counter(iv, 32).take(7))
+        keystream = b"".join(aes.encrypt_block(block) for block in counter_blocks)
+        if aes.encrypt_ctr(message, iv, counter_width=32) != xor_bytes(message, keystream):
+            failures.append(f"ctr width 32 ({backend})")
+        if aes.ctr_keystream(Counter(iv, 32), 100) != keystream[:100]:
+            failures.append(f"ctr_keystream ({backend})")
+
+        stream = aes.encryptor("ofb", iv)
+        stream.precompute(64)
+        pieces = stream.update(message[:10]) + stream.update(message[10:]) + stream.finalize()
+        if pieces != aes.encrypt_ofb(message, iv) or aes.decrypt_ofb(pieces, iv) != message:
+            failures.append(f"ofb precompute ({backend})")
+    if not failures:
+        print("  Test 3: PASSED")
+    else:
+        print("  Test 3: FAILED")
+        print(f"  Failed: {failures}")
+
+# Test encrypt_into/decrypt_into with in-place and mmap'd buffers
+def test_into_buffers():
+    print("Testing encrypt_into/decrypt_into")
+
+    for i, backend in enumerate(("python", "auto")):
+        aes = AES(bytes(random.randint(0, 255) for _ in range(16)), backend=backend)
+        iv = bytes(random.randint(0, 255) for _ in range(16))
+
+        failures = []
+        for length in (0, 5, 16, 33, 200):
+            message = bytes(random.randint(0, 255) for _ in range(length))
+            for mode in AES.stream_modes:
+                expected = getattr(aes, "encrypt_" + mode)(message, iv)
+
+                # In place: the buffer holds the input and receives the output
+                buffer = bytearray(message) + bytearray(16)
+                size = aes.encrypt_into(mode, memoryview(buffer)[:length], iv, buffer)
+                if bytes(buffer[:size]) != expected:
+                    failures.append(f"encrypt {mode} ({length} bytes)")
+                plain_size = aes.decrypt_into(mode, bytes(buffer[:size]), iv, buffer)
+                if bytes(buffer[:plain_size]) != message:
+                    failures.append(f"decrypt {mode} ({length} bytes)")
+
+                with tempfile.TemporaryFile() as f:
+                    f.truncate(len(expected) or 1)
+                    with mmap.mmap(f.fileno(), len(expected) or 1) as output:
+                        aes.encrypt_into(mode, message, iv, output)
+                        if output[:len(expected)] != expected:
+                            failures.append(f"mmap {mode} ({length} bytes)")
+
+        if not failures:
+            print(f"  Test {i+1}: PASSED")
+        else:
+            print(f"  Test {i+1}: FAILED")
+            print(f"  Backend: {backend}, failed: {failures}")
+
+def test_encrypt_then_mac():
+    print("Testing the single-pass encrypt/decrypt against the message format")
+
+    # Lengths around the chunk boundaries of the fused CBC + HMAC passes
+    for i, length in enumerate((0, 31, MAC_CHUNK_SIZE - 1, MAC_CHUNK_SIZE, 2 * MAC_CHUNK_SIZE + 7)):
+        message = bytes(random.randint(0, 255) for _ in range(length))
+        ciphertext = encrypt("password", message, workload=1000)
+        salt = ciphertext[32:48]
+        key, hmac_key, iv = get_key_iv(b"password", salt, 1000)
+        body = AES(key).encrypt_cbc(message, iv)
+        expected = hmac.new(hmac_key, salt + body, "sha256").digest() + salt + body
+
+        tampered = bytearray(ciphertext)
+        tampered[48] ^= 1
+        try:
+            decrypt("password", bytes(tampered), workload=1000)
+            rejected = False
+        except AssertionError:
+            rejected = True
+
+        if ciphertext == expected and decrypt("password", expected, workload=1000) == message and rejected:
+            print(f"  Test {i+1}: PASSED")
+        else:
+            print(f"  Test {i+1}: FAILED")
+            print(f"  Length: {length}, tampering rejected: {rejected}")
+
+def test_metrics():
+    print("Testing metrics collection")
+
+    failures = []
+    message = bytes(random.randint(0, 255) for _ in range(100))
+    for backend in ("python", "auto"):
+        aes = AES(bytes(random.randint(0, 255) for _ in range(16)), backend=backend)
+        with collect_metrics() as metrics:
+            ciphertext = aes.encrypt_cbc(message, bytes(16))
+            aes.decrypt_ctr(message, bytes(16))
+        phases = {(entry["phase"], entry["backend"]): entry for entry in metrics.snapshot()["phases"]}
+        cbc = phases.get(("cbc", aes.backend))
+        if cbc is None or cbc["bytes"] != len(ciphertext) or cbc["blocks"] != len(ciphertext) // 16:
+            failures.append(f"cbc counts ({backend})")
+        if ("padding", aes.backend) not in phases or phases.get(("ctr", aes.backend), {}).get("blocks") != 7:
+            failures.append(f"padding/ctr counts ({backend})")
+
+    with collect_metrics() as metrics:
+        sealed = encrypt("key", message, workload=10)
+        decrypt("key", sealed, workload=10)
+        try:
+            decrypt("key", sealed[:-1] + bytes([sealed[-1] ^ 1]), workload=10)
+            failures.append("tampered message accepted")
+        except AssertionError:
+            pass
+    snapshot = metrics.snapshot()
+    phases = {entry["phase"] for entry in snapshot["phases"]}
+    if not {"kdf", "key_schedule", "cbc", "hmac_verify", "padding"} <= phases:
+        failures.append(f"phases: {sorted(phases)}")
+    if snapshot["events"].get("hmac_failures") != 1:
+        failures.append("hmac failure not counted")
+    if json.loads(metrics.to_json()) != snapshot:
+        failures.append("json export")
+    if 'aes_events_total{event="hmac_failures"} 1' not in metrics.to_prometheus().splitlines():
+        failures.append("prometheus export")
+
+    # Nothing is recorded outside the block.
+    aes.encrypt_cbc(message, bytes(16))
+    if metrics.snapshot() != snapshot:
+        failures.append("recorded after the block")
+
+    if not failures:
+        print("  Test 1: PASSED")
+    else:
+        print("  Test 1: FAILED")
+        print(f"  Failed: {failures}")
+
+async def run_async_pipe(coroutine_function, data):
+    """ Runs `coroutine_function(reader, writer)` over `data` through a socket pair. """
+    left, right = socket.socketpair()
+    _, writer = await asyncio.open_connection(sock=left)
+    reader, other_writer = await asyncio.open_connection(sock=right)
+    source = asyncio.StreamReader()
+    source.feed_data(data)
+    source.feed_eof()
+
+    async def produce():
+        try:
+            await coroutine_function(source, writer)
+        finally:
+            writer.close()
+    _, output = await asyncio.gather(produce(), reader.read())
+    other_writer.close()
+    return output
+
+def test_async_api():
+    print("Testing asyncio API")
+
+    async def run():
+        failures = []
+        message = bytes(random.randint(0, 255) for _ in range(100000))
+
+        # Other tasks keep running while the work is offloaded.
+        ticks = 0
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0)
+        task = asyncio.ensure_future(ticker())
+        ciphertext = await aencrypt("key", message, workload=20000, chunk_size=4096)
+        task.cancel()
+        if ticks < 2:
+            failures.append("event loop blocked")
+
+        if decrypt("key", ciphertext, workload=20000) != message:
+            failures.append("aencrypt")
+        if await adecrypt("key", encrypt("key", message, workload=10), workload=10) != message:
+            failures.append("adecrypt")
+        try:
+            await adecrypt("key", ciphertext[:-1] + bytes([ciphertext[-1] ^ 1]), workload=20000)
+            failures.append("tampered message accepted")
+        except AssertionError:
+            pass
+
+        sealed = await run_async_pipe(lambda r, w: aencrypt_stream("key", r, w, workload=10, chunk_size=4096), message)
+        output = io.BytesIO()
+        decrypt_stream("key", io.BytesIO(sealed), output)
+        if output.getvalue() != message:
+            failures.append("aencrypt_stream")
+        if await run_async_pipe(lambda r, w: adecrypt_stream("key", r, w), sealed) != message:
+            failures.append("adecrypt_stream")
+        return failures
+
+    failures = asyncio.run(run())
+    if not failures:
+        print("  Test 1: PASSED")
+    else:
+        print("  Test 1: FAILED")
+        print(f"  Failed: {failures}")
+
+# Test the T-table and key-specialized round engines against the reference
+# byte-matrix engine
+def test_block_engines():
+    print("Testing AES engines (ttable/specialized vs reference)")
+
+    # FIPS-197 Appendix C known-answer vectors for each key size
+    plaintext = bytes.fromhex("00112233445566778899aabbccddeeff")
+    known_answers = {
+        16: "69c4e0d86a7b0430d8cdb78070b4c55a",
+        24: "dda97ca4864cdfe06eaf70a0ec0d7191",
+        32: "8ea2b7ca516745bfeafc49904b496089",
+    }
+
+    for i, (key_size, expected) in enumerate(known_answers.items()):
+        key = bytes(range(key_size))
+        fast = AES(key, engine="ttable", backend="python")
+        reference = AES(key, engine="reference", backend="python")
+        specialized = AES(key, engine="specialized", backend="python")
+
+        block = bytes(random.randint(0, 255) for _ in range(16))
+        results = [
+            fast.encrypt_block(plaintext).hex() == expected,
+            reference.encrypt_block(plaintext).hex() == expected,
+            fast.decrypt_block(bytes.fromhex(expected)) == plaintext,
+            fast.encrypt_block(block) == reference.encrypt_block(block),
+            fast.decrypt_block(block) == reference.decrypt_block(block),
+            specialized.encrypt_block(plaintext).hex() == expected,
+            specialized.encrypt_block(block) == reference.encrypt_block(block),
+            specialized.decrypt_block(block) == reference.decrypt_block(block),
+            # Generated once per key, then reused through the schedule cache
+            AES(key, engine="specialized", backend="python")._encrypt_block is specialized._encrypt_block,
+        ]
+
+        if all(results):
+            print(f"  Test {i+1}: PASSED")
+        else:
+            print(f"  Test {i+1}: FAILED")
+            print(f"  Key size: {key_size}")
+            print(f"  Checks: {results}")
+
 def main():
     # Basic AES transformations
     test_function("sub_bytes", rijndael.sub_bytes, py_sub_bytes)
@@ -231,10 +1239,34 @@ def main():
 
     # Key expansion
     test_key_expansion()
+    test_key_expansion_sized()
 
     # Full AES block operations
     test_encrypt_block()
     test_decrypt_block()
+    test_context_blocks()
+    test_bulk_modes()
+    test_native_engines()
+    test_backends()
+    test_extension()
+    test_numpy_backend()
+    test_parallel_modes()
+    test_streaming_modes()
+    test_stream_container()
+    test_seekable_reader()
+    test_key_cache()
+    test_batch_api()
+    test_multibuffer()
+    test_gcm()
+    test_schedule_cache()
+    test_counter_keystream()
+    test_into_buffers()
+    test_encrypt_then_mac()
+    test_metrics()
+    test_async_api()
+
+    # Python round engines
+    test_block_engines()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file